@@ -0,0 +1,153 @@
+import os
+import csv
+
+import issuer_groups
+import xbrl_facts
+
+# Allocation breakdowns of a fund's holdings by sector, industry, asset category and country.
+# Filings carry no sector data, so sectors and industries come from a local issuer classification
+# table keyed by LEI or CUSIP issuer prefix (e.g. exported from a GICS or SIC mapping); asset
+# category and country come from the N-PORT itself (assetCat, invCountry).
+CLASSIFICATION_FILE = os.path.join(xbrl_facts.DATA_PATH, "issuer_classification.csv")
+UNCLASSIFIED = "Unclassified"
+ALLOCATION_DIMENSIONS = ('sector', 'industry', 'asset_category', 'country')
+# N-PORT Item C.4 asset categories
+ASSET_CATEGORY_NAMES = {
+    'EC': "Equity-common",
+    'EP': "Equity-preferred",
+    'DBT': "Debt",
+    'ABS-MBS': "ABS-mortgage backed",
+    'ABS-ASBS': "ABS-asset backed",
+    'ABS-CBDO': "ABS-collateralized debt obligation",
+    'ABS-O': "ABS-other",
+    'ACMO': "Agency collateralized mortgage obligation",
+    'COMM': "Commodity",
+    'DCO': "Derivative-commodity",
+    'DCR': "Derivative-credit",
+    'DE': "Derivative-equity",
+    'DFE': "Derivative-foreign exchange",
+    'DIR': "Derivative-interest rate",
+    'DO': "Derivative-other",
+    'LON': "Loan",
+    'RA': "Repurchase agreement",
+    'RE': "Real estate",
+    'SN': "Structured note",
+    'STIV': "Short-term investment vehicle",
+}
+
+class IssuerClassification:
+    """
+    Issuer -> (sector, industry) table. Loaded from a CSV with sector and industry columns and an
+    lei and/or cusip column (a full CUSIP or just its six-character issuer prefix).
+    """
+    def __init__(self, by_lei=None, by_cusip_prefix=None):
+        self.by_lei = by_lei or {}
+        self.by_cusip_prefix = by_cusip_prefix or {}
+
+    @classmethod
+    def load(cls, path=CLASSIFICATION_FILE):
+        classification = cls()
+        if not os.path.exists(path):
+            return classification
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    entry = ((row.get('sector') or '').strip() or None, (row.get('industry') or '').strip() or None)
+                    if not any(entry):
+                        continue
+                    lei = issuer_groups.normalize_lei(row.get('lei'))
+                    if lei:
+                        classification.by_lei[lei] = entry
+                    cusip = (row.get('cusip') or row.get('cusip6') or '').strip().upper()
+                    if len(cusip) >= 6 and not cusip.startswith('000000'):
+                        classification.by_cusip_prefix[cusip[:6]] = entry
+        except (OSError, csv.Error) as e:
+            print(f"Warning: Could not read issuer classification {path}: {e}")
+        print(f"Loaded sector/industry classification for {len(classification.by_lei)} LEIs "
+              f"and {len(classification.by_cusip_prefix)} CUSIP prefixes from {path}")
+        return classification
+
+    def classify(self, holding):
+        """(sector, industry) for a holding, by LEI first, then CUSIP issuer prefix; None if unknown."""
+        lei = issuer_groups.normalize_lei(holding.get('lei'))
+        if lei and lei in self.by_lei:
+            return self.by_lei[lei]
+        cusip_prefix = issuer_groups.cusip_issuer_prefix(holding.get('cusip'))
+        if cusip_prefix:
+            return self.by_cusip_prefix.get(cusip_prefix)
+        return None
+
+_default_classification = None
+
+def get_issuer_classification():
+    """The classification table, loaded once per process and shared by every fund analyzed."""
+    global _default_classification
+    if _default_classification is None:
+        _default_classification = IssuerClassification.load()
+    return _default_classification
+
+def classify_holding(holding, classification=None):
+    """Sets 'sector' and 'industry' on a holding the classification table knows. Returns the holding."""
+    entry = (classification or get_issuer_classification()).classify(holding)
+    if entry:
+        sector, industry = entry
+        if sector:
+            holding['sector'] = sector
+        if industry:
+            holding['industry'] = industry
+    return holding
+
+def classify_holdings(holdings, classification=None):
+    classification = classification or get_issuer_classification()
+    for holding in holdings:
+        classify_holding(holding, classification)
+    return holdings
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+class AllocationTotals:
+    """Accumulates compute_allocations one holding at a time, for holdings streamed from a parser."""
+    def __init__(self):
+        self._totals = {dimension: {} for dimension in ALLOCATION_DIMENSIONS}
+        self._counts = {dimension: {} for dimension in ALLOCATION_DIMENSIONS}
+        self._total_value = 0.0
+
+    def add(self, holding):
+        value = _as_float(holding.get('market_value_usd'))
+        self._total_value += value
+        asset_category = holding.get('asset_category')
+        groups = (holding.get('sector') or UNCLASSIFIED,
+                  holding.get('industry') or UNCLASSIFIED,
+                  ASSET_CATEGORY_NAMES.get(asset_category, asset_category) or UNCLASSIFIED,
+                  holding.get('country') or UNCLASSIFIED)
+        for dimension, group in zip(ALLOCATION_DIMENSIONS, groups):
+            dimension_totals = self._totals[dimension]
+            dimension_totals[group] = dimension_totals.get(group, 0.0) + value
+            self._counts[dimension][group] = self._counts[dimension].get(group, 0) + 1
+
+    def allocations(self):
+        total_value = self._total_value
+        allocations = {}
+        for dimension in ALLOCATION_DIMENSIONS:
+            allocations[dimension] = [
+                {'group': group, 'market_value_usd': value,
+                 'weight_pct': (value / total_value * 100) if total_value > 0 else 0.0,
+                 'holdings_count': self._counts[dimension][group]}
+                for group, value in sorted(self._totals[dimension].items(), key=lambda item: item[1], reverse=True)]
+        return allocations
+
+def compute_allocations(holdings):
+    """
+    Market-value weights of classified holdings by sector, industry, asset category and country,
+    accumulated for all four dimensions in a single pass. Returns
+    {dimension: [{'group', 'market_value_usd', 'weight_pct', 'holdings_count'}, ...]}, largest first.
+    Weights are relative to the summed market value of the holdings.
+    """
+    totals = AllocationTotals()
+    for holding in holdings:
+        totals.add(holding)
+    return totals.allocations()
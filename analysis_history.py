@@ -0,0 +1,183 @@
+import os
+import json
+import gzip
+
+# Completed analyses, kept per fund and filing, so that the next period's filing can be analyzed
+# incrementally: positions whose holding did not change materially since the previous analysis
+# reuse its shares-outstanding answer instead of being looked up again.
+# One file per filing and selection: results/<fund_cik>/<accession>.json.gz for a full analysis, with
+# the grouping and selection options appended otherwise (e.g. <accession>.by-issuer.top-25.json.gz)
+RESULTS_PATH = os.path.join(os.getcwd(), "results")
+# A position is re-queried when the fund's share count moved by more than this percentage
+MATERIAL_CHANGE_PCT = 5.0
+# ...or when its shares-outstanding answer has already been carried forward this many periods
+MAX_CARRY_FORWARD_PERIODS = 4
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def position_key(holding_detail):
+    """A position's identity across periods: its CUSIP (or name, without a usable CUSIP) and the funds it is held through."""
+    cusip = (holding_detail.get('cusip') or '').strip().upper()
+    if len(cusip) == 9 and cusip.isalnum() and not cusip.startswith('000000'):
+        identifier = cusip
+    else:
+        identifier = "NAME:" + (holding_detail.get('name') or '').strip().upper()
+    return f"{identifier}|{holding_detail.get('held_via') or ''}"
+
+def accession_order(accession):
+    """Sort key putting accession numbers (filer-yy-sequence) of one fund in filing order."""
+    try:
+        filer, year, sequence = accession.split('-')
+        year = int(year)
+        return (year + (1900 if year >= 90 else 2000), int(sequence), filer)
+    except (AttributeError, ValueError):
+        return (0, 0, accession or '')
+
+def _selection_suffix(selection, grouping_only=False):
+    selection = selection or {}
+    parts = []
+    if selection.get('group_by_issuer'):
+        parts.append("by-issuer")
+    if selection.get('look_through_depth'):
+        parts.append(f"look-through-{selection['look_through_depth']}")
+    if not grouping_only:
+        if selection.get('top_n') is not None:
+            parts.append(f"top-{selection['top_n']}")
+        if selection.get('min_percentage_of_fund') is not None:
+            parts.append(f"min-{_as_float(selection['min_percentage_of_fund']):g}")
+    return "".join("." + part for part in parts)
+
+def shares_changed_materially(previous_shares, current_shares, threshold_pct=MATERIAL_CHANGE_PCT):
+    if previous_shares <= 0:
+        return current_shares > 0
+    return abs(current_shares - previous_shares) / previous_shares * 100 > threshold_pct
+
+class AnalysisHistory:
+    """Saves completed analysis results and finds the one an incremental run builds on."""
+    def __init__(self, results_path=None):
+        self.results_path = results_path or RESULTS_PATH
+
+    def _result_path(self, fund_cik, accession, selection=None):
+        return os.path.join(self.results_path, str(fund_cik), f"{accession}{_selection_suffix(selection)}.json.gz")
+
+    def save(self, analysis_result):
+        """
+        Writes a completed result, keyed by its 'selection' options so that a top-N or grouped run never
+        replaces the full analysis of the same filing. Results without a fund CIK and accession are skipped.
+        """
+        fund_cik, accession = analysis_result.get('fund_cik'), analysis_result.get('accession')
+        if not fund_cik or not accession:
+            print("Warning: Cannot save analysis result without fund CIK and accession number.")
+            return None
+        path = self._result_path(fund_cik, accession, analysis_result.get('selection'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump(analysis_result, f, separators=(',', ':'), default=str)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not save analysis result to {path}: {e}")
+            return None
+        print(f"Saved analysis of {accession} to {path}")
+        return path
+
+    def previous(self, fund_cik, accession=None, selection=None):
+        """
+        The result to build an incremental run on. Only full analyses grouped the same way as selection
+        (by issuer, look-through depth) are considered: the saved analysis of this very filing if there is
+        one, otherwise that of the latest earlier filing. None if there is no such analysis.
+        """
+        fund_dir = os.path.join(self.results_path, str(fund_cik))
+        if not os.path.isdir(fund_dir):
+            return None
+        full_suffix = _selection_suffix(selection, grouping_only=True) + ".json.gz"
+        saved = {}
+        for name in os.listdir(fund_dir):
+            saved_accession, _, suffix = name.partition('.')
+            if "." + suffix == full_suffix:
+                saved[saved_accession] = os.path.join(fund_dir, name)
+        if accession in saved:
+            path = saved[accession]
+        else:
+            earlier = [a for a in saved if not accession or accession_order(a) < accession_order(accession)]
+            if not earlier:
+                return None
+            path = saved[max(earlier, key=accession_order)]
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read saved analysis {path}: {e}")
+            return None
+
+class IncrementalBaseline:
+    """
+    The previous period's result rows indexed by position key. Each current row is compared against
+    it once (see compare); the change set is built from those comparisons. Positions of the new filing
+    that are not analyzed (outside --top / --min-fund-weight) are passed to record_held, so that they
+    are not reported as removed.
+    """
+    def __init__(self, previous_result, threshold_pct=MATERIAL_CHANGE_PCT, max_carry_forward_periods=MAX_CARRY_FORWARD_PERIODS):
+        self.previous_accession = previous_result.get('accession')
+        self.previous_rows = {position_key(row): row for row in previous_result.get('detailed_holdings') or []}
+        self.threshold_pct = threshold_pct
+        self.max_carry_forward_periods = max_carry_forward_periods
+        self.held_keys = set()
+        self.added = []
+        self.changed = []
+        self.unchanged_count = 0
+        self.carried_forward_count = 0
+
+    def compare(self, holding_detail, shares_held_by_fund_num):
+        """
+        Marks the row 'new', 'changed' or 'unchanged' in 'position_change'. For an unchanged position
+        whose previous lookup succeeded, returns (total_outstanding_shares, source) to carry forward and
+        records where it came from in 'carried_forward_from'; otherwise returns None (look it up again).
+        """
+        key = position_key(holding_detail)
+        self.held_keys.add(key)
+        previous = self.previous_rows.get(key)
+        if previous is None:
+            holding_detail['position_change'] = 'new'
+            self.added.append(_change_entry(holding_detail))
+            return None
+        previous_shares = _as_float(previous.get('shares_held_by_fund_str'))
+        if shares_changed_materially(previous_shares, shares_held_by_fund_num, self.threshold_pct):
+            holding_detail['position_change'] = 'changed'
+            self.changed.append(dict(_change_entry(holding_detail), previous_shares=previous.get('shares_held_by_fund_str')))
+            return None
+        holding_detail['position_change'] = 'unchanged'
+        self.unchanged_count += 1
+
+        total_outstanding_shares = previous.get('total_outstanding_shares')
+        periods = (previous.get('carried_forward_periods') or 0) + 1
+        if (isinstance(total_outstanding_shares, bool) or not isinstance(total_outstanding_shares, (int, float))
+                or total_outstanding_shares <= 0 or periods > self.max_carry_forward_periods):
+            return None # The previous lookup failed or was skipped, or its answer is too old
+        holding_detail['carried_forward_from'] = previous.get('carried_forward_from') or self.previous_accession
+        holding_detail['carried_forward_periods'] = periods
+        self.carried_forward_count += 1
+        return total_outstanding_shares, previous.get('shares_outstanding_source')
+
+    def record_held(self, holding_detail):
+        """Records a position of the new filing, whether or not it is analyzed."""
+        self.held_keys.add(position_key(holding_detail))
+
+    def change_set(self):
+        """
+        Positions new, materially changed and no longer held since the previous analysis. Only positions
+        missing from the new filing count as removed, not those left out of the analysis by selection.
+        """
+        removed = [_change_entry(row) for key, row in self.previous_rows.items() if key not in self.held_keys]
+        return {'previous_accession': self.previous_accession, 'added': self.added, 'changed': self.changed,
+                'removed': removed, 'unchanged_count': self.unchanged_count,
+                'carried_forward_count': self.carried_forward_count}
+
+def _change_entry(holding_detail):
+    return {'name': holding_detail.get('name'), 'cusip': holding_detail.get('cusip'),
+            'shares': holding_detail.get('shares_held_by_fund_str'), 'held_via': holding_detail.get('held_via')}
@@ -0,0 +1,218 @@
+import os
+import gzip
+import sqlite3
+import argparse
+
+import xbrl_facts
+
+# Local copy of EDGAR's quarterly full index (https://www.sec.gov/Archives/edgar/full-index/YYYY/QTRn/
+# master.idx or form.idx, downloaded or mirrored separately). Answers "latest NPORT-P for CIK X" and
+# "every NPORT-P filer in a date range" without network round trips. Rows are stored in a clustered
+# (WITHOUT ROWID) table sorted by CIK, form type and date, so both lookups are range scans.
+INDEX_PATH = os.path.join(xbrl_facts.DATA_PATH, "edgar_full_index.db")
+EDGAR_ARCHIVES_URL = "https://www.sec.gov/Archives/"
+
+def has_index(index_path=None):
+    return os.path.exists(index_path or INDEX_PATH)
+
+def _connect(index_path=None):
+    index_path = index_path or INDEX_PATH
+    directory = os.path.dirname(index_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    conn = sqlite3.connect(index_path)
+    conn.execute("""CREATE TABLE IF NOT EXISTS filings (
+                        cik TEXT NOT NULL,
+                        form_type TEXT NOT NULL,
+                        date_filed TEXT NOT NULL,
+                        accession TEXT NOT NULL,
+                        company_name TEXT,
+                        filename TEXT,
+                        PRIMARY KEY (cik, form_type, date_filed, accession)) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_filings_form_date ON filings (form_type, date_filed)")
+    conn.execute("CREATE TABLE IF NOT EXISTS ingested_files (source TEXT PRIMARY KEY, rows INTEGER)")
+    return conn
+
+def accession_from_filename(filename):
+    """'edgar/data/36405/0001752724-25-126276.txt' -> '0001752724-25-126276'."""
+    base = os.path.basename(filename or '')
+    return base[:-4] if base.endswith('.txt') else base
+
+def filing_url(filename):
+    """Full-submission text URL for an index row's file name."""
+    return EDGAR_ARCHIVES_URL + filename.lstrip('/')
+
+def _make_row(cik, company_name, form_type, date_filed, filename):
+    cik = xbrl_facts.normalize_cik(cik)
+    if not cik or not form_type or not filename:
+        return None
+    return {'cik': cik, 'company_name': company_name.strip(), 'form_type': form_type.strip(),
+            'date_filed': date_filed.strip(), 'filename': filename.strip(),
+            'accession': accession_from_filename(filename.strip())}
+
+def parse_master_idx(lines):
+    """Yields filing rows from a pipe-delimited master.idx: CIK|Company Name|Form Type|Date Filed|Filename."""
+    in_body = False
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not in_body:
+            in_body = line.startswith('-----')
+            continue
+        parts = line.split('|')
+        if len(parts) != 5:
+            continue
+        row = _make_row(parts[0], parts[1], parts[2], parts[3], parts[4])
+        if row:
+            yield row
+
+def parse_form_idx(lines):
+    """
+    Yields filing rows from a fixed-width form.idx. Column positions are taken from its header line,
+    since form types and company names both contain spaces.
+    """
+    columns = None
+    in_body = False
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if columns is None:
+            if line.startswith('Form Type') and 'File Name' in line:
+                columns = [line.index(name) for name in ('Form Type', 'Company Name', 'CIK', 'Date Filed', 'File Name')]
+            continue
+        if not in_body:
+            in_body = line.startswith('-----')
+            continue
+        if not line.strip():
+            continue
+        form_type, company_name, cik, date_filed, filename = [
+            line[start:end].strip() for start, end in zip(columns, columns[1:] + [None])]
+        row = _make_row(cik, company_name, form_type, date_filed, filename)
+        if row:
+            yield row
+
+def _open_index_file(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='latin-1')
+    return open(path, 'r', encoding='latin-1')
+
+def ingest_index_file(path, index_path=None, force=False):
+    """
+    Loads one master.idx or form.idx (optionally .gz) into the index. Files already ingested are
+    skipped unless force is set. Returns the number of rows read.
+    """
+    source = os.path.abspath(path)
+    parse = parse_form_idx if os.path.basename(path).lower().startswith('form') else parse_master_idx
+    conn = _connect(index_path)
+    try:
+        if not force and conn.execute("SELECT 1 FROM ingested_files WHERE source = ?", (source,)).fetchone():
+            print(f"Already ingested {path}; skipping.")
+            return 0
+        with _open_index_file(path) as f:
+            rows = list(parse(f))
+        with conn:
+            conn.executemany("""INSERT OR REPLACE INTO filings (cik, form_type, date_filed, accession, company_name, filename)
+                                VALUES (:cik, :form_type, :date_filed, :accession, :company_name, :filename)""", rows)
+            conn.execute("INSERT OR REPLACE INTO ingested_files (source, rows) VALUES (?, ?)", (source, len(rows)))
+    finally:
+        conn.close()
+    print(f"Ingested {len(rows)} filings from {path}")
+    return len(rows)
+
+def ingest_directory(directory, index_path=None, force=False):
+    """
+    Ingests every master.idx / form.idx under a directory (e.g. a mirror of full-index/YYYY/QTRn/).
+    When a quarter has both, only master.idx is read. Returns the total rows read.
+    """
+    total = 0
+    for current, _, files in sorted(os.walk(directory)):
+        names = {name.lower(): name for name in files}
+        for candidate in ('master.idx', 'master.idx.gz', 'form.idx', 'form.idx.gz'):
+            if candidate in names:
+                total += ingest_index_file(os.path.join(current, names[candidate]), index_path, force)
+                break
+    return total
+
+def _row_dict(row):
+    return {'cik': row[0], 'form_type': row[1], 'date_filed': row[2], 'accession': row[3],
+            'company_name': row[4], 'filename': row[5], 'url': filing_url(row[5])}
+
+def latest_filing(cik, form_types=("NPORT-P",), index_path=None):
+    """
+    Most recent filing for a CIK among form_types (any of them, newest date wins), or None.
+    """
+    cik = xbrl_facts.normalize_cik(cik)
+    if not cik or not has_index(index_path):
+        return None
+    conn = _connect(index_path)
+    try:
+        best = None
+        for form_type in form_types:
+            row = conn.execute("""SELECT cik, form_type, date_filed, accession, company_name, filename FROM filings
+                                  WHERE cik = ? AND form_type = ? ORDER BY date_filed DESC, accession DESC LIMIT 1""",
+                               (cik, form_type)).fetchone()
+            if row and (best is None or (row[2], row[3]) > (best[2], best[3])):
+                best = row
+    finally:
+        conn.close()
+    return _row_dict(best) if best else None
+
+def filers(form_type, start_date=None, end_date=None, index_path=None):
+    """
+    Every CIK that filed form_type between start_date and end_date (inclusive ISO dates), with its
+    latest filing in that range, ordered by CIK.
+    """
+    if not has_index(index_path):
+        return []
+    conn = _connect(index_path)
+    try:
+        rows = conn.execute("""SELECT cik, form_type, MAX(date_filed), accession, company_name, filename FROM filings
+                               WHERE form_type = ? AND date_filed >= ? AND date_filed <= ?
+                               GROUP BY cik ORDER BY cik""",
+                            (form_type, start_date or '0000-00-00', end_date or '9999-99-99')).fetchall()
+    finally:
+        conn.close()
+    return [_row_dict(row) for row in rows]
+
+def filings(form_type, start_date=None, end_date=None, index_path=None):
+    """
+    Every filing of form_type between start_date and end_date (inclusive ISO dates), ordered by CIK
+    and accession. Unlike filers, a trust filing once per series is listed once per filing.
+    """
+    if not has_index(index_path):
+        return []
+    conn = _connect(index_path)
+    try:
+        rows = conn.execute("""SELECT cik, form_type, date_filed, accession, company_name, filename FROM filings
+                               WHERE form_type = ? AND date_filed >= ? AND date_filed <= ?
+                               ORDER BY cik, accession""",
+                            (form_type, start_date or '0000-00-00', end_date or '9999-99-99')).fetchall()
+    finally:
+        conn.close()
+    return [_row_dict(row) for row in rows]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local EDGAR full-index: ingest master.idx/form.idx files and query them.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Ingest index files or directories of them.")
+    ingest_parser.add_argument("paths", nargs="+")
+    ingest_parser.add_argument("--force", action="store_true", help="Re-read files that were already ingested.")
+    latest_parser = subparsers.add_parser("latest", help="Latest filing of a form type for a CIK.")
+    latest_parser.add_argument("cik")
+    latest_parser.add_argument("--form", action="append", default=None, help="Form type (repeatable). Defaults to NPORT-P.")
+    filers_parser = subparsers.add_parser("filers", help="Every filer of a form type in a date range.")
+    filers_parser.add_argument("form")
+    filers_parser.add_argument("--since", default=None, help="First filing date (YYYY-MM-DD).")
+    filers_parser.add_argument("--until", default=None, help="Last filing date (YYYY-MM-DD).")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        for path in args.paths:
+            if os.path.isdir(path):
+                ingest_directory(path, force=args.force)
+            else:
+                ingest_index_file(path, force=args.force)
+    elif args.command == "latest":
+        filing = latest_filing(args.cik, tuple(args.form or ["NPORT-P"]))
+        print(f"{filing['form_type']} {filing['date_filed']} {filing['accession']} {filing['url']}" if filing else "No filing found.")
+    else:
+        for filing in filers(args.form, args.since, args.until):
+            print(f"{filing['cik']}  {filing['date_filed']}  {filing['company_name']}")
@@ -0,0 +1,237 @@
+import os
+import gzip
+import json
+import time
+import atexit
+import shutil
+import argparse
+import threading
+
+# Managed store for downloaded filings. sec-edgar-downloader writes plain-text submissions under
+# sec_filings/sec-edgar-filings/CIK/FILING_TYPE/ACCESSION/; on ingest every document there is
+# gzip-compressed in place (SGML/XML compresses roughly 8-10x), readers open the .gz transparently,
+# and least-recently-used accessions are evicted once the store grows past its size cap. Reads only
+# update access times in memory; the manifest is written on ingest/eviction and once at exit.
+# Pinned accessions (those listed in FILING_STORE_PINNED_ACCESSIONS) are never compressed or evicted.
+STORE_ROOT = os.path.join(os.getcwd(), "sec_filings", "sec-edgar-filings")
+MANIFEST_PATH = os.path.join(os.getcwd(), "sec_filings", "filing_store.json")
+DEFAULT_MAX_STORE_BYTES = 2 * 1024 ** 3
+COMPRESSIBLE_EXTENSIONS = ('.txt', '.xml', '.htm', '.html')
+COMPRESSION_LEVEL = 6
+
+def _max_store_bytes_from_env():
+    try:
+        return int(os.getenv('FILING_STORE_MAX_BYTES', DEFAULT_MAX_STORE_BYTES))
+    except ValueError:
+        return DEFAULT_MAX_STORE_BYTES
+
+def _pinned_accessions_from_env():
+    """The comma-separated accession numbers in FILING_STORE_PINNED_ACCESSIONS."""
+    pinned = os.getenv('FILING_STORE_PINNED_ACCESSIONS', '')
+    return {accession.strip() for accession in pinned.split(',') if accession.strip()}
+
+def resolve_document(path):
+    """Returns the path under which a document is actually stored (itself or its .gz), or None."""
+    if os.path.exists(path):
+        return path
+    if os.path.exists(path + '.gz'):
+        return path + '.gz'
+    return None
+
+def _directory_size(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+def compress_accession(accession_dir):
+    """
+    Gzips every uncompressed document in an accession directory and removes the originals.
+    Returns (bytes_before, bytes_after) for the documents that were compressed.
+    """
+    bytes_before, bytes_after = 0, 0
+    for name in os.listdir(accession_dir):
+        path = os.path.join(accession_dir, name)
+        if not os.path.isfile(path) or not name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            continue
+        compressed_path = path + '.gz'
+        temporary_path = compressed_path + '.tmp'
+        with open(path, 'rb') as source, gzip.open(temporary_path, 'wb', compresslevel=COMPRESSION_LEVEL) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.replace(temporary_path, compressed_path)
+        bytes_before += os.path.getsize(path)
+        bytes_after += os.path.getsize(compressed_path)
+        os.remove(path)
+    return bytes_before, bytes_after
+
+class FilingStore:
+    """
+    Tracks size and last access of every accession directory in a JSON manifest and keeps the
+    store under max_bytes by evicting the least recently used accessions. Call save() to write
+    access times recorded by touch(). Accessions whose accession number is in pinned are left as they are.
+    """
+    def __init__(self, root=STORE_ROOT, manifest_path=MANIFEST_PATH, max_bytes=None, pinned=None):
+        self.root = root
+        self.manifest_path = manifest_path
+        self.max_bytes = max_bytes if max_bytes is not None else _max_store_bytes_from_env()
+        self.pinned = set(pinned) if pinned is not None else _pinned_accessions_from_env()
+        self._lock = threading.Lock()
+        self._accessions = None
+        self._dirty = False
+
+    def _load(self):
+        if self._accessions is None:
+            self._accessions = {}
+            if os.path.exists(self.manifest_path):
+                try:
+                    with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                        self._accessions = json.load(f).get('accessions', {})
+                except (ValueError, OSError) as e:
+                    print(f"Warning: Could not read filing store manifest {self.manifest_path}: {e}. Rebuilding it.")
+        return self._accessions
+
+    def _save(self):
+        directory = os.path.dirname(self.manifest_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temporary_path = self.manifest_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump({'accessions': self._accessions}, f)
+        os.replace(temporary_path, self.manifest_path)
+        self._dirty = False
+
+    def save(self):
+        """Writes the manifest if access times changed since it was last written."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _is_pinned(self, key):
+        return os.path.basename(key) in self.pinned
+
+    def _key(self, accession_dir):
+        return os.path.relpath(os.path.abspath(accession_dir), os.path.abspath(self.root))
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(entry['bytes'] for entry in self._load().values())
+
+    def ingest(self, accession_dir):
+        """Compresses one downloaded accession, records it as just used, then enforces the size cap."""
+        if self._is_pinned(self._key(accession_dir)):
+            return
+        bytes_before, bytes_after = compress_accession(accession_dir)
+        if bytes_before:
+            print(f"Compressed {os.path.basename(accession_dir)}: {bytes_before:,} -> {bytes_after:,} bytes.")
+        with self._lock:
+            self._load()[self._key(accession_dir)] = {'bytes': _directory_size(accession_dir), 'last_access': time.time()}
+            self._evict(protect=self._key(accession_dir))
+            self._save()
+
+    def ingest_directory(self, filing_directory_path):
+        """Ingests every accession directory under a CIK/FILING_TYPE directory."""
+        for name in sorted(os.listdir(filing_directory_path)):
+            accession_dir = os.path.join(filing_directory_path, name)
+            if os.path.isdir(accession_dir):
+                self.ingest(accession_dir)
+
+    def touch(self, accession_dir):
+        """Marks an accession as just read, so it is the last candidate for eviction. Kept in memory until save()."""
+        with self._lock:
+            accessions = self._load()
+            key = self._key(accession_dir)
+            entry = accessions.get(key)
+            if entry is None:
+                entry = accessions[key] = {'bytes': _directory_size(accession_dir)}
+            entry['last_access'] = time.time()
+            self._dirty = True
+
+    def _evict(self, protect=None):
+        accessions = self._accessions
+        for key in [key for key in accessions if not os.path.isdir(os.path.join(self.root, key))]:
+            del accessions[key] # Removed outside the store
+        total = sum(entry['bytes'] for entry in accessions.values())
+        if total <= self.max_bytes:
+            return []
+        evicted = []
+        for key, entry in sorted(accessions.items(), key=lambda item: item[1].get('last_access', 0)):
+            if total <= self.max_bytes:
+                break
+            if key == protect or self._is_pinned(key):
+                continue
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= entry['bytes']
+            evicted.append(key)
+        for key in evicted:
+            del accessions[key]
+        print(f"Filing store over its {self.max_bytes:,} byte cap: evicted {len(evicted)} least recently used accession(s).")
+        return evicted
+
+    def evict(self):
+        """Evicts least recently used accessions until the store fits its cap. Returns the evicted accessions."""
+        with self._lock:
+            self._load()
+            evicted = self._evict()
+            self._save()
+            return evicted
+
+    def compact(self):
+        """
+        Ingests every accession already on disk (e.g. downloaded before the store existed).
+        Pinned accessions are left uncompressed.
+        """
+        if not os.path.isdir(self.root):
+            return
+        for cik in sorted(os.listdir(self.root)):
+            cik_dir = os.path.join(self.root, cik)
+            if not os.path.isdir(cik_dir):
+                continue
+            for filing_type in sorted(os.listdir(cik_dir)):
+                filing_directory_path = os.path.join(cik_dir, filing_type)
+                if os.path.isdir(filing_directory_path):
+                    self.ingest_directory(filing_directory_path)
+
+_default_store = None
+
+def get_filing_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = FilingStore()
+        # Access times recorded while reading are written once, when the process ends
+        atexit.register(_default_store.save)
+    return _default_store
+
+def open_document(path, mode='rt'):
+    """
+    Opens a stored document, decompressing it on the fly if only its .gz exists.
+    Text modes read UTF-8. Reading a document counts as an access for LRU eviction.
+    """
+    stored_path = resolve_document(path) or path
+    accession_dir = os.path.dirname(stored_path)
+    store = get_filing_store()
+    if os.path.abspath(accession_dir).startswith(os.path.abspath(store.root) + os.sep):
+        try:
+            store.touch(accession_dir)
+        except OSError as e:
+            print(f"Warning: Could not record access to {accession_dir}: {e}")
+    encoding = None if 'b' in mode else 'utf-8'
+    if stored_path.endswith('.gz'):
+        return gzip.open(stored_path, mode, encoding=encoding)
+    return open(stored_path, mode, encoding=encoding)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compress downloaded SEC filings and enforce the store's size cap.")
+    parser.add_argument("--max-bytes", type=int, default=None,
+                        help="Size cap for the store (defaults to FILING_STORE_MAX_BYTES or 2 GiB).")
+    parser.add_argument("--compact", action="store_true",
+                        help="Also compress accessions already on disk. Pinned accessions are skipped.")
+    args = parser.parse_args()
+    store = FilingStore(max_bytes=args.max_bytes)
+    if args.compact:
+        store.compact()
+    store.evict()
+    print(f"Filing store holds {store.total_bytes():,} bytes.")
@@ -1,58 +1,357 @@
 import os
 import time
-from alpha_vantage.fundamentaldata import FundamentalData
+import heapq
+import threading
 from dotenv import load_dotenv
 import sec_parser
 import report_generator
+import holdings_index
+import reference_data
+import issuer_groups
+import look_through
+import allocation
+import analysis_history
+import fund_similarity
 
 load_dotenv() # This will load .env if present, setting ALPHA_VANTAGE_API_KEY
 # API_KEY will be dynamically set/updated by main.py or use env default
 API_KEY = os.getenv('ALPHA_VANTAGE_API_KEY', 'demo')
 CALL_DELAY_SECONDS = 15 if API_KEY == 'demo' else 1
 MAX_HOLDINGS_TO_PROCESS_DEMO = 3
+# Where holdings come from: N-PORT for funds, 13F-HR for institutional managers.
+# sec_parser functions are looked up by name at call time: (download, parse, stream).
+HOLDINGS_SOURCES = {
+    'nport': ('download_latest_fund_holding_filing', 'parse_nport_xml_filing', 'iter_nport_holdings'),
+    '13f': ('download_latest_13f_filing', 'parse_13f_filing', 'iter_13f_holdings'),
+}
+# Shared reference-data router (cache -> offline SEC XBRL -> Alpha Vantage), rebuilt when the API key changes
+_reference_data_router = None
+_reference_data_router_key = None
 
-def get_company_shares_outstanding(ticker_symbol):
-    # Use the module-level API_KEY which might be updated by main.py
-    current_api_key = API_KEY
-    if not ticker_symbol:
-        # print("Warning: No ticker symbol provided to get_company_shares_outstanding.")
-        return None
-    if current_api_key == 'demo' and ticker_symbol.upper() != 'IBM':
-        print(f"DEMO KEY: Shares outstanding lookup for {ticker_symbol} will be skipped (only IBM works reliably for overview with demo key).")
-        return None
+def get_reference_data_router():
+    global _reference_data_router, _reference_data_router_key
+    if _reference_data_router is None or _reference_data_router_key != API_KEY:
+        _reference_data_router = reference_data.build_default_router(API_KEY)
+        _reference_data_router_key = API_KEY
+    return _reference_data_router
 
-    fd = FundamentalData(key=current_api_key, output_format='json')
-    try:
-        print(f"Fetching company overview for: {ticker_symbol} (Using key ending: {'...' + current_api_key[-4:] if len(current_api_key) > 4 else current_api_key})...")
-        overview_data, _ = fd.get_company_overview(symbol=ticker_symbol)
-        if overview_data:
-            shares_outstanding_str = overview_data.get('SharesOutstanding')
-            if shares_outstanding_str and shares_outstanding_str not in ["None", "0", None]:
-                try:
-                    shares = int(shares_outstanding_str)
-                    if shares > 0: return shares
-                    else:
-                        print(f"Warning: SharesOutstanding is zero for {ticker_symbol}: {shares_outstanding_str}")
-                        return None
-                except ValueError:
-                    print(f"Error: Could not convert SharesOutstanding '{shares_outstanding_str}' to int for {ticker_symbol}")
-                    return None
+class _FlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the function, callers that
+    arrive while it is in flight wait for it and share its result (or its exception).
+    Nothing is cached once the call completes; later callers start a new call.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _FlightCall()
+                self._in_flight[key] = call
+                self.calls += 1
             else:
-                print(f"Error: 'SharesOutstanding' not found, is None, or zero for {ticker_symbol} in API response.")
-                return None
-        else:
-            print(f"Error: No data received from get_company_overview for {ticker_symbol}")
-            return None
+                self.coalesced += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
+
+    def stats(self, since=None):
+        """Counters since the layer was created, or since an earlier stats() result."""
+        with self._lock:
+            return {'calls': self.calls - (since or {}).get('calls', 0),
+                    'coalesced': self.coalesced - (since or {}).get('coalesced', 0),
+                    'in_flight': len(self._in_flight)}
+
+# Shared by every lookup in the process, so concurrent holdings and funds asking for the same
+# security make one provider call between them
+_lookup_flight = SingleFlight()
+
+def coalesced_lookup(key, fn, *args, **kwargs):
+    """Runs fn through the shared single-flight layer, keyed by key."""
+    return _lookup_flight.do(key, fn, *args, **kwargs)
+
+def lookup_coalescing_stats(since=None):
+    """
+    {'calls': lookups actually made, 'coalesced': lookups that shared another caller's result, 'in_flight': ...}.
+    The layer is process-wide; pass a snapshot taken at the start of a run to get that run's counts.
+    """
+    return _lookup_flight.stats(since)
+
+def reset_reference_data_router():
+    """Drops the shared router, its cache and its provider statistics, and the coalescing metrics."""
+    global _reference_data_router, _reference_data_router_key, _lookup_flight
+    _reference_data_router = None
+    _reference_data_router_key = None
+    _lookup_flight = SingleFlight()
+
+def lookup_company_shares_outstanding(ticker_symbol, cusip=None):
+    """
+    (total shares outstanding, provider name) for a company, from the first reference-data provider
+    that can answer. Concurrent requests for the same security share one lookup.
+    Returns (None, None) if no provider has data or all of them failed.
+    """
+    if not ticker_symbol and not cusip:
+        return None, None
+    key = ('shares_outstanding', (ticker_symbol or '').strip().upper(), (cusip or '').strip().upper())
+    return coalesced_lookup(key, get_reference_data_router().lookup_shares_outstanding, ticker=ticker_symbol, cusip=cusip)
+
+def get_company_shares_outstanding(ticker_symbol, cusip=None):
+    """Total shares outstanding for a company, or None; see lookup_company_shares_outstanding."""
+    return lookup_company_shares_outstanding(ticker_symbol, cusip)[0]
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def _holding_sort_key(holding):
+    # Rank by market value, then by weight in the fund for holdings without a value
+    return (_as_float(holding.get('market_value_usd')), _as_float(holding.get('percentage_of_fund')))
+
+def above_fund_weight(holdings, min_percentage_of_fund):
+    """
+    Yields the holdings whose weight in the fund (pctVal) is at least min_percentage_of_fund.
+    Holdings without a weight are kept, with a warning: rows streamed from a schedule of investments
+    only get one once its closing "Net Assets" line has been read.
+    """
+    unweighted_count = 0
+    for holding in holdings:
+        weight = holding.get('percentage_of_fund')
+        if weight is None:
+            unweighted_count += 1
+            yield holding
+        elif _as_float(weight) >= min_percentage_of_fund:
+            yield holding
+    if unweighted_count:
+        warn_unweighted_holdings(unweighted_count)
+
+def warn_unweighted_holdings(unweighted_count):
+    print(f"Warning: {unweighted_count} holdings have no weight in the fund (e.g. a streamed schedule of investments); "
+          f"the minimum fund weight was not applied to them.")
+
+def select_top_holdings(holdings, top_n=None, min_percentage_of_fund=None):
+    """
+    Selects the holdings worth analyzing before any ownership lookups are made.
+    Holdings below min_percentage_of_fund (pctVal) are dropped (see above_fund_weight), then only
+    the top_n largest by market value are kept using a bounded heap, so the input is never fully sorted.
+    Accepts any iterable (e.g. a parser stream); returns a list ordered largest first with top_n,
+    otherwise in filing order.
+    """
+    if min_percentage_of_fund is not None:
+        holdings = above_fund_weight(holdings, min_percentage_of_fund)
+    if top_n is not None:
+        return heapq.nlargest(top_n, holdings, key=_holding_sort_key)
+    return list(holdings)
+
+def stream_and_select_holdings(stream_holdings, filing_directory_path, top_n=None, min_percentage_of_fund=None,
+                                on_holding=None):
+    """
+    Selects holdings while the parser streams them, so the top_n heap fills as the filing is read.
+    Only the selected holdings are kept: every holding is classified and counted into the allocation
+    breakdown, the holdings index and the similarity index (and passed to on_holding) as it passes, then dropped.
+    Returns (fund_name, total_net_assets, holdings_count, allocations, selected_holdings).
+    """
+    filing_metadata = {}
+    classification = allocation.get_issuer_classification()
+    allocation_totals = allocation.AllocationTotals()
+    recorder = sec_parser.FilingIndexRecorder(filing_metadata)
+
+    def classified_stream():
+        for holding in stream_holdings(filing_directory_path, filing_metadata):
+            allocation.classify_holding(holding, classification)
+            allocation_totals.add(holding)
+            recorder.add(holding)
+            if on_holding:
+                on_holding(holding)
+            yield holding
+
+    try:
+        selected_holdings = select_top_holdings(classified_stream(), top_n, min_percentage_of_fund)
     except Exception as e:
-        print(f"An error occurred while fetching company overview for {ticker_symbol}: {e}")
-        if "Our standard API call frequency is 5 calls per minute and 500 calls per day" in str(e) and current_api_key == 'demo':
-            print(f"Alpha Vantage API call limit likely reached with 'demo' key for {ticker_symbol}.")
-        elif "Invalid API call" in str(e) or "error message" in str(e).lower():
-             print(f"API error for {ticker_symbol} (e.g. unsupported by demo key, invalid symbol).")
+        recorder.close()
+        print(f"An error occurred while streaming holdings from {filing_directory_path}: {e}")
+        return None, None, 0, None, []
+    recorder.finish(filing_metadata.get('fund_name'), filing_metadata.get('total_net_assets'))
+    return (filing_metadata.get('fund_name'), filing_metadata.get('total_net_assets'), recorder.holdings_count,
+            allocation_totals.allocations(), selected_holdings)
+
+class LookupBudget:
+    """
+    Caps the ownership lookups of one analysis run by number of API calls and/or a wall-clock deadline.
+    Safe to share between lookup worker threads.
+    """
+    def __init__(self, max_api_calls=None, deadline_seconds=None):
+        self.max_api_calls = max_api_calls
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds is not None else None
+        self.calls_made = 0
+        self._lock = threading.Lock()
+
+    def is_bounded(self):
+        return self.max_api_calls is not None or self.deadline is not None
+
+    def record_call(self):
+        with self._lock:
+            self.calls_made += 1
+
+    def exhausted_reason(self, next_call_delay=0):
+        """Returns why no further lookup fits the budget, or None if another one can be made."""
+        if self.max_api_calls is not None and self.calls_made >= self.max_api_calls:
+            return "API Call Limit"
+        if self.deadline is not None and time.monotonic() + next_call_delay >= self.deadline:
+            return "Deadline"
         return None
 
+    def reserve_call(self, next_call_delay=0):
+        """
+        Atomically checks the budget and counts one call against it.
+        Returns None if the call may be made, otherwise the reason it may not.
+        """
+        with self._lock:
+            reason = self.exhausted_reason(next_call_delay)
+            if reason is None:
+                self.calls_made += 1
+            return reason
+
+class CallSpacer:
+    """
+    Spaces metered API calls at least interval_seconds apart, across all threads that share it.
+    """
+    def __init__(self, interval_seconds):
+        self.interval_seconds = interval_seconds
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval_seconds
+        if slot > now:
+            time.sleep(slot - now)
+
+def _holding_weight(holding_detail):
+    return _as_float(holding_detail.get('percentage_of_fund'))
+
+def compute_ownership_coverage(detailed_holdings):
+    """
+    Percentage of the analyzed assets (by fund weight) for which company ownership was computed.
+    Falls back to market value when the filing carries no pctVal weights.
+    """
+    weight = _holding_weight
+    if not any(_holding_weight(h) for h in detailed_holdings):
+        weight = lambda h: _as_float(h.get('market_value_in_fund'))
+    total_weight = sum(weight(h) for h in detailed_holdings)
+    if total_weight <= 0:
+        return 0.0
+    covered_weight = sum(weight(h) for h in detailed_holdings
+                         if isinstance(h.get('percentage_of_company_owned_by_fund'), float))
+    return (covered_weight / total_weight) * 100
+
+def refresh_api_settings():
+    """Re-reads the Alpha Vantage key (main.py may override it) and the matching call delay."""
+    global API_KEY, CALL_DELAY_SECONDS
+    API_KEY = os.getenv('ALPHA_VANTAGE_API_KEY', 'demo')
+    CALL_DELAY_SECONDS = 15 if API_KEY == 'demo' else 1
+
+def build_holding_detail(holding):
+    """
+    Builds the result row for one parsed holding.
+    Returns (holding_detail, ticker_to_lookup, shares_held_by_fund_num).
+    """
+    holding_detail = {
+        'name': holding.get('name', 'N/A'),
+        'cusip': holding.get('cusip', 'N/A'),
+        'ticker': holding.get('ticker', 'N/A'),
+        'market_value_in_fund': holding.get('market_value_usd', 0),
+        'percentage_of_fund': holding.get('percentage_of_fund', 0),
+        'shares_held_by_fund_str': holding.get('shares_or_principal_amount', '0'),
+        'total_outstanding_shares': "Not Processed",
+        'percentage_of_company_owned_by_fund': "Not Processed"
+    }
+    for field in ('sector', 'industry', 'asset_category', 'country'):
+        if holding.get(field):
+            holding_detail[field] = holding[field]
+    if holding.get('look_through_path'):
+        # An exposure held through other funds (see look_through.py)
+        holding_detail['held_via'] = " > ".join(holding['look_through_path'])
+    elif holding.get('look_through'):
+        holding_detail['held_via'] = f"Not expanded ({holding['look_through']})"
+    if holding.get('issuer_securities'):
+        # An issuer-level row (see issuer_groups.py) stands for several securities
+        holding_detail['issuer_securities'] = "; ".join(holding['issuer_securities'])
+        holding_detail['issuer_securities_count'] = len(holding['issuer_securities'])
+
+    try:
+        shares_held_by_fund_num = float(holding_detail['shares_held_by_fund_str'])
+    except (ValueError, TypeError):
+        shares_held_by_fund_num = 0
+
+    ticker_to_lookup = holding_detail['ticker']
+    if not ticker_to_lookup and holding_detail['name'] and "INTERNATIONAL BUSINESS MACHINES" in holding_detail['name'].upper() and API_KEY == 'demo':
+        ticker_to_lookup = "IBM"
+        holding_detail['ticker'] = "IBM (Inferred)"
+    return holding_detail, ticker_to_lookup, shares_held_by_fund_num
+
+def lookup_cusip(holding_detail):
+    """The CUSIP of a result row to pass to reference-data lookups, or None for a missing or placeholder CUSIP."""
+    cusip = str(holding_detail.get('cusip') or '').strip().upper()
+    return cusip if cusip and cusip != "N/A" and not cusip.startswith('000000') else None
+
+def apply_shares_outstanding(holding_detail, shares_held_by_fund_num, total_outstanding_shares, source):
+    """Fills in the ownership columns of a result row. Returns False if there was nothing usable to apply."""
+    if not total_outstanding_shares or total_outstanding_shares <= 0:
+        holding_detail['total_outstanding_shares'] = "N/A (AV Fail/No Data)"
+        holding_detail['percentage_of_company_owned_by_fund'] = "N/A (AV Fail/No Data)"
+        return False
+    holding_detail['total_outstanding_shares'] = total_outstanding_shares
+    holding_detail['percentage_of_company_owned_by_fund'] = (shares_held_by_fund_num / total_outstanding_shares) * 100
+    holding_detail['shares_outstanding_source'] = source
+    return True
+
+def mark_holding_unprocessed(holding_detail, label):
+    holding_detail['total_outstanding_shares'] = label
+    holding_detail['percentage_of_company_owned_by_fund'] = label
+
+def print_reference_data_stats(reference_data_stats):
+    for provider_name, provider_stats in reference_data_stats.items():
+        if provider_stats['calls']:
+            print(f"Provider {provider_name}: {provider_stats['calls']} calls, "
+                  f"{provider_stats['success_rate']:.0%} success, p95 {provider_stats['p95_latency_seconds']:.2f}s")
+
+def get_holdings_source(holdings_form):
+    """(download, parse, stream) functions from sec_parser for 'nport' or '13f'."""
+    return tuple(getattr(sec_parser, name) for name in HOLDINGS_SOURCES[holdings_form])
+
 def resolve_fund_ticker_to_cik(fund_ticker_or_name):
     # print(f"Placeholder: Resolving {fund_ticker_or_name} to CIK.")
+    if fund_ticker_or_name.strip().isdigit(): return fund_ticker_or_name.strip().zfill(10) # Already a CIK
     if fund_ticker_or_name.upper() == "VFINX": return "0000036405"
     if fund_ticker_or_name.upper() == "VANGUARD STAR FUNDS": return "0000751158"
     if fund_ticker_or_name.upper() == "VTSAX": return "0000859027"
@@ -60,30 +359,108 @@ def resolve_fund_ticker_to_cik(fund_ticker_or_name):
     print(f"Warning: CIK for {fund_ticker_or_name} not found in placeholder lookup.")
     return None
 
-def analyze_fund_ownership(fund_ticker_or_name):
+def analyze_fund_ownership(fund_ticker_or_name, top_n=None, min_percentage_of_fund=None,
+                           max_api_calls=None, deadline_seconds=None, journal=None, holdings_form='nport',
+                           group_by_issuer=False, look_through_depth=None, history=None, incremental=False):
+    """
+    Runs the full analysis for one fund (holdings_form='nport') or institutional manager ('13f'). If a run_journal.RunJournal is given, the downloaded filing,
+    the parsed holdings and every successful paid lookup are checkpointed to it, and whatever an
+    earlier (interrupted) run already checkpointed there is reused instead of being redone.
+    With group_by_issuer, holdings of the same issuer (by LEI or CUSIP prefix) are aggregated first,
+    so selection, lookups and the report are per issuer. With look_through_depth, positions in other
+    registered funds are first replaced by those funds' holdings, up to that many levels deep.
+    The result's 'allocations' break all holdings down by sector, industry, asset category and country.
+    If an analysis_history.AnalysisHistory is given, the completed result is saved to it; with
+    incremental, the fund's previously saved full result with the same grouping is diffed against by
+    CUSIP, unchanged positions carry its shares-outstanding answers forward, and the result's 'changes'
+    holds the change set. The result's 'selection' records the top_n, weight and grouping options.
+    """
     # Update module-level API_KEY based on current environment,
     # ensuring it reflects any override from main.py
-    global API_KEY
-    API_KEY = os.getenv('ALPHA_VANTAGE_API_KEY', 'demo')
-    global CALL_DELAY_SECONDS
-    CALL_DELAY_SECONDS = 15 if API_KEY == 'demo' else 1
+    refresh_api_settings()
+    # The deadline covers the whole run (download and parse included), not just the lookups
+    budget = LookupBudget(max_api_calls, deadline_seconds)
+    # The router outlives this run; its statistics are reported as of this point
+    reference_data_stats_start = get_reference_data_router().stats_snapshot()
+    download_filing, parse_filing, stream_holdings = get_holdings_source(holdings_form)
+    selecting = top_n is not None or min_percentage_of_fund is not None
+    # Selection can consume the parser stream directly unless the full list is needed first
+    # (look-through or issuer grouping); the journal then checkpoints only the selected holdings
+    select_while_parsing = selecting and not (look_through_depth or group_by_issuer)
+    # Saved with the result; incremental runs only diff against a full analysis grouped the same way
+    selection = {'top_n': top_n, 'min_percentage_of_fund': min_percentage_of_fund,
+                 'group_by_issuer': bool(group_by_issuer), 'look_through_depth': look_through_depth or None}
+    selected_holdings = None
+    allocations = None
 
     print(f"Starting analysis for fund: {fund_ticker_or_name}")
-    fund_cik = resolve_fund_ticker_to_cik(fund_ticker_or_name)
-    if not fund_cik:
-        print(f"Could not determine CIK for {fund_ticker_or_name}. Aborting.")
-        return {"fund_ticker": fund_ticker_or_name, "status": "CIK resolution failed."}
-    print(f"Resolved {fund_ticker_or_name} to CIK: {fund_cik}")
+    download_checkpoint = journal.stage('download') if journal else None
+    if download_checkpoint and os.path.isdir(download_checkpoint.get('filing_directory_path') or ''):
+        fund_cik = download_checkpoint['fund_cik']
+        filing_directory_path = download_checkpoint['filing_directory_path']
+        print(f"Reusing filing downloaded earlier in run {journal.run_id}: {filing_directory_path}")
+    else:
+        fund_cik = resolve_fund_ticker_to_cik(fund_ticker_or_name)
+        if not fund_cik:
+            print(f"Could not determine CIK for {fund_ticker_or_name}. Aborting.")
+            return {"fund_ticker": fund_ticker_or_name, "status": "CIK resolution failed."}
+        print(f"Resolved {fund_ticker_or_name} to CIK: {fund_cik}")
+
+        filing_directory_path = download_filing(fund_cik)
+        if not filing_directory_path:
+            print(f"Failed to download holdings for CIK {fund_cik}.")
+            return {"fund_cik": fund_cik, "fund_ticker": fund_ticker_or_name, "status": "Download failed."}
+        if journal:
+            journal.record_stage('download', fund_cik=fund_cik, filing_directory_path=filing_directory_path)
+        print(f"Download initiated. Filings expected in: {filing_directory_path}")
 
-    filing_directory_path = sec_parser.download_latest_fund_holding_filing(fund_cik)
-    if not filing_directory_path:
-        print(f"Failed to download holdings for CIK {fund_cik}.")
-        return {"fund_cik": fund_cik, "fund_ticker": fund_ticker_or_name, "status": "Download failed."}
+    accession = sec_parser.latest_accession(filing_directory_path)
+    baseline = None
+    if incremental and history:
+        previous_result = history.previous(fund_cik, accession, selection)
+        if previous_result:
+            baseline = analysis_history.IncrementalBaseline(previous_result)
+            print(f"Incremental analysis of {accession} against the saved analysis of {baseline.previous_accession} "
+                  f"({len(baseline.previous_rows)} positions).")
+        else:
+            print(f"No saved full analysis of CIK {fund_cik} with the same grouping to build on; running a full analysis.")
+
+    def record_held(holding):
+        if baseline:
+            baseline.record_held(build_holding_detail(holding)[0])
 
-    print(f"Download initiated. Filings expected in: {filing_directory_path}")
-    parsed_fund_name, parsed_total_assets, parsed_holdings = sec_parser.parse_nport_xml_filing(filing_directory_path)
+    parse_checkpoint = journal.stage('parse') if journal else None
+    if parse_checkpoint:
+        parsed_fund_name = parse_checkpoint.get('fund_name')
+        parsed_total_assets = parse_checkpoint.get('total_net_assets')
+        parsed_holdings = parse_checkpoint.get('holdings') or []
+        parsed_holdings_count = parse_checkpoint.get('holdings_count', len(parsed_holdings))
+        if parse_checkpoint.get('selected_while_parsing'):
+            selected_holdings = parsed_holdings
+            allocations = parse_checkpoint.get('allocations')
+            if baseline:
+                baseline.held_keys.update(parse_checkpoint.get('position_keys') or [])
+        print(f"Reusing {len(parsed_holdings)} holdings parsed earlier in run {journal.run_id}.")
+    elif select_while_parsing:
+        parsed_fund_name, parsed_total_assets, parsed_holdings_count, allocations, selected_holdings = \
+            stream_and_select_holdings(stream_holdings, filing_directory_path, top_n, min_percentage_of_fund,
+                                       on_holding=record_held)
+        parsed_holdings = selected_holdings
+        if journal and parsed_holdings_count:
+            # The positions outside the selection are gone after this; a resumed run needs their keys
+            # so it does not report them as removed (see analysis_history.IncrementalBaseline)
+            journal.record_stage('parse', fund_name=parsed_fund_name, total_net_assets=parsed_total_assets,
+                                 holdings=selected_holdings, holdings_count=parsed_holdings_count,
+                                 allocations=allocations, selected_while_parsing=True,
+                                 position_keys=sorted(baseline.held_keys) if baseline else None)
+    else:
+        parsed_fund_name, parsed_total_assets, parsed_holdings = parse_filing(filing_directory_path)
+        parsed_holdings_count = len(parsed_holdings)
+        if journal and parsed_holdings:
+            journal.record_stage('parse', fund_name=parsed_fund_name, total_net_assets=parsed_total_assets,
+                                 holdings=parsed_holdings)
 
-    if not parsed_holdings:
+    if not parsed_holdings_count:
         status_msg = "Parsing failed or no holdings found."
         if parsed_fund_name or parsed_total_assets:
             status_msg = f"Parsed metadata (Fund: {parsed_fund_name}, Assets: {parsed_total_assets}) but no holdings details."
@@ -91,73 +468,235 @@ def analyze_fund_ownership(fund_ticker_or_name):
         return {"fund_cik": fund_cik, "fund_name": parsed_fund_name, "total_net_assets": parsed_total_assets,
                 "fund_ticker": fund_ticker_or_name, "status": status_msg}
 
-    print(f"\nSuccessfully parsed {len(parsed_holdings)} holdings for {parsed_fund_name if parsed_fund_name else 'fund CIK ' + fund_cik}.")
+    print(f"\nSuccessfully parsed {parsed_holdings_count} holdings for {parsed_fund_name if parsed_fund_name else 'fund CIK ' + fund_cik}.")
     if parsed_fund_name: print(f"Fund Name: {parsed_fund_name}")
     if parsed_total_assets: print(f"Total Net Assets: ${parsed_total_assets:,.2f}")
 
+    holdings_to_process = parsed_holdings
+    look_through_stats = None
+    if look_through_depth:
+        expander = look_through.LookThrough(max_depth=look_through_depth)
+        # Funds are resolved to (cik, series_id), so the root must carry its own series to be caught as a cycle
+        root_series_id = sec_parser.read_filing_metadata(filing_directory_path, accession).get('series_id')
+        holdings_to_process = expander.expand(parsed_holdings, root_key=(fund_cik, root_series_id))
+        look_through_stats = expander.stats
+        print(f"Look-through: expanded {expander.stats['expanded']} of {expander.stats['fund_positions']} fund positions "
+              f"({expander.stats['funds_loaded']} funds parsed) into {len(holdings_to_process)} exposures.")
+    # Allocation covers every holding (and look-through exposure), before grouping and selection;
+    # when selecting while parsing it was accumulated from the stream
+    if selected_holdings is None:
+        allocation.classify_holdings(holdings_to_process)
+        allocations = allocation.compute_allocations(holdings_to_process)
+    issuers_count = None
+    if group_by_issuer:
+        grouped_count = len(holdings_to_process)
+        holdings_to_process = issuer_groups.aggregate_by_issuer(holdings_to_process)
+        issuers_count = len(holdings_to_process)
+        print(f"Grouped {grouped_count} holdings into {issuers_count} issuers.")
+    if selecting:
+        if selected_holdings is None:
+            # Positions left out by the selection are still held, not removed
+            for holding in holdings_to_process:
+                record_held(holding)
+        candidates_count = parsed_holdings_count if selected_holdings is not None else len(holdings_to_process)
+        holdings_to_process = selected_holdings if selected_holdings is not None else \
+            select_top_holdings(holdings_to_process, top_n, min_percentage_of_fund)
+        print(f"Selected {len(holdings_to_process)} of {candidates_count} {'issuers' if group_by_issuer else 'holdings'} for analysis "
+              f"(top_n={top_n}, min_percentage_of_fund={min_percentage_of_fund}).")
+
+    # First pass: build result rows in document order, resolve what the offline index can answer,
+    # and find the holdings that need an API lookup
     processed_holdings_data = []
-    holdings_processed_for_av_count = 0
+    lookup_candidates = []
+    router = get_reference_data_router()
+    holdings_resolved_offline_count = 0
+    holdings_resumed_count = 0
+
+    for holding in holdings_to_process:
+        holding_detail, ticker_to_lookup, shares_held_by_fund_num = build_holding_detail(holding)
+        processed_holdings_data.append(holding_detail)
 
-    for i, holding in enumerate(parsed_holdings):
-        holding_detail = {
-            'name': holding.get('name', 'N/A'),
-            'cusip': holding.get('cusip', 'N/A'),
-            'ticker': holding.get('ticker', 'N/A'),
-            'market_value_in_fund': holding.get('market_value_usd', 0),
-            'percentage_of_fund': holding.get('percentage_of_fund', 0),
-            'shares_held_by_fund_str': holding.get('shares_or_principal_amount', '0'),
-            'total_outstanding_shares': "Not Processed",
-            'percentage_of_company_owned_by_fund': "Not Processed"
-        }
-
-        if API_KEY == 'demo' and holdings_processed_for_av_count >= MAX_HOLDINGS_TO_PROCESS_DEMO:
-            print(f"DEMO KEY: Reached max ({MAX_HOLDINGS_TO_PROCESS_DEMO}) AlphaVantage calls. Skipping further company ownership checks for {holding_detail['name']}.")
-            holding_detail['total_outstanding_shares'] = "Skipped (Demo Limit)"
-            holding_detail['percentage_of_company_owned_by_fund'] = "Skipped (Demo Limit)"
-            processed_holdings_data.append(holding_detail)
+        carried_forward = baseline.compare(holding_detail, shares_held_by_fund_num) if baseline else None
+        if carried_forward and shares_held_by_fund_num > 0:
+            # Unchanged since the previous analysis: its answer is still valid and costs nothing
+            apply_shares_outstanding(holding_detail, shares_held_by_fund_num, *carried_forward)
             continue
 
-        try:
-            shares_held_by_fund_num = float(holding_detail['shares_held_by_fund_str'])
-        except (ValueError, TypeError):
-            shares_held_by_fund_num = 0
-
-        ticker_to_lookup = holding_detail['ticker']
-        if not ticker_to_lookup and holding_detail['name'] and "INTERNATIONAL BUSINESS MACHINES" in holding_detail['name'].upper() and API_KEY == 'demo':
-            ticker_to_lookup = "IBM"
-            holding_detail['ticker'] = "IBM (Inferred)"
-
-        if ticker_to_lookup and shares_held_by_fund_num > 0:
-            # print(f"\nProcessing company ownership for: {holding_detail['name']} (Ticker: {ticker_to_lookup})")
-            time.sleep(CALL_DELAY_SECONDS)
-            total_outstanding_shares = get_company_shares_outstanding(ticker_to_lookup)
-            holdings_processed_for_av_count += 1
-
-            if total_outstanding_shares and total_outstanding_shares > 0:
-                holding_detail['total_outstanding_shares'] = total_outstanding_shares
-                percentage_of_company_owned = (shares_held_by_fund_num / total_outstanding_shares) * 100
-                holding_detail['percentage_of_company_owned_by_fund'] = percentage_of_company_owned
-            else:
-                holding_detail['total_outstanding_shares'] = "N/A (AV Fail/No Data)"
-                holding_detail['percentage_of_company_owned_by_fund'] = "N/A (AV Fail/No Data)"
+        offline_shares, offline_source = None, None
+        if shares_held_by_fund_num > 0:
+            # Free providers only (cache, offline SEC XBRL): no API quota, no call delay, no budget
+            offline_shares, offline_source = router.lookup_shares_outstanding(
+                ticker=ticker_to_lookup, cusip=lookup_cusip(holding_detail), max_cost=0)
+
+        checkpointed_lookup = None
+        if not offline_shares and journal and shares_held_by_fund_num > 0:
+            checkpointed_lookup = journal.lookup_result(holding_detail['cusip'], ticker_to_lookup)
+
+        if offline_shares:
+            apply_shares_outstanding(holding_detail, shares_held_by_fund_num, offline_shares, offline_source)
+            holdings_resolved_offline_count += 1
+        elif checkpointed_lookup:
+            # Already paid for in an earlier attempt of this run
+            apply_shares_outstanding(holding_detail, shares_held_by_fund_num, *checkpointed_lookup)
+            holdings_resumed_count += 1
+        elif ticker_to_lookup and shares_held_by_fund_num > 0:
+            lookup_candidates.append((holding_detail, ticker_to_lookup, shares_held_by_fund_num))
         else:
-             holding_detail['total_outstanding_shares'] = "N/A (No Ticker/Shares)"
-             holding_detail['percentage_of_company_owned_by_fund'] = "N/A (No Ticker/Shares)"
+            mark_holding_unprocessed(holding_detail, "N/A (No Ticker/Shares)")
 
-        processed_holdings_data.append(holding_detail)
+    # Second pass: spend the lookup budget on the holdings with the largest fund weight first
+    if budget.max_api_calls is None and API_KEY == 'demo':
+        budget.max_api_calls = MAX_HOLDINGS_TO_PROCESS_DEMO
+    if budget.is_bounded():
+        lookup_candidates.sort(key=lambda candidate: _holding_weight(candidate[0]), reverse=True)
+
+    holdings_processed_for_av_count = 0
+    budget_exhausted_reason = None
+    for position, (holding_detail, ticker_to_lookup, shares_held_by_fund_num) in enumerate(lookup_candidates):
+        budget_exhausted_reason = budget.exhausted_reason(CALL_DELAY_SECONDS)
+        if budget_exhausted_reason:
+            if API_KEY == 'demo' and budget_exhausted_reason == "API Call Limit":
+                print(f"DEMO KEY: Reached max ({MAX_HOLDINGS_TO_PROCESS_DEMO}) AlphaVantage calls. Skipping further company ownership checks.")
+                skipped_label = "Skipped (Demo Limit)"
+            else:
+                print(f"Lookup budget exhausted ({budget_exhausted_reason}). Skipping {len(lookup_candidates) - position} remaining ownership checks.")
+                skipped_label = f"Skipped ({budget_exhausted_reason})"
+            for skipped_detail, _, _ in lookup_candidates[position:]:
+                mark_holding_unprocessed(skipped_detail, skipped_label)
+            break
+
+        time.sleep(CALL_DELAY_SECONDS)
+        total_outstanding_shares, source = lookup_company_shares_outstanding(ticker_to_lookup, lookup_cusip(holding_detail))
+        budget.record_call()
+        holdings_processed_for_av_count += 1
+
+        resolved = apply_shares_outstanding(holding_detail, shares_held_by_fund_num, total_outstanding_shares, source)
+        # Only answers are checkpointed: a miss may have been a throttled provider and is retried on resume
+        if journal and resolved:
+            journal.record_lookup(holding_detail['cusip'], ticker_to_lookup, total_outstanding_shares, source)
+
+    reference_data_stats = router.stats_summary(since=reference_data_stats_start)
+    print_reference_data_stats(reference_data_stats)
+
+    ownership_coverage_pct = compute_ownership_coverage(processed_holdings_data)
+    print(f"Ownership computed for {ownership_coverage_pct:.0f}% of analyzed assets.")
 
     final_result = {
         "fund_cik": fund_cik,
+        "accession": accession,
         "fund_name": parsed_fund_name,
         "fund_ticker": fund_ticker_or_name,
         "total_net_assets": parsed_total_assets,
-        "holdings_count": len(parsed_holdings),
+        "holdings_count": parsed_holdings_count,
+        "holdings_selected": len(holdings_to_process),
+        "selection": selection,
+        "issuers_count": issuers_count,
+        "look_through": look_through_stats,
+        "allocations": allocations,
         "holdings_processed_for_company_ownership": holdings_processed_for_av_count,
+        "holdings_resolved_offline": holdings_resolved_offline_count,
+        "holdings_resumed_from_checkpoint": holdings_resumed_count,
+        "holdings_carried_forward": baseline.carried_forward_count if baseline else 0,
+        "changes": baseline.change_set() if baseline else None,
+        "reference_data_stats": reference_data_stats,
+        "ownership_coverage_pct": ownership_coverage_pct,
+        "lookup_budget_exhausted": budget_exhausted_reason,
         "detailed_holdings": processed_holdings_data,
         "status": "Analysis complete."
     }
+    if baseline:
+        changes = final_result['changes']
+        print(f"Changes since {baseline.previous_accession}: {len(changes['added'])} new, {len(changes['changed'])} changed, "
+              f"{len(changes['removed'])} removed; {baseline.carried_forward_count} lookups carried forward.")
+    if journal:
+        final_result['run_id'] = journal.run_id
+        journal.record_completed(final_result['status'])
+    if history:
+        history.save(final_result)
     return final_result
 
+SHARE_UNITS = ('NS', 'SH') # N-PORT / 13F balance units that count shares
+
+def find_fund_holders(security_identifier):
+    """
+    Reverse lookup: given a ticker or CUSIP, returns every indexed fund that holds it
+    and the total fraction of the company those funds own together.
+    Only positions held in shares count towards that fraction; positions in other units (principal
+    amounts, contracts, or none recorded) are listed separately under 'other_holdings'.
+    Only filings already parsed (and therefore indexed) are considered.
+    """
+    refresh_api_settings()
+
+    print(f"Looking up funds holding: {security_identifier}")
+    positions = holdings_index.find_holders(security_identifier)
+    if not positions:
+        return {"security": security_identifier, "holders": [], "other_holdings": [], "fund_count": 0,
+                "status": "No indexed funds hold this security."}
+    holders = [p for p in positions if (p.get('units') or '').upper() in SHARE_UNITS]
+    other_holdings = [p for p in positions if (p.get('units') or '').upper() not in SHARE_UNITS]
+
+    total_shares_held = sum(h['balance'] for h in holders)
+    total_value_usd = sum(h['market_value_usd'] for h in holders)
+
+    # Use the ticker recorded in the filings, falling back to the identifier itself if it isn't a CUSIP match
+    ticker_to_lookup = next((p['ticker'] for p in positions if p.get('ticker')), None)
+    if not ticker_to_lookup and not any(p.get('cusip') == security_identifier.strip().upper() for p in positions):
+        ticker_to_lookup = security_identifier.strip().upper()
+
+    cusip_to_lookup = next((p['cusip'] for p in positions if p.get('cusip')), None)
+
+    total_outstanding_shares = None
+    if holders and (ticker_to_lookup or cusip_to_lookup):
+        total_outstanding_shares = get_company_shares_outstanding(ticker_to_lookup, cusip=cusip_to_lookup)
+    if total_outstanding_shares and total_outstanding_shares > 0:
+        percentage_owned = (total_shares_held / total_outstanding_shares) * 100
+        for holder in holders:
+            holder['percentage_of_company_owned_by_fund'] = (holder['balance'] / total_outstanding_shares) * 100
+    elif not holders:
+        total_outstanding_shares = "N/A (No Positions in Shares)"
+        percentage_owned = "N/A (No Positions in Shares)"
+    else:
+        total_outstanding_shares = "N/A (No Ticker/AV Fail)"
+        percentage_owned = "N/A (No Ticker/AV Fail)"
+
+    return {
+        "security": security_identifier,
+        "security_name": positions[0].get('name'),
+        "ticker": ticker_to_lookup,
+        "cusip": cusip_to_lookup,
+        "holders": holders,
+        "other_holdings": other_holdings,
+        "fund_count": len(holders),
+        "total_shares_held": total_shares_held,
+        "total_value_usd": total_value_usd,
+        "total_outstanding_shares": total_outstanding_shares,
+        "percentage_of_company_owned_by_funds": percentage_owned,
+        "status": "Lookup complete."
+    }
+
+SIMILAR_FUNDS_DEFAULT_COUNT = 10
+
+def find_similar_funds(fund_ticker_or_series, top_n=SIMILAR_FUNDS_DEFAULT_COUNT):
+    """
+    Similarity search: the indexed funds whose holdings look most like the given fund's (a ticker,
+    CIK or series ID such as S000002839). Only filings already parsed (and therefore indexed) are considered.
+    """
+    identifier = fund_ticker_or_series.strip().upper()
+    if identifier.startswith('S') and identifier[1:].isdigit():
+        fund = fund_similarity.find_fund_sketch(series_id=identifier)
+    else:
+        fund_cik = resolve_fund_ticker_to_cik(fund_ticker_or_series)
+        fund = fund_similarity.find_fund_sketch(fund_cik=fund_cik) if fund_cik else None
+    if fund is None:
+        return {"fund": fund_ticker_or_series, "similar_funds": [],
+                "status": "Fund is not in the similarity index. Analyze it first so its filing is parsed and indexed."}
+
+    print(f"Looking up funds similar to {fund['fund_name'] or fund_ticker_or_series} ({len(fund['weights'])} CUSIPs)")
+    similar_funds = fund_similarity.find_similar_funds(fund['signature'], fund['weights'], top_n=top_n,
+                                                       exclude_fund_key=fund['fund_key'])
+    return {"fund": fund_ticker_or_series, "fund_name": fund['fund_name'], "similar_funds": similar_funds,
+            "status": "Lookup complete." if similar_funds else "No similar funds in the index."}
+
 # The original __main__ block from fund_analyzer.py is removed or commented out
 # to ensure main.py is the sole entry point for typical application runs.
 # Test/dev runs can still be done by uncommenting or running specific functions directly.
@@ -0,0 +1,236 @@
+import os
+import json
+import zlib
+import random
+import sqlite3
+import hashlib
+from array import array
+from contextlib import closing
+
+# Fund similarity search. Comparing every fund's holdings with every other fund's is quadratic, so
+# each parsed fund is reduced to a MinHash sketch of its CUSIP set (NUM_PERMUTATIONS 32-bit minima)
+# and the sketch is split into LSH_BANDS bands. Funds sharing any band land in the same bucket,
+# so a query only compares against the funds it collides with. Candidates are ranked by the
+# Jaccard similarity their sketches estimate and, optionally, re-ranked exactly by weight overlap
+# (the sum over common CUSIPs of the smaller pctVal). Like the holdings index it lives next to the
+# downloaded filings and is updated every time a filing is parsed; one sketch is kept per fund
+# series, from its latest report date. 13F-HR filings of institutional managers are kept under
+# their own key, marked by form type, and never returned as similar funds.
+INDEX_PATH = os.path.join(os.getcwd(), "sec_filings", "fund_similarity.db")
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32 # 4 rows per band: funds with Jaccard similarity above ~0.4 are very likely to collide
+# Candidates re-ranked exactly per result requested
+RERANK_CANDIDATES_PER_RESULT = 5
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: sketches must stay comparable across runs and processes
+_permutation_rng = random.Random(20250101)
+_PERMUTATIONS = [(_permutation_rng.randrange(1, _MERSENNE_PRIME), _permutation_rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(NUM_PERMUTATIONS)]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sketches (
+    fund_key TEXT PRIMARY KEY,
+    fund_cik TEXT NOT NULL,
+    series_id TEXT NOT NULL DEFAULT '',
+    fund_name TEXT,
+    accession TEXT,
+    report_date TEXT NOT NULL DEFAULT '',
+    holdings_count INTEGER,
+    signature BLOB NOT NULL,
+    weights BLOB,
+    form_type TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    bucket INTEGER NOT NULL,
+    fund_key TEXT NOT NULL,
+    PRIMARY KEY (bucket, fund_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_lsh_buckets_fund ON lsh_buckets(fund_key);
+CREATE INDEX IF NOT EXISTS idx_sketches_cik ON sketches(fund_cik, report_date);
+CREATE INDEX IF NOT EXISTS idx_sketches_series ON sketches(series_id, report_date);
+"""
+
+def _connect(index_path=None):
+    path = index_path or INDEX_PATH
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    # Indexes created before form types were recorded
+    if 'form_type' not in {row[1] for row in conn.execute("PRAGMA table_info(sketches)")}:
+        with conn:
+            conn.execute("ALTER TABLE sketches ADD COLUMN form_type TEXT NOT NULL DEFAULT ''")
+    return conn
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def _normalize_cusip(cusip):
+    cusip = (cusip or '').strip().upper()
+    return cusip if cusip and cusip != "N/A" and not cusip.startswith('000000') else None
+
+def _identifier_hash(identifier):
+    return int.from_bytes(hashlib.blake2b(identifier.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def minhash_signature(identifiers):
+    """MinHash sketch of a set of identifiers: NUM_PERMUTATIONS values, one minimum per hash permutation."""
+    hashes = [_identifier_hash(identifier) for identifier in set(identifiers)]
+    if not hashes:
+        return None
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH for a, b in _PERMUTATIONS]
+
+def estimate_jaccard(signature_a, signature_b):
+    """Fraction of matching sketch positions: an unbiased estimate of the Jaccard similarity of the two sets."""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / len(signature_a)
+
+def lsh_buckets(signature):
+    """One bucket key per band; the band number is part of the key, so bands never collide with each other."""
+    rows_per_band = len(signature) // LSH_BANDS
+    buckets = []
+    for band in range(LSH_BANDS):
+        band_values = array('I', signature[band * rows_per_band:(band + 1) * rows_per_band])
+        digest = hashlib.blake2b(band.to_bytes(2, 'big') + band_values.tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+class HoldingWeights:
+    """Accumulates {cusip: percentage of the fund} one holding at a time; see holding_weights."""
+    def __init__(self):
+        self._weights = {}
+        self._values = {}
+
+    def add(self, holding):
+        cusip = _normalize_cusip(holding.get('cusip'))
+        if not cusip:
+            return
+        self._weights[cusip] = self._weights.get(cusip, 0.0) + _to_float(holding.get('percentage_of_fund'))
+        self._values[cusip] = self._values.get(cusip, 0.0) + _to_float(holding.get('market_value_usd'))
+
+    def weights(self):
+        if self._weights and not any(self._weights.values()):
+            total_value = sum(self._values.values())
+            if total_value > 0:
+                return {cusip: value / total_value * 100 for cusip, value in self._values.items()}
+        return dict(self._weights)
+
+def holding_weights(holdings):
+    """
+    {cusip: percentage of the fund} from parsed holdings, summing repeated CUSIPs. Falls back to market
+    value shares when the filing gives no percentages (e.g. 13F).
+    """
+    accumulator = HoldingWeights()
+    for holding in holdings or []:
+        accumulator.add(holding)
+    return accumulator.weights()
+
+def weighted_overlap(weights_a, weights_b):
+    """Exact portfolio overlap in percent: the sum over common CUSIPs of the smaller weight."""
+    if len(weights_a) > len(weights_b):
+        weights_a, weights_b = weights_b, weights_a
+    return sum(min(weight, weights_b[cusip]) for cusip, weight in weights_a.items() if cusip in weights_b)
+
+def _is_13f(form_type):
+    return (form_type or '').strip().upper().startswith('13F')
+
+def _fund_key(fund_cik, series_id, form_type=None):
+    # A manager's 13F must not replace the N-PORT sketch of a single-series fund with the same CIK
+    if _is_13f(form_type):
+        return f"13F|{fund_cik}"
+    return f"{fund_cik}|{series_id or ''}"
+
+def index_fund(fund_cik, series_id, fund_name, accession, report_date, holdings, index_path=None, weights=None,
+               form_type=None):
+    """
+    Sketches one parsed filing and stores it as its fund's entry, replacing an older one. A filing
+    older than the fund's indexed one, or with no CUSIPs, is skipped. Returns True if the fund was (re)indexed.
+    Pass weights (see HoldingWeights) instead of holdings when the filing was streamed.
+    """
+    if not fund_cik:
+        print("Warning: Cannot add a fund to the similarity index without its CIK.")
+        return False
+    if weights is None:
+        weights = holding_weights(holdings)
+    signature = minhash_signature(weights)
+    if signature is None:
+        return False
+
+    fund_key = _fund_key(fund_cik, series_id, form_type)
+    with closing(_connect(index_path)) as conn:
+        with conn:
+            row = conn.execute("SELECT report_date, accession FROM sketches WHERE fund_key = ?", (fund_key,)).fetchone()
+            if row and (row[1] == accession or (row[0] or '') > (report_date or '')):
+                return False
+            conn.execute("DELETE FROM lsh_buckets WHERE fund_key = ?", (fund_key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO sketches (fund_key, fund_cik, series_id, fund_name, accession, report_date, "
+                "holdings_count, signature, weights, form_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (fund_key, fund_cik, series_id or '', fund_name, accession, report_date or '', len(weights),
+                 array('I', signature).tobytes(), zlib.compress(json.dumps(weights, separators=(',', ':')).encode('utf-8')),
+                 (form_type or '').strip().upper()))
+            conn.executemany("INSERT OR IGNORE INTO lsh_buckets (bucket, fund_key) VALUES (?, ?)",
+                             [(bucket, fund_key) for bucket in lsh_buckets(signature)])
+    return True
+
+def _decode_signature(blob):
+    signature = array('I')
+    signature.frombytes(blob)
+    return list(signature)
+
+def _decode_weights(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8')) if blob else {}
+
+def find_fund_sketch(fund_cik=None, series_id=None, index_path=None):
+    """The indexed entry of a fund series, or of a CIK's most recently reported series. None if not indexed."""
+    with closing(_connect(index_path)) as conn:
+        if series_id:
+            row = conn.execute("SELECT fund_key, fund_name, signature, weights FROM sketches WHERE series_id = ? "
+                               "AND form_type NOT LIKE '13F%' ORDER BY report_date DESC LIMIT 1", (series_id,)).fetchone()
+        else:
+            row = conn.execute("SELECT fund_key, fund_name, signature, weights FROM sketches WHERE fund_cik = ? "
+                               "AND form_type NOT LIKE '13F%' ORDER BY report_date DESC LIMIT 1", (fund_cik,)).fetchone()
+    if row is None:
+        return None
+    fund_key, fund_name, signature, weights = row
+    return {'fund_key': fund_key, 'fund_name': fund_name, 'signature': _decode_signature(signature),
+            'weights': _decode_weights(weights)}
+
+def find_similar_funds(signature, weights=None, top_n=10, exclude_fund_key=None, rerank=True, index_path=None):
+    """
+    Funds whose sketches collide with the given one in at least one LSH band, most similar first.
+    13F-HR manager entries are never returned.
+    Results carry 'estimated_jaccard' and, with rerank and weights given, 'weight_overlap_pct' from the
+    stored pctVal weights of the best RERANK_CANDIDATES_PER_RESULT * top_n candidates, which then
+    decides the order.
+    """
+    buckets = lsh_buckets(signature)
+    placeholders = ",".join("?" * len(buckets))
+    with closing(_connect(index_path)) as conn:
+        rows = conn.execute(
+            f"SELECT fund_key, fund_cik, series_id, fund_name, accession, report_date, holdings_count, signature, weights "
+            f"FROM sketches WHERE form_type NOT LIKE '13F%' "
+            f"AND fund_key IN (SELECT DISTINCT fund_key FROM lsh_buckets WHERE bucket IN ({placeholders}))",
+            buckets).fetchall()
+
+    candidates = []
+    for fund_key, fund_cik, series_id, fund_name, accession, report_date, holdings_count, candidate_signature, candidate_weights in rows:
+        if fund_key == exclude_fund_key:
+            continue
+        candidates.append(({'fund_cik': fund_cik, 'series_id': series_id or None, 'fund_name': fund_name,
+                            'accession': accession, 'report_date': report_date or None, 'holdings_count': holdings_count,
+                            'estimated_jaccard': estimate_jaccard(signature, _decode_signature(candidate_signature))},
+                           candidate_weights))
+    candidates.sort(key=lambda candidate: candidate[0]['estimated_jaccard'], reverse=True)
+
+    if not (rerank and weights):
+        return [similar for similar, _ in candidates[:top_n]]
+    reranked = []
+    for similar, candidate_weights in candidates[:top_n * RERANK_CANDIDATES_PER_RESULT]:
+        similar['weight_overlap_pct'] = weighted_overlap(weights, _decode_weights(candidate_weights))
+        reranked.append(similar)
+    reranked.sort(key=lambda similar: similar['weight_overlap_pct'], reverse=True)
+    return reranked[:top_n]
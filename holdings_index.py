@@ -0,0 +1,195 @@
+import os
+import sqlite3
+from contextlib import closing
+
+# Persistent inverted index: security (CUSIP / ticker) -> funds holding it.
+# It lives next to the downloaded filings and is updated by sec_parser every
+# time a new N-PORT filing is parsed, so reverse lookups never re-scan filings.
+# 13F-HR filings of institutional managers are indexed too, marked by their form type;
+# fund-holder lookups leave them out, since a manager's positions include those of the funds it advises.
+INDEX_PATH = os.path.join(os.getcwd(), "sec_filings", "holdings_index.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS filings (
+    accession TEXT PRIMARY KEY,
+    fund_cik TEXT NOT NULL,
+    series_id TEXT NOT NULL DEFAULT '',
+    fund_name TEXT,
+    report_date TEXT NOT NULL DEFAULT '',
+    total_net_assets REAL,
+    form_type TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS positions (
+    accession TEXT NOT NULL REFERENCES filings(accession),
+    cusip TEXT,
+    ticker TEXT,
+    name TEXT,
+    balance REAL,
+    val_usd REAL,
+    units TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_positions_cusip ON positions(cusip);
+CREATE INDEX IF NOT EXISTS idx_positions_ticker ON positions(ticker);
+CREATE INDEX IF NOT EXISTS idx_filings_series ON filings(fund_cik, series_id, report_date);
+"""
+
+def _connect(index_path=None):
+    path = index_path or INDEX_PATH
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    # Indexes created before form types were recorded
+    if 'form_type' not in {row[1] for row in conn.execute("PRAGMA table_info(filings)")}:
+        with conn:
+            conn.execute("ALTER TABLE filings ADD COLUMN form_type TEXT NOT NULL DEFAULT ''")
+    # ... and before balance units; their positions have none (NULL)
+    if 'units' not in {row[1] for row in conn.execute("PRAGMA table_info(positions)")}:
+        with conn:
+            conn.execute("ALTER TABLE positions ADD COLUMN units TEXT")
+    return conn
+
+def _normalize_identifier(value):
+    if not value:
+        return None
+    value = str(value).strip().upper()
+    return value if value and value != "N/A" else None
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+def is_indexed(accession, index_path=None):
+    with closing(_connect(index_path)) as conn:
+        row = conn.execute("SELECT 1 FROM filings WHERE accession = ?", (accession,)).fetchone()
+    return row is not None
+
+# Positions buffered per INSERT while a filing is streamed into the index
+POSITION_BATCH_SIZE = 500
+
+def _position_row(accession, holding):
+    cusip = _normalize_identifier(holding.get('cusip'))
+    ticker = _normalize_identifier(holding.get('ticker'))
+    if not cusip and not ticker:
+        return None
+    units = (holding.get('units') or '').strip().upper() or None
+    return (accession, cusip, ticker, holding.get('name'),
+            _to_float(holding.get('shares_or_principal_amount')), _to_float(holding.get('market_value_usd')), units)
+
+class FilingIndexWriter:
+    """
+    Adds one filing to the index while its holdings are still being parsed, so the whole filing never
+    has to be held in memory. Positions are written in batches inside one transaction; finish() adds
+    the filing row once the fund-level fields are known and commits. An accession that is already
+    indexed is skipped.
+    """
+    def __init__(self, accession, index_path=None):
+        self.accession = accession
+        self.positions_written = 0
+        self._rows = []
+        self._conn = _connect(index_path)
+        self.skipped = self._conn.execute("SELECT 1 FROM filings WHERE accession = ?", (accession,)).fetchone() is not None
+
+    def add(self, holding):
+        if self.skipped or self._conn is None:
+            return
+        row = _position_row(self.accession, holding)
+        if row is None:
+            return
+        self._rows.append(row)
+        if len(self._rows) >= POSITION_BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        self._conn.executemany(
+            "INSERT INTO positions (accession, cusip, ticker, name, balance, val_usd, units) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            self._rows)
+        self.positions_written += len(self._rows)
+        self._rows = []
+
+    def finish(self, fund_cik, series_id, fund_name, report_date, total_net_assets, form_type=None):
+        """Commits the filing. Returns the number of positions written (0 if it was already indexed)."""
+        if self._conn is None:
+            return 0
+        try:
+            if self.skipped:
+                return 0
+            self._flush()
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO filings (accession, fund_cik, series_id, fund_name, report_date, total_net_assets, form_type) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.accession, fund_cik, series_id or '', fund_name, report_date or '', total_net_assets,
+                 (form_type or '').strip().upper()))
+            if cursor.rowcount == 0:
+                self._conn.rollback()
+                return 0
+            self._conn.commit()
+            return self.positions_written
+        finally:
+            self.close()
+
+    def close(self):
+        """Discards anything not yet committed by finish()."""
+        if self._conn is not None:
+            self._conn.rollback()
+            self._conn.close()
+            self._conn = None
+
+def index_filing(accession, fund_cik, series_id, fund_name, report_date, total_net_assets, holdings, index_path=None,
+                 form_type=None):
+    """
+    Adds one parsed filing to the inverted index, recording its form type (e.g. NPORT-P, 13F-HR).
+    Filings are immutable, so an accession that is already indexed is skipped.
+    Returns the number of positions written (0 if the filing was already present).
+    """
+    if not accession or not fund_cik:
+        print("Warning: Cannot index filing without accession number and fund CIK.")
+        return 0
+
+    writer = FilingIndexWriter(accession, index_path)
+    try:
+        for holding in holdings or []:
+            writer.add(holding)
+    except BaseException:
+        writer.close()
+        raise
+    return writer.finish(fund_cik, series_id, fund_name, report_date, total_net_assets, form_type)
+
+def find_holders(identifier, index_path=None):
+    """
+    Returns every fund whose most recent indexed filing holds the given CUSIP or ticker.
+    13F-HR filings are left out: managers are not funds, and their holdings overlap those of their funds.
+    When a series has several filings for its latest report date (an original and its amendment),
+    only the one with the highest accession number is used. Multiple rows of the same security within one filing
+    are summed per balance unit ('units': NS/SH shares, PA principal, NC contracts, ...; None if not recorded),
+    so a fund holding it in two units gets two results. Results are sorted by balance held, largest first.
+    """
+    key = _normalize_identifier(identifier)
+    if not key:
+        return []
+
+    query = """
+        SELECT f.fund_cik, f.series_id, f.fund_name, f.accession, f.report_date,
+               MAX(p.name), MAX(p.cusip), MAX(p.ticker), SUM(p.balance), SUM(p.val_usd), p.units
+        FROM positions p JOIN filings f ON f.accession = p.accession
+        WHERE (p.cusip = ? OR p.ticker = ?)
+          AND f.form_type NOT LIKE '13F%'
+          AND f.accession = (SELECT f2.accession FROM filings f2
+                             WHERE f2.fund_cik = f.fund_cik AND f2.series_id = f.series_id
+                               AND f2.form_type NOT LIKE '13F%'
+                             ORDER BY f2.report_date DESC, f2.accession DESC LIMIT 1)
+        GROUP BY f.accession, p.units
+        ORDER BY SUM(p.balance) DESC
+    """
+    with closing(_connect(index_path)) as conn:
+        rows = conn.execute(query, (key, key)).fetchall()
+
+    return [{
+        'fund_cik': fund_cik, 'series_id': series_id, 'fund_name': fund_name,
+        'accession': accession, 'report_date': report_date,
+        'name': name, 'cusip': cusip, 'ticker': ticker,
+        'balance': balance or 0.0, 'market_value_usd': val_usd or 0.0, 'units': units,
+    } for (fund_cik, series_id, fund_name, accession, report_date, name, cusip, ticker, balance, val_usd, units) in rows]
@@ -0,0 +1,98 @@
+import re
+
+# Issuer-level aggregation. A fund often holds several securities of one issuer (share classes such
+# as GOOGL and GOOG, or a stock next to the same company's bonds). Holdings are grouped in one pass
+# over two hash indexes: the issuer's LEI and, for holdings without one, the six-character CUSIP
+# issuer prefix. Each group becomes a single holding record, so ownership is computed (and paid
+# for) once per issuer.
+_LEI_PATTERN = re.compile(r'[0-9A-Z]{18}[0-9]{2}')
+# Quantity units that count shares: N-PORT 'NS' (number of shares), 13F 'SH'
+SHARE_UNITS = ('NS', 'SH')
+
+def normalize_lei(lei):
+    """Returns a well-formed 20-character LEI in upper case, or None ('N/A' and blanks are common in N-PORT)."""
+    lei = (lei or '').strip().upper()
+    return lei if _LEI_PATTERN.fullmatch(lei) else None
+
+def cusip_issuer_prefix(cusip):
+    """The issuer part of a CUSIP (its first six characters), or None for missing or placeholder CUSIPs."""
+    cusip = (cusip or '').strip().upper()
+    if len(cusip) != 9 or not cusip.isalnum() or cusip.startswith('000000'):
+        return None
+    return cusip[:6]
+
+def group_holdings_by_issuer(holdings):
+    """
+    Groups holdings by issuer, in order of each issuer's first holding. Holdings join a group by LEI,
+    or by CUSIP prefix unless both sides report different LEIs (fund families reuse one CUSIP prefix
+    across separate funds). Returns [{'issuer_key', 'lei', 'cusip_prefix', 'holdings'}, ...].
+    """
+    groups = []
+    by_lei = {}
+    by_cusip_prefix = {}
+    for position, holding in enumerate(holdings):
+        lei = normalize_lei(holding.get('lei'))
+        cusip_prefix = cusip_issuer_prefix(holding.get('cusip'))
+        group = by_lei.get(lei) if lei else None
+        if group is None and cusip_prefix:
+            candidate = by_cusip_prefix.get(cusip_prefix)
+            if candidate is not None and not (lei and candidate['lei']):
+                group = candidate
+        if group is None:
+            group = {'issuer_key': f"LEI:{lei}" if lei else f"CUSIP6:{cusip_prefix}" if cusip_prefix else f"HOLDING:{position}",
+                     'lei': lei, 'cusip_prefix': cusip_prefix, 'holdings': []}
+            groups.append(group)
+        if lei:
+            group['lei'] = group['lei'] or lei
+            by_lei.setdefault(lei, group)
+        if cusip_prefix:
+            group['cusip_prefix'] = group['cusip_prefix'] or cusip_prefix
+            by_cusip_prefix.setdefault(cusip_prefix, group)
+        group['holdings'].append(holding)
+    return groups
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def _security_label(holding):
+    return holding.get('ticker') or holding.get('cusip') or holding.get('name') or 'N/A'
+
+def aggregate_issuer(group):
+    """
+    Folds one issuer group into a holding record shaped like the parsed holdings. Values and fund
+    weights are summed; the share count sums the share-denominated securities (principal amounts of
+    bonds are not shares) unless the issuer has none. Name, CUSIP and ticker come from the largest
+    of those securities, preferring one with a ticker so the issuer can be looked up.
+    """
+    holdings = group['holdings']
+    if len(holdings) == 1:
+        return dict(holdings[0], issuer_key=group['issuer_key'])
+
+    share_holdings = [h for h in holdings if (h.get('units') or 'NS').upper() in SHARE_UNITS]
+    counted = share_holdings or holdings
+    by_value = sorted(counted, key=lambda h: _as_float(h.get('market_value_usd')), reverse=True)
+    representative = next((h for h in by_value if h.get('ticker')), by_value[0])
+
+    shares = sum(_as_float(h.get('shares_or_principal_amount')) for h in counted)
+    issuer_holding = {
+        'name': representative.get('name'),
+        'cusip': representative.get('cusip'),
+        'market_value_usd': sum(_as_float(h.get('market_value_usd')) for h in holdings),
+        'percentage_of_fund': sum(_as_float(h.get('percentage_of_fund')) for h in holdings),
+        'shares_or_principal_amount': str(int(shares)) if shares.is_integer() else str(shares),
+        'issuer_key': group['issuer_key'],
+        'issuer_securities': [_security_label(h) for h in holdings],
+    }
+    for field in ('ticker', 'sector', 'industry', 'asset_category', 'country'):
+        if representative.get(field):
+            issuer_holding[field] = representative[field]
+    if group['lei']:
+        issuer_holding['lei'] = group['lei']
+    return issuer_holding
+
+def aggregate_by_issuer(holdings):
+    """One aggregated holding record per issuer, in order of each issuer's first holding."""
+    return [aggregate_issuer(group) for group in group_holdings_by_issuer(holdings)]
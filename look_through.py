@@ -0,0 +1,153 @@
+import os
+import json
+
+import sec_parser
+import xbrl_facts
+
+# Fund-of-funds look-through. Funds such as Vanguard STAR hold other registered funds (N-PORT
+# issuerCat "RF") instead of companies. Each such position is resolved to the held fund's CIK and
+# series, that fund's latest N-PORT is parsed, and the position is replaced by its share of the
+# underlying holdings, recursively. Parsed funds are memoized for the run, so a fund held by
+# several others is downloaded and parsed once.
+MAX_LOOK_THROUGH_DEPTH = 3
+REGISTERED_FUND_ISSUER_CATEGORY = 'RF'
+# SEC's mutual fund ticker file (https://www.sec.gov/files/company_tickers_mf.json): ticker -> CIK, series
+FUND_TICKERS_FILE = os.path.join(xbrl_facts.DATA_PATH, "company_tickers_mf.json")
+# Hand-maintained identifiers for funds without a ticker: {"LEI, CUSIP or ticker": {"cik": ..., "series_id": ...}}
+FUND_SERIES_MAP_FILE = os.path.join(xbrl_facts.DATA_PATH, "fund_series_map.json")
+
+def is_fund_holding(holding):
+    return (holding.get('issuer_category') or '').strip().upper() == REGISTERED_FUND_ISSUER_CATEGORY
+
+class FundResolver:
+    """Maps a fund position to the (cik, series_id) that files its N-PORT, by LEI, CUSIP or ticker."""
+    def __init__(self, tickers_path=FUND_TICKERS_FILE, series_map_path=FUND_SERIES_MAP_FILE):
+        self.by_identifier = {}
+        if tickers_path and os.path.exists(tickers_path):
+            try:
+                with open(tickers_path, 'r', encoding='utf-8') as f:
+                    fund_tickers = json.load(f)
+                fields = fund_tickers['fields']
+                for row in fund_tickers['data']:
+                    entry = dict(zip(fields, row))
+                    if entry.get('symbol') and entry.get('cik'):
+                        self.add(entry['symbol'], entry['cik'], entry.get('seriesId'))
+            except (ValueError, KeyError, TypeError, OSError) as e:
+                print(f"Warning: Could not read fund tickers from {tickers_path}: {e}")
+        if series_map_path and os.path.exists(series_map_path):
+            try:
+                with open(series_map_path, 'r', encoding='utf-8') as f:
+                    for identifier, entry in json.load(f).items():
+                        self.add(identifier, entry['cik'], entry.get('series_id'))
+            except (ValueError, KeyError, TypeError, AttributeError, OSError) as e:
+                print(f"Warning: Could not read fund series map {series_map_path}: {e}")
+
+    def add(self, identifier, cik, series_id=None):
+        cik = xbrl_facts.normalize_cik(cik)
+        if identifier and cik:
+            self.by_identifier[str(identifier).strip().upper()] = (cik, series_id or None)
+
+    def resolve(self, holding):
+        for field in ('lei', 'cusip', 'ticker'):
+            identifier = (holding.get(field) or '').strip().upper()
+            if identifier and identifier in self.by_identifier:
+                return self.by_identifier[identifier]
+        return None
+
+def load_fund_holdings(cik, series_id=None):
+    """Downloads and parses a fund's latest N-PORT. Returns (fund_name, total_net_assets, holdings) or None."""
+    if series_id:
+        filing_directory_path, accession = sec_parser.download_latest_series_filing(cik, series_id)
+    else:
+        filing_directory_path, accession = sec_parser.download_latest_fund_holding_filing(cik), None
+    if not filing_directory_path:
+        return None
+    fund_name, total_net_assets, holdings = sec_parser.parse_nport_xml_filing(filing_directory_path, accession)
+    return (fund_name, total_net_assets, holdings) if holdings else None
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def _scaled_quantity(quantity, fraction):
+    scaled = round(_as_float(quantity) * fraction, 6)
+    return str(int(scaled)) if scaled.is_integer() else str(scaled)
+
+class LookThrough:
+    """
+    Expands fund positions into underlying exposures for one run. Fund positions that cannot be
+    expanded (unresolved, no filing, a cycle back to a fund already on the path, or deeper than
+    max_depth) are kept as they are, with the reason in 'look_through'.
+    """
+    def __init__(self, resolver=None, max_depth=MAX_LOOK_THROUGH_DEPTH, load_fund=load_fund_holdings):
+        self.resolver = resolver if resolver is not None else FundResolver()
+        self.max_depth = max_depth
+        self.load_fund = load_fund
+        self._funds = {}
+        self.stats = {'fund_positions': 0, 'expanded': 0, 'funds_loaded': 0,
+                      'unresolved': 0, 'not_loaded': 0, 'cycle': 0, 'depth_limit': 0}
+
+    def _fund(self, fund_key):
+        if fund_key not in self._funds: # Memoized, misses included
+            self._funds[fund_key] = self.load_fund(*fund_key)
+            self.stats['funds_loaded'] += 1
+        return self._funds[fund_key]
+
+    def expand(self, holdings, root_key=None):
+        """
+        Returns the holdings with every fund position replaced by the positions of that fund, scaled
+        by the fraction of it held. Underlying rows carry 'look_through_path' (the fund names they
+        are held through) and a percentage_of_fund relative to the top-level fund. root_key is the
+        (cik, series_id) of that fund; a position resolving back to it is not expanded.
+        """
+        exposures = []
+        path_keys = ()
+        if root_key:
+            # A position resolved without a series may still be the root's own trust
+            path_keys = (root_key,) if root_key[1] is None else (root_key, (root_key[0], None))
+        self._expand(holdings, 1.0, 100.0, path_keys, [], exposures)
+        return exposures
+
+    def _opaque(self, holding, reason, exposures):
+        self.stats[reason] += 1
+        exposures.append(dict(holding, look_through=reason))
+
+    def _expand(self, holdings, fraction, fund_weight_pct, path_keys, path_names, exposures):
+        for holding in holdings:
+            exposure = holding
+            if fraction != 1.0 or path_names:
+                exposure = dict(holding, look_through_path=path_names,
+                                market_value_usd=_as_float(holding.get('market_value_usd')) * fraction,
+                                percentage_of_fund=_as_float(holding.get('percentage_of_fund')) * fund_weight_pct / 100)
+                if holding.get('shares_or_principal_amount') is not None:
+                    exposure['shares_or_principal_amount'] = _scaled_quantity(holding['shares_or_principal_amount'], fraction)
+            if not is_fund_holding(holding):
+                exposures.append(exposure)
+                continue
+
+            self.stats['fund_positions'] += 1
+            fund_key = self.resolver.resolve(holding)
+            if fund_key is None:
+                self._opaque(exposure, 'unresolved', exposures)
+            elif fund_key in path_keys:
+                print(f"Look-through: {holding.get('name')} leads back to a fund already being expanded; not expanding it again.")
+                self._opaque(exposure, 'cycle', exposures)
+            elif len(path_names) >= self.max_depth:
+                self._opaque(exposure, 'depth_limit', exposures)
+            else:
+                fund = self._fund(fund_key)
+                if not fund:
+                    self._opaque(exposure, 'not_loaded', exposures)
+                    continue
+                fund_name, total_net_assets, fund_holdings = fund
+                total_net_assets = _as_float(total_net_assets) or sum(_as_float(h.get('market_value_usd')) for h in fund_holdings)
+                if total_net_assets <= 0:
+                    self._opaque(exposure, 'not_loaded', exposures)
+                    continue
+                self.stats['expanded'] += 1
+                # The position's (already scaled) value over the fund's net assets is the fraction of it held
+                self._expand(fund_holdings, _as_float(exposure.get('market_value_usd')) / total_net_assets,
+                             _as_float(exposure.get('percentage_of_fund')), path_keys + (fund_key,),
+                             path_names + [fund_name or holding.get('name') or 'N/A'], exposures)
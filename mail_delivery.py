@@ -0,0 +1,148 @@
+import base64
+import time
+from email.mime.text import MIMEText
+
+import httplib2
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+import report_generator
+
+# Gmail recommends at most 50 requests per batch; larger batches are more likely to be rate limited.
+GMAIL_BATCH_SIZE = 50
+MAX_SEND_RETRIES = 4
+RETRY_BACKOFF_SECONDS = 2
+_RATE_LIMIT_REASONS = ("ratelimitexceeded", "userratelimitexceeded", "quotaexceeded", "concurrentlimitexceeded")
+# Connection-level failures of a whole batch request (sockets, timeouts, httplib2); retried like rate limits
+_TRANSIENT_TRANSPORT_ERRORS = (OSError, httplib2.HttpLib2Error)
+
+def is_retryable_error(exception):
+    """
+    True for errors worth retrying later: rate limiting (429, or 403 with a rate-limit reason) and 5xx server errors.
+    """
+    if not isinstance(exception, HttpError):
+        return False
+    status = getattr(exception.resp, 'status', None)
+    try:
+        status = int(status)
+    except (ValueError, TypeError):
+        return False
+    if status == 429 or status >= 500:
+        return True
+    if status == 403:
+        content = exception.content.decode('utf-8', 'replace') if isinstance(exception.content, bytes) else str(exception.content)
+        return any(reason in content.lower() for reason in _RATE_LIMIT_REASONS)
+    return False
+
+class GmailDeliveryQueue:
+    """
+    Queues report emails and delivers them through the Gmail batch HTTP API.
+    Authenticates and builds the Gmail service once, then reuses it for every batch.
+    Messages rejected for rate limiting, and batches lost to connection errors, are retried with
+    exponential backoff. No error escapes flush(): messages that cannot be sent are reported as failed.
+    """
+
+    def __init__(self, service=None, batch_size=GMAIL_BATCH_SIZE, max_retries=MAX_SEND_RETRIES,
+                 backoff_seconds=RETRY_BACKOFF_SECONDS):
+        self._service = service
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._pending = [] # (request_id, MIME message)
+        self._next_id = 0
+
+    def _get_service(self):
+        if self._service is None:
+            creds = report_generator.gmail_authenticate()
+            if not creds:
+                print("Could not authenticate with Gmail. Emails not sent.")
+                return None
+            self._service = build('gmail', 'v1', credentials=creds)
+        return self._service
+
+    def add(self, message):
+        """Queues a MIME message (with 'to' and 'subject' set). Returns its request id."""
+        request_id = str(self._next_id)
+        self._next_id += 1
+        self._pending.append((request_id, message))
+        return request_id
+
+    def add_report(self, recipient_emails, subject, analysis_result, **report_options):
+        """Queues one report message per recipient. Returns the request ids."""
+        return [self.add(report_generator.build_report_message(recipient, subject, analysis_result, **report_options))
+                for recipient in recipient_emails]
+
+    def add_text(self, recipient_emails, subject, text):
+        request_ids = []
+        for recipient in recipient_emails:
+            message = MIMEText(text)
+            message['to'] = recipient
+            message['subject'] = subject
+            request_ids.append(self.add(message))
+        return request_ids
+
+    def _send_batch(self, service, batch_items, results):
+        """Sends one batch. Returns the items that failed with a retryable error."""
+        retry_items = []
+        messages_by_id = dict(batch_items)
+
+        def on_response(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response.get('id')
+                print(f"Sent message to {messages_by_id[request_id]['to']}, Message Id: {results[request_id]}")
+            elif is_retryable_error(exception):
+                retry_items.append((request_id, messages_by_id[request_id]))
+            else:
+                results[request_id] = None
+                print(f"Failed to send message to {messages_by_id[request_id]['to']}: {exception}")
+
+        batch = service.new_batch_http_request(callback=on_response)
+        for request_id, message in batch_items:
+            raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+            batch.add(service.users().messages().send(userId="me", body={'raw': raw}), request_id=request_id)
+        batch.execute()
+        return retry_items
+
+    def flush(self):
+        """
+        Sends every queued message. Returns {request_id: Gmail message id, or None if sending failed}.
+        """
+        results = {}
+        pending, self._pending = self._pending, []
+        if not pending:
+            return results
+
+        service = self._get_service()
+        if service is None:
+            return {request_id: None for request_id, _ in pending}
+
+        attempt = 0
+        while pending:
+            retry_items = []
+            for start in range(0, len(pending), self.batch_size):
+                batch_items = pending[start:start + self.batch_size]
+                try:
+                    retry_items.extend(self._send_batch(service, batch_items, results))
+                except Exception as error:
+                    # The batch request itself failed. Messages whose responses already arrived are
+                    # settled; retry the rest if the failure was throttling or the connection
+                    unsettled_items = [item for item in batch_items if item[0] not in results]
+                    if is_retryable_error(error) or isinstance(error, _TRANSIENT_TRANSPORT_ERRORS):
+                        print(f"Email batch failed ({type(error).__name__}: {error}); will retry {len(unsettled_items)} message(s).")
+                        retry_items.extend(unsettled_items)
+                    else:
+                        print(f"An error occurred while sending email batch: {error}")
+                        results.update({request_id: None for request_id, _ in unsettled_items})
+
+            if retry_items and attempt < self.max_retries:
+                delay = self.backoff_seconds * (2 ** attempt)
+                print(f"Gmail rate limit or connection error for {len(retry_items)} message(s). Retrying in {delay}s...")
+                time.sleep(delay)
+                attempt += 1
+                pending = retry_items
+            else:
+                for request_id, message in retry_items:
+                    print(f"Giving up on message to {message['to']} after {attempt} retries.")
+                    results[request_id] = None
+                pending = []
+        return results
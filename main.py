@@ -5,14 +5,85 @@ from dotenv import load_dotenv
 
 import fund_analyzer
 import report_generator
+import mail_delivery
+import pipeline
+import run_journal
+import look_through
+import analysis_history
 
 # Load .env file if it exists, for ALPHA_VANTAGE_API_KEY
 load_dotenv()
 
+def parse_recipients(recipient_emails):
+    return [email.strip() for email in recipient_emails.split(',') if email.strip()]
+
+def send_text_report(recipient_emails, subject, report_text):
+    """Sends a plain-text report to comma-separated recipients through the Gmail delivery queue."""
+    if not os.path.exists(report_generator.CREDENTIALS_FILE):
+        print(f"SKIPPING email send: {report_generator.CREDENTIALS_FILE} not found.")
+        return
+    delivery_queue = mail_delivery.GmailDeliveryQueue()
+    recipients = parse_recipients(recipient_emails)
+    request_ids = delivery_queue.add_text(recipients, subject, report_text)
+    send_results = delivery_queue.flush()
+    failed_recipients = [recipient for recipient, request_id in zip(recipients, request_ids) if not send_results.get(request_id)]
+    if failed_recipients:
+        print(f"Failed to send '{subject}' to {', '.join(failed_recipients)}.")
+
+def run_holders_lookup(security_identifier, recipient_email=None):
+    lookup_result = fund_analyzer.find_fund_holders(security_identifier)
+    report_text = report_generator.format_holders_for_email(lookup_result)
+    print(report_text)
+
+    if recipient_email:
+        print(f"\nAttempting to send holders report to {recipient_email}...")
+        send_text_report(recipient_email, f"Fund Holders of {security_identifier}", report_text)
+
+def run_similarity_lookup(fund_ticker_or_series, top_n=None, recipient_email=None):
+    similarity_result = fund_analyzer.find_similar_funds(fund_ticker_or_series, top_n or fund_analyzer.SIMILAR_FUNDS_DEFAULT_COUNT)
+    report_text = report_generator.format_similar_funds_for_email(similarity_result)
+    print(report_text)
+
+    if recipient_email:
+        print(f"\nAttempting to send similar funds report to {recipient_email}...")
+        send_text_report(recipient_email, f"Funds Similar to {fund_ticker_or_series}", report_text)
+
 def main():
     parser = argparse.ArgumentParser(description="Analyze mutual fund ownership and email a report.")
-    parser.add_argument("--fund", required=True, help="Ticker symbol or name of the mutual fund/ETF to analyze.")
-    parser.add_argument("--email", required=True, help="Recipient's email address for the report.")
+    parser.add_argument("--fund", help="Ticker symbol or name of the mutual fund/ETF to analyze.")
+    parser.add_argument("--email", help="Recipient's email address for the report. Separate several recipients with commas.")
+    parser.add_argument("--look-through", nargs="?", type=int, const=look_through.MAX_LOOK_THROUGH_DEPTH, default=None,
+                        metavar="DEPTH",
+                        help=f"Replace positions in other registered funds with those funds' own holdings, up to DEPTH levels "
+                             f"(default {look_through.MAX_LOOK_THROUGH_DEPTH}).")
+    parser.add_argument("--13f", dest="institutional_13f", action="store_true",
+                        help="Analyze an institutional manager's latest 13F-HR holdings instead of a fund's N-PORT. Pass the manager's CIK as --fund.")
+    parser.add_argument("--by-issuer", action="store_true",
+                        help="Combine holdings of the same issuer (share classes, stock and bonds) by LEI or CUSIP prefix, and report ownership per issuer.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Build on the fund's previously saved analysis (results/): only new or materially changed positions are looked up again, and the report lists the changes.")
+    parser.add_argument("--resume", default=None, metavar="RUN_ID",
+                        help="Continue an interrupted run from its journal in runs/. The fund and analysis options of the original run are reused.")
+    parser.add_argument("--holders-of", dest="holders_of",
+                        help="Reverse lookup: ticker or CUSIP of a security. Lists every indexed fund holding it instead of analyzing a fund.")
+    parser.add_argument("--similar-to", dest="similar_to",
+                        help="Similarity search: ticker, CIK or series ID of an indexed fund. Lists the indexed funds whose holdings look most like it (--top sets how many, default 10).")
+    parser.add_argument("--top", type=int, default=None,
+                        help="Only analyze the N largest holdings by market value (saves ownership lookups).")
+    parser.add_argument("--min-fund-weight", dest="min_fund_weight", type=float, default=None,
+                        help="Only analyze holdings that are at least this percentage of the fund's assets.")
+    parser.add_argument("--min-ownership", dest="min_ownership", type=float, default=None,
+                        help="Only list holdings in the report where the fund owns at least this percentage of the company.")
+    parser.add_argument("--max-api-calls", dest="max_api_calls", type=int, default=None,
+                        help="Maximum number of Alpha Vantage lookups. Spent on the holdings with the largest fund weight first.")
+    parser.add_argument("--time-budget", dest="time_budget", type=float, default=None,
+                        help="Stop ownership lookups after this many seconds and report partial coverage.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Run parsing, ownership lookups and export concurrently instead of one stage after another.")
+    parser.add_argument("--workers", type=int, default=pipeline.DEFAULT_LOOKUP_WORKERS,
+                        help="Number of concurrent ownership lookup workers with --pipeline.")
+    parser.add_argument("--export", default=None,
+                        help="With --pipeline, also write every analyzed holding to this CSV file (.csv or .csv.gz) as results arrive.")
     # Gmail user for sending is handled by OAuth, so not needed as CLI arg if using OAuth.
     # If a different sending mechanism was added, it might be needed.
 
@@ -21,8 +92,35 @@ def main():
                         help="Alpha Vantage API key. Overrides ALPHA_VANTAGE_API_KEY environment variable if set. Defaults to 'demo'.")
 
     args = parser.parse_args()
-
-    print(f"Received request to analyze fund: {args.fund} and email report to: {args.email}")
+    if not (args.holders_of or args.similar_to) and (not (args.fund or args.resume) or not args.email):
+        parser.error("--fund (or --resume) and --email are required unless --holders-of or --similar-to is given.")
+    if args.resume and args.pipeline:
+        parser.error("--resume continues a sequential run and cannot be combined with --pipeline.")
+    if args.pipeline and args.top is not None:
+        parser.error("--top needs every holding before lookups can start and cannot be combined with --pipeline.")
+    if args.pipeline and args.look_through:
+        parser.error("--look-through cannot be combined with --pipeline.")
+    if args.pipeline and args.incremental:
+        parser.error("--incremental cannot be combined with --pipeline.")
+    if args.pipeline and args.by_issuer:
+        parser.error("--by-issuer needs every holding before lookups can start and cannot be combined with --pipeline.")
+    if args.export and not args.pipeline:
+        parser.error("--export requires --pipeline.")
+
+    journal = None
+    if args.resume:
+        journal = run_journal.RunJournal.resume(args.resume)
+        if journal is None:
+            sys.exit(1)
+        # The original run's fund and selection options keep the holdings identical;
+        # a fresh --max-api-calls / --time-budget may be given for the remaining lookups
+        args.fund = journal.fund
+        for option, value in journal.options.items():
+            if option in ('top', 'min_fund_weight', 'institutional_13f', 'by_issuer', 'look_through', 'incremental') or getattr(args, option, None) is None:
+                setattr(args, option, value)
+
+    if not (args.holders_of or args.similar_to):
+        print(f"Received request to analyze fund: {args.fund} and email report to: {args.email}")
 
     # Update Alpha Vantage API key in fund_analyzer if provided via CLI
     # The fund_analyzer module already gets it from os.getenv or defaults to 'demo'.
@@ -39,8 +137,51 @@ def main():
         print(f"Using Alpha Vantage API Key: {'*'*(len(args.alpha_vantage_key)-4) + args.alpha_vantage_key[-4:] if args.alpha_vantage_key != 'demo' else 'demo'}")
 
 
+    if args.holders_of:
+        run_holders_lookup(args.holders_of, args.email)
+        return
+    if args.similar_to:
+        run_similarity_lookup(args.similar_to, args.top, args.email)
+        return
+
+    recipients = parse_recipients(args.email)
+    # One queue per run: Gmail is authenticated once and all messages go out in batches
+    delivery_queue = mail_delivery.GmailDeliveryQueue()
+
+    holdings_form = '13f' if args.institutional_13f else 'nport'
     print(f"\nStarting fund analysis for: {args.fund}...")
-    analysis_data = fund_analyzer.analyze_fund_ownership(args.fund)
+    if args.pipeline:
+        writers = [pipeline.CsvExportWriter(args.export)] if args.export else []
+        analysis_data = pipeline.run_analysis_pipeline(args.fund, lookup_workers=args.workers, writers=writers,
+                                                       min_percentage_of_fund=args.min_fund_weight,
+                                                       max_api_calls=args.max_api_calls,
+                                                       deadline_seconds=args.time_budget,
+                                                       holdings_form=holdings_form)
+    else:
+        if journal is None:
+            journal = run_journal.RunJournal.start(args.fund, {'top': args.top, 'min_fund_weight': args.min_fund_weight,
+                                                               'max_api_calls': args.max_api_calls,
+                                                               'time_budget': args.time_budget,
+                                                               'institutional_13f': args.institutional_13f,
+                                                               'by_issuer': args.by_issuer,
+                                                               'look_through': args.look_through,
+                                                               'incremental': args.incremental})
+        print(f"Run ID: {journal.run_id} (continue an interrupted run with --resume {journal.run_id})")
+        try:
+            analysis_data = fund_analyzer.analyze_fund_ownership(args.fund, top_n=args.top,
+                                                                 min_percentage_of_fund=args.min_fund_weight,
+                                                                 max_api_calls=args.max_api_calls,
+                                                                 deadline_seconds=args.time_budget,
+                                                                 journal=journal, holdings_form=holdings_form,
+                                                                 group_by_issuer=args.by_issuer,
+                                                                 look_through_depth=args.look_through,
+                                                                 history=analysis_history.AnalysisHistory(),
+                                                                 incremental=args.incremental)
+        except KeyboardInterrupt:
+            print(f"\nRun interrupted. Progress is saved; continue with: python main.py --resume {journal.run_id} --email {args.email}")
+            sys.exit(130)
+        finally:
+            journal.close()
 
     if not analysis_data or analysis_data.get('status') != "Analysis complete.":
         print(f"\nFund analysis for {args.fund} could not be completed or failed.")
@@ -58,11 +199,12 @@ def main():
         if not os.path.exists(report_generator.CREDENTIALS_FILE):
             print(f"SKIPPING email send: {report_generator.CREDENTIALS_FILE} not found.")
         else:
-            report_generator.send_email_report(args.email, error_report_subject, error_report_body)
+            delivery_queue.add_text(recipients, error_report_subject, error_report_body)
+            delivery_queue.flush()
         sys.exit(1) # Exit with an error code
 
     print(f"\nAnalysis for {args.fund} complete. Generating email report...")
-    report_text = report_generator.format_data_for_email(analysis_data)
+    report_text = report_generator.format_data_for_email(analysis_data, min_company_ownership_pct=args.min_ownership)
 
     email_subject = f"Fund Ownership Analysis: {analysis_data.get('fund_name', args.fund)}"
 
@@ -72,11 +214,14 @@ def main():
         print(f"Report for {args.fund} was generated but not sent. Content preview:")
         print(report_text[:1000] + "..." if len(report_text) > 1000 else report_text)
     else:
-        send_success = report_generator.send_email_report(args.email, email_subject, report_text)
-        if send_success:
+        request_ids = delivery_queue.add_report(recipients, email_subject, analysis_data,
+                                                min_company_ownership_pct=args.min_ownership)
+        send_results = delivery_queue.flush()
+        failed_recipients = [recipient for recipient, request_id in zip(recipients, request_ids) if not send_results.get(request_id)]
+        if not failed_recipients:
             print(f"Email report for {args.fund} successfully sent to {args.email}.")
         else:
-            print(f"Failed to send email report for {args.fund} to {args.email}.")
+            print(f"Failed to send email report for {args.fund} to {', '.join(failed_recipients)}.")
             print("Report content was:")
             print(report_text[:1000] + "..." if len(report_text) > 1000 else report_text)
 
@@ -0,0 +1,267 @@
+import csv
+import gzip
+import queue
+import threading
+
+import sec_parser
+import fund_analyzer
+import allocation
+import report_generator
+
+# Staged analysis: a parser thread streams holdings out of the filing, lookup workers resolve
+# shares outstanding as soon as each holding arrives, and a writer thread hands finished rows to
+# the export writers. Stages are connected by bounded queues, so a slow stage throttles the
+# stages before it instead of letting work pile up in memory.
+DEFAULT_LOOKUP_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 256
+
+_END_OF_STREAM = None
+
+class CsvExportWriter:
+    """
+    Writes analyzed holdings to CSV as they come out of the pipeline (gzip-compressed if the path ends in .gz).
+    Rows are written in completion order, not filing order.
+    """
+    def __init__(self, path):
+        self.path = path
+        if path.endswith('.gz'):
+            self._file = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=report_generator.CSV_COLUMNS, extrasaction='ignore')
+        self._writer.writeheader()
+        self.rows_written = 0
+
+    def write(self, holding_detail):
+        self._writer.writerow(holding_detail)
+        self.rows_written += 1
+
+    def close(self):
+        self._file.close()
+        print(f"Exported {self.rows_written} holdings to {self.path}")
+
+class _PipelineState:
+    """Counters and settings shared by the lookup workers of one run."""
+    def __init__(self, router, budget, spacer):
+        self.router = router
+        self.budget = budget
+        self.spacer = spacer
+        self.lock = threading.Lock()
+        self.holdings_parsed = 0
+        self.resolved_offline = 0
+        self.processed_for_av = 0
+        self.budget_exhausted_reason = None
+        self.allocations = None
+        self.parse_error = None
+
+def _parse_stage(stream_holdings, filing_directory_path, filing_metadata, holdings_queue, worker_count,
+                 min_percentage_of_fund, state):
+    # Nothing is kept once queued: the indexes and the allocation breakdown are accumulated as holdings pass
+    unweighted_count = 0
+    classification = allocation.get_issuer_classification()
+    allocation_totals = allocation.AllocationTotals()
+    recorder = sec_parser.FilingIndexRecorder(filing_metadata)
+    try:
+        for sequence, holding in enumerate(stream_holdings(filing_directory_path, filing_metadata)):
+            # Classified before it is queued, so the lookup workers' rows carry sector and industry
+            allocation.classify_holding(holding, classification)
+            allocation_totals.add(holding)
+            recorder.add(holding)
+            with state.lock:
+                state.holdings_parsed += 1
+            if min_percentage_of_fund is not None:
+                # Streamed schedule-of-investments rows have no weight yet; they are kept (see fund_analyzer.above_fund_weight)
+                weight = holding.get('percentage_of_fund')
+                if weight is None:
+                    unweighted_count += 1
+                elif fund_analyzer._as_float(weight) < min_percentage_of_fund:
+                    continue
+            holdings_queue.put((sequence, holding))
+        if unweighted_count:
+            fund_analyzer.warn_unweighted_holdings(unweighted_count)
+        recorder.finish(filing_metadata.get('fund_name'), filing_metadata.get('total_net_assets'))
+        state.allocations = allocation_totals.allocations()
+    except Exception as e:
+        recorder.close()
+        state.parse_error = str(e)
+        print(f"Parser stage failed for {filing_directory_path}: {e}")
+    finally:
+        for _ in range(worker_count):
+            holdings_queue.put(_END_OF_STREAM)
+
+def _lookup_holding(holding, state):
+    holding_detail, ticker_to_lookup, shares_held_by_fund_num = fund_analyzer.build_holding_detail(holding)
+    if shares_held_by_fund_num > 0:
+        offline_shares, offline_source = state.router.lookup_shares_outstanding(
+            ticker=ticker_to_lookup, cusip=fund_analyzer.lookup_cusip(holding_detail), max_cost=0)
+        if offline_shares:
+            fund_analyzer.apply_shares_outstanding(holding_detail, shares_held_by_fund_num, offline_shares, offline_source)
+            with state.lock:
+                state.resolved_offline += 1
+            return holding_detail
+    if not ticker_to_lookup or shares_held_by_fund_num <= 0:
+        fund_analyzer.mark_holding_unprocessed(holding_detail, "N/A (No Ticker/Shares)")
+        return holding_detail
+
+    # Holdings of the same security (ticker and CUSIP) looked up at the same time share one metered call;
+    # rows without a ticker all carry 'N/A', so the CUSIP must be part of the key
+    cusip_to_lookup = fund_analyzer.lookup_cusip(holding_detail)
+    total_outstanding_shares, source, exhausted_reason = fund_analyzer.coalesced_lookup(
+        ('metered_shares_outstanding', ticker_to_lookup.strip().upper(), cusip_to_lookup or ''), _metered_lookup,
+        ticker_to_lookup, cusip_to_lookup, state)
+    if exhausted_reason:
+        with state.lock:
+            state.budget_exhausted_reason = exhausted_reason
+        if fund_analyzer.API_KEY == 'demo' and exhausted_reason == "API Call Limit":
+            fund_analyzer.mark_holding_unprocessed(holding_detail, "Skipped (Demo Limit)")
+        else:
+            fund_analyzer.mark_holding_unprocessed(holding_detail, f"Skipped ({exhausted_reason})")
+        return holding_detail
+    fund_analyzer.apply_shares_outstanding(holding_detail, shares_held_by_fund_num, total_outstanding_shares, source)
+    return holding_detail
+
+def _metered_lookup(ticker_to_lookup, cusip, state):
+    """Returns (shares_outstanding, source, budget_exhausted_reason) for one metered lookup."""
+    # A call for this ticker may have just finished and filled the cache
+    cached_shares, cached_source = state.router.lookup_shares_outstanding(ticker=ticker_to_lookup, cusip=cusip, max_cost=0)
+    if cached_shares:
+        return cached_shares, cached_source, None
+
+    exhausted_reason = state.budget.reserve_call(fund_analyzer.CALL_DELAY_SECONDS)
+    if exhausted_reason:
+        return None, None, exhausted_reason
+    state.spacer.wait()
+    total_outstanding_shares, source = state.router.lookup_shares_outstanding(ticker=ticker_to_lookup, cusip=cusip)
+    with state.lock:
+        state.processed_for_av += 1
+    return total_outstanding_shares, source, None
+
+def _lookup_stage(holdings_queue, results_queue, state):
+    while True:
+        item = holdings_queue.get()
+        if item is _END_OF_STREAM:
+            results_queue.put(_END_OF_STREAM)
+            return
+        sequence, holding = item
+        try:
+            holding_detail = _lookup_holding(holding, state)
+        except Exception as e:
+            print(f"Lookup failed for {holding.get('name', 'N/A')}: {e}")
+            holding_detail, _, _ = fund_analyzer.build_holding_detail(holding)
+            fund_analyzer.mark_holding_unprocessed(holding_detail, "N/A (AV Fail/No Data)")
+        results_queue.put((sequence, holding_detail))
+
+def _write_stage(results_queue, worker_count, writers, collected):
+    finished_workers = 0
+    while finished_workers < worker_count:
+        item = results_queue.get()
+        if item is _END_OF_STREAM:
+            finished_workers += 1
+            continue
+        collected.append(item)
+        for writer in writers:
+            try:
+                writer.write(item[1])
+            except Exception as e:
+                print(f"Export writer {type(writer).__name__} failed: {e}")
+
+def run_analysis_pipeline(fund_ticker_or_name, lookup_workers=DEFAULT_LOOKUP_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                          writers=None, min_percentage_of_fund=None, max_api_calls=None, deadline_seconds=None,
+                          holdings_form='nport'):
+    """
+    Same analysis as fund_analyzer.analyze_fund_ownership, but with parsing, ownership lookups and
+    exporting running concurrently. Returns a result dict of the same shape; detailed_holdings are in
+    filing order. Writers are objects with write(holding_detail) and close(), fed as rows complete.
+    Because holdings are looked up as they stream in, a bounded budget is spent in filing order
+    rather than by fund weight, and there is no top-N selection.
+    """
+    fund_analyzer.refresh_api_settings()
+    download_filing, _, stream_holdings = fund_analyzer.get_holdings_source(holdings_form)
+    writers = list(writers or [])
+    budget = fund_analyzer.LookupBudget(max_api_calls, deadline_seconds)
+    if budget.max_api_calls is None and fund_analyzer.API_KEY == 'demo':
+        budget.max_api_calls = fund_analyzer.MAX_HOLDINGS_TO_PROCESS_DEMO
+
+    print(f"Starting pipelined analysis for fund: {fund_ticker_or_name} ({lookup_workers} lookup workers)")
+    fund_cik = fund_analyzer.resolve_fund_ticker_to_cik(fund_ticker_or_name)
+    if not fund_cik:
+        print(f"Could not determine CIK for {fund_ticker_or_name}. Aborting.")
+        return {"fund_ticker": fund_ticker_or_name, "status": "CIK resolution failed."}
+    print(f"Resolved {fund_ticker_or_name} to CIK: {fund_cik}")
+
+    filing_directory_path = download_filing(fund_cik)
+    if not filing_directory_path:
+        print(f"Failed to download holdings for CIK {fund_cik}.")
+        return {"fund_cik": fund_cik, "fund_ticker": fund_ticker_or_name, "status": "Download failed."}
+
+    state = _PipelineState(fund_analyzer.get_reference_data_router(), budget,
+                           fund_analyzer.CallSpacer(fund_analyzer.CALL_DELAY_SECONDS))
+    # Provider and coalescing counters are process-wide; report only what this run adds to them
+    reference_data_stats_start = state.router.stats_snapshot()
+    lookup_coalescing_start = fund_analyzer.lookup_coalescing_stats()
+    holdings_queue = queue.Queue(maxsize=queue_size)
+    results_queue = queue.Queue(maxsize=queue_size)
+    filing_metadata = {}
+    collected = []
+
+    threads = [threading.Thread(target=_parse_stage, name="pipeline-parser",
+                                args=(stream_holdings, filing_directory_path, filing_metadata, holdings_queue, lookup_workers,
+                                      min_percentage_of_fund, state))]
+    threads += [threading.Thread(target=_lookup_stage, name=f"pipeline-lookup-{i}",
+                                 args=(holdings_queue, results_queue, state)) for i in range(lookup_workers)]
+    threads.append(threading.Thread(target=_write_stage, name="pipeline-writer",
+                                    args=(results_queue, lookup_workers, writers, collected)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for writer in writers:
+        writer.close()
+
+    fund_name = filing_metadata.get('fund_name')
+    total_net_assets = filing_metadata.get('total_net_assets')
+    if not state.holdings_parsed:
+        status_msg = "Parsing failed or no holdings found."
+        if state.parse_error:
+            status_msg = f"Parsing failed: {state.parse_error}"
+        elif fund_name or total_net_assets:
+            status_msg = f"Parsed metadata (Fund: {fund_name}, Assets: {total_net_assets}) but no holdings details."
+        print(f"{status_msg} for CIK {fund_cik} at {filing_directory_path}.")
+        return {"fund_cik": fund_cik, "fund_name": fund_name, "total_net_assets": total_net_assets,
+                "fund_ticker": fund_ticker_or_name, "status": status_msg}
+
+    collected.sort(key=lambda item: item[0])
+    processed_holdings_data = [holding_detail for _, holding_detail in collected]
+    print(f"\nPipeline processed {len(processed_holdings_data)} of {state.holdings_parsed} holdings for "
+          f"{fund_name if fund_name else 'fund CIK ' + fund_cik}.")
+
+    reference_data_stats = state.router.stats_summary(since=reference_data_stats_start)
+    fund_analyzer.print_reference_data_stats(reference_data_stats)
+    lookup_coalescing = fund_analyzer.lookup_coalescing_stats(since=lookup_coalescing_start)
+    if lookup_coalescing['coalesced']:
+        print(f"Coalesced {lookup_coalescing['coalesced']} duplicate lookups into in-flight calls.")
+    ownership_coverage_pct = fund_analyzer.compute_ownership_coverage(processed_holdings_data)
+    print(f"Ownership computed for {ownership_coverage_pct:.0f}% of analyzed assets.")
+    status_msg = "Analysis complete."
+    if state.parse_error:
+        # The rows looked up so far are returned, but they are not the whole filing
+        status_msg = f"Parsing failed after {state.holdings_parsed} holdings: {state.parse_error}"
+        print(status_msg)
+
+    return {
+        "fund_cik": fund_cik,
+        "fund_name": fund_name,
+        "fund_ticker": fund_ticker_or_name,
+        "total_net_assets": total_net_assets,
+        "holdings_count": state.holdings_parsed,
+        "holdings_selected": len(processed_holdings_data),
+        "allocations": state.allocations,
+        "holdings_processed_for_company_ownership": state.processed_for_av,
+        "holdings_resolved_offline": state.resolved_offline,
+        "reference_data_stats": reference_data_stats,
+        "lookup_coalescing": lookup_coalescing,
+        "ownership_coverage_pct": ownership_coverage_pct,
+        "lookup_budget_exhausted": state.budget_exhausted_reason,
+        "detailed_holdings": processed_holdings_data,
+        "status": status_msg
+    }
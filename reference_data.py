@@ -0,0 +1,341 @@
+import os
+import abc
+import time
+import threading
+from collections import deque
+
+import requests
+from alpha_vantage.fundamentaldata import FundamentalData
+
+import xbrl_facts
+
+# Reference-data providers for shares outstanding and ticker metadata, and a router that
+# tries them cheapest/fastest first and routes around throttled or slow providers.
+
+SLOW_PROVIDER_P95_SECONDS = 5.0
+THROTTLE_COOLDOWN_SECONDS = 60
+LATENCY_WINDOW = 100
+
+class ProviderError(Exception):
+    """A provider failed to answer (network problem, bad response). Other providers may still succeed."""
+
+class ProviderThrottled(ProviderError):
+    """A provider rejected the request because of rate limiting or an exhausted quota."""
+
+def _normalize_cusip(cusip):
+    cusip = str(cusip or '').strip().upper()
+    return cusip if cusip and cusip != "N/A" and not cusip.startswith('000000') else None
+
+class SharesOutstandingProvider(abc.ABC):
+    """
+    Base class for reference-data providers.
+    Lookups return None when the provider has no data for the security, and raise ProviderError
+    (or ProviderThrottled) when the provider itself failed.
+    """
+    name = "base"
+    # Relative cost of one lookup; zero-cost providers never touch a metered API
+    cost = 0
+
+    @abc.abstractmethod
+    def get_shares_outstanding(self, ticker=None, cusip=None, cik=None):
+        """Shares outstanding for the security, or None if this provider has no data for it."""
+
+    def get_ticker_metadata(self, ticker):
+        return None
+
+class CacheProvider(SharesOutstandingProvider):
+    """
+    In-memory cache filled by the router with answers from the other providers.
+    """
+    name = "cache"
+    cost = 0
+
+    def __init__(self, ttl_seconds=None):
+        self.ttl_seconds = ttl_seconds
+        self._shares = {}
+        self._metadata = {}
+
+    @staticmethod
+    def _keys(ticker=None, cusip=None, cik=None):
+        # Placeholder identifiers ("N/A", all-zero CUSIPs) are shared by unrelated holdings and never used as keys
+        keys = []
+        if cik: keys.append(('cik', xbrl_facts.normalize_cik(cik)))
+        cusip = _normalize_cusip(cusip)
+        if cusip: keys.append(('cusip', cusip))
+        ticker = str(ticker or '').strip().upper()
+        if ticker and ticker != "N/A": keys.append(('ticker', ticker))
+        return keys
+
+    def _fresh(self, entry):
+        return entry is not None and (self.ttl_seconds is None or time.monotonic() - entry[1] < self.ttl_seconds)
+
+    def get_shares_outstanding(self, ticker=None, cusip=None, cik=None):
+        for key in self._keys(ticker, cusip, cik):
+            entry = self._shares.get(key)
+            if self._fresh(entry):
+                return entry[0]
+        return None
+
+    def store_shares_outstanding(self, shares, ticker=None, cusip=None, cik=None):
+        for key in self._keys(ticker, cusip, cik):
+            self._shares[key] = (shares, time.monotonic())
+
+    def get_ticker_metadata(self, ticker):
+        entry = self._metadata.get(str(ticker).strip().upper()) if ticker else None
+        return entry[0] if self._fresh(entry) else None
+
+    def store_ticker_metadata(self, ticker, metadata):
+        self._metadata[str(ticker).strip().upper()] = (metadata, time.monotonic())
+
+class XbrlFactsProvider(SharesOutstandingProvider):
+    """
+    Offline shares outstanding from the SEC XBRL company facts index (see xbrl_facts.py).
+    """
+    name = "sec_xbrl"
+    cost = 0
+
+    def __init__(self, index=None, index_path=None):
+        self._index = index
+        self.index_path = index_path or xbrl_facts.INDEX_PATH
+        self._load_attempted = index is not None
+
+    def _get_index(self):
+        if not self._load_attempted:
+            self._load_attempted = True
+            if os.path.exists(self.index_path):
+                try:
+                    self._index = xbrl_facts.SharesOutstandingIndex.load(self.index_path)
+                    print(f"Loaded offline shares-outstanding index for {len(self._index.by_cik)} companies.")
+                except Exception as e:
+                    print(f"Warning: Could not load offline shares-outstanding index {self.index_path}: {e}")
+        return self._index
+
+    def get_shares_outstanding(self, ticker=None, cusip=None, cik=None):
+        index = self._get_index()
+        if index is None:
+            return None
+        return index.get_shares_outstanding(cik=cik, ticker=ticker, cusip=cusip)
+
+def _classify_alpha_vantage_error(error):
+    # The alpha_vantage library reports every API-level problem as a ValueError carrying the
+    # service's message, so its text is the only signal available. Keep the matching in one place.
+    message = str(error).lower()
+    if any(marker in message for marker in ("call frequency", "rate limit", "requests per day", "premium", "spreading out")):
+        return ProviderThrottled(str(error))
+    if "invalid api call" in message or "error message" in message:
+        return None # Unknown or unsupported symbol: a clean miss, not a provider failure
+    return ProviderError(str(error))
+
+class AlphaVantageProvider(SharesOutstandingProvider):
+    """
+    Shares outstanding and ticker metadata from the Alpha Vantage company overview endpoint.
+    Only tickers are supported. With the 'demo' key only IBM is answered.
+    """
+    name = "alpha_vantage"
+    cost = 10
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self._client = FundamentalData(key=api_key, output_format='json')
+        self._overviews = {} # One overview call answers both shares and metadata
+
+    def _get_overview(self, ticker):
+        ticker = ticker.strip().upper()
+        if ticker in self._overviews:
+            return self._overviews[ticker]
+        if self.api_key == 'demo' and ticker != 'IBM':
+            print(f"DEMO KEY: Shares outstanding lookup for {ticker} will be skipped (only IBM works reliably for overview with demo key).")
+            return None
+
+        print(f"Fetching company overview for: {ticker} (Using key ending: {'...' + self.api_key[-4:] if len(self.api_key) > 4 else self.api_key})...")
+        try:
+            overview_data, _ = self._client.get_company_overview(symbol=ticker)
+        except ValueError as e:
+            classified = _classify_alpha_vantage_error(e)
+            if classified is None:
+                print(f"API error for {ticker} (e.g. unsupported by demo key, invalid symbol).")
+                return None
+            raise classified
+        except requests.exceptions.RequestException as e:
+            raise ProviderError(f"Network error fetching overview for {ticker}: {e}")
+        except Exception as e:
+            raise ProviderError(f"Unexpected error fetching overview for {ticker}: {e}")
+
+        if not overview_data:
+            print(f"Error: No data received from get_company_overview for {ticker}")
+            return None
+        self._overviews[ticker] = overview_data
+        return overview_data
+
+    def get_shares_outstanding(self, ticker=None, cusip=None, cik=None):
+        if not ticker:
+            return None
+        overview_data = self._get_overview(ticker)
+        if not overview_data:
+            return None
+        shares_outstanding_str = overview_data.get('SharesOutstanding')
+        try:
+            shares = int(shares_outstanding_str)
+        except (ValueError, TypeError):
+            print(f"Error: 'SharesOutstanding' not found or not a number for {ticker} in API response: {shares_outstanding_str}")
+            return None
+        return shares if shares > 0 else None
+
+    def get_ticker_metadata(self, ticker):
+        overview_data = self._get_overview(ticker) if ticker else None
+        if not overview_data:
+            return None
+        return {'name': overview_data.get('Name'), 'exchange': overview_data.get('Exchange'),
+                'sector': overview_data.get('Sector'), 'industry': overview_data.get('Industry'),
+                'currency': overview_data.get('Currency'), 'cik': xbrl_facts.normalize_cik(overview_data.get('CIK'))}
+
+class ProviderStats:
+    _COUNTERS = ('calls', 'successes', 'misses', 'failures', 'throttled', 'latencies_recorded')
+
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.misses = 0
+        self.failures = 0
+        self.throttled = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.latencies_recorded = 0
+        self.throttled_until = 0.0
+
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+        self.latencies_recorded += 1
+
+    @property
+    def success_rate(self):
+        # Misses (provider answered "no data") count as successful calls
+        return (self.successes + self.misses) / self.calls if self.calls else 1.0
+
+    @property
+    def p95_latency(self):
+        return _p95(self.latencies)
+
+    def snapshot(self):
+        """Counter values now, to report one run's share with as_dict(since=...)."""
+        return {counter: getattr(self, counter) for counter in self._COUNTERS}
+
+    def as_dict(self, since=None):
+        """Counters and rates, either since the provider was created or since a snapshot()."""
+        counts = self.snapshot()
+        latencies = list(self.latencies)
+        if since:
+            counts = {counter: counts[counter] - since.get(counter, 0) for counter in self._COUNTERS}
+            latencies = latencies[len(latencies) - min(counts['latencies_recorded'], len(latencies)):]
+        calls = counts['calls']
+        return {'calls': calls, 'successes': counts['successes'], 'misses': counts['misses'],
+                'failures': counts['failures'], 'throttled': counts['throttled'],
+                'success_rate': (counts['successes'] + counts['misses']) / calls if calls else 1.0,
+                'p95_latency_seconds': _p95(latencies)}
+
+def _p95(latencies):
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    return ordered[int(0.95 * (len(ordered) - 1))]
+
+class ReferenceDataRouter:
+    """
+    Tries providers in (cost, p95 latency) order. Providers that were throttled are skipped until
+    their cooldown expires, and providers whose p95 latency exceeds slow_threshold_seconds are tried
+    after the other providers of the same cost - never after a costlier one, so a slow free source
+    still answers before paid quota is spent. Answers from paid providers are written back to any
+    cache providers.
+    """
+
+    def __init__(self, providers, slow_threshold_seconds=SLOW_PROVIDER_P95_SECONDS,
+                 throttle_cooldown_seconds=THROTTLE_COOLDOWN_SECONDS):
+        self.providers = list(providers)
+        self.slow_threshold_seconds = slow_threshold_seconds
+        self.throttle_cooldown_seconds = throttle_cooldown_seconds
+        self.stats = {provider.name: ProviderStats() for provider in self.providers}
+        # Lookups may come from several pipeline workers at once
+        self._stats_lock = threading.Lock()
+
+    def _ordered_providers(self, max_cost=None):
+        now = time.monotonic()
+        available = [p for p in self.providers
+                     if self.stats[p.name].throttled_until <= now and (max_cost is None or p.cost <= max_cost)]
+        def route_key(provider):
+            p95 = self.stats[provider.name].p95_latency
+            return (provider.cost, p95 > self.slow_threshold_seconds, p95)
+        return sorted(available, key=route_key)
+
+    def _call(self, provider, method, *args, **kwargs):
+        stats = self.stats[provider.name]
+        started = time.monotonic()
+        try:
+            result = getattr(provider, method)(*args, **kwargs)
+        except ProviderThrottled as e:
+            with self._stats_lock:
+                stats.calls += 1
+                stats.throttled += 1
+                stats.throttled_until = time.monotonic() + self.throttle_cooldown_seconds
+                stats.record_latency(time.monotonic() - started)
+            print(f"Provider {provider.name} is throttled ({e}). Routing around it for {self.throttle_cooldown_seconds}s.")
+            raise
+        except ProviderError as e:
+            with self._stats_lock:
+                stats.calls += 1
+                stats.failures += 1
+                stats.record_latency(time.monotonic() - started)
+            print(f"Provider {provider.name} failed: {e}")
+            raise
+        with self._stats_lock:
+            stats.calls += 1
+            stats.record_latency(time.monotonic() - started)
+            if result is None:
+                stats.misses += 1
+            else:
+                stats.successes += 1
+        return result
+
+    def lookup_shares_outstanding(self, ticker=None, cusip=None, cik=None, max_cost=None):
+        """
+        Returns (shares_outstanding, provider_name), or (None, None) if no provider could answer.
+        max_cost=0 restricts the lookup to free (offline/cached) providers.
+        """
+        for provider in self._ordered_providers(max_cost):
+            try:
+                shares = self._call(provider, 'get_shares_outstanding', ticker=ticker, cusip=cusip, cik=cik)
+            except ProviderError:
+                continue
+            if shares:
+                for cache in self.providers:
+                    if isinstance(cache, CacheProvider) and cache is not provider:
+                        cache.store_shares_outstanding(shares, ticker=ticker, cusip=cusip, cik=cik)
+                return shares, provider.name
+        return None, None
+
+    def get_shares_outstanding(self, ticker=None, cusip=None, cik=None, max_cost=None):
+        return self.lookup_shares_outstanding(ticker, cusip, cik, max_cost)[0]
+
+    def get_ticker_metadata(self, ticker, max_cost=None):
+        for provider in self._ordered_providers(max_cost):
+            try:
+                metadata = self._call(provider, 'get_ticker_metadata', ticker)
+            except ProviderError:
+                continue
+            if metadata:
+                for cache in self.providers:
+                    if isinstance(cache, CacheProvider) and cache is not provider:
+                        cache.store_ticker_metadata(ticker, metadata)
+                return metadata
+        return None
+
+    def stats_snapshot(self):
+        """Per-provider counters now; pass to stats_summary(since=...) to report a single run."""
+        with self._stats_lock:
+            return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    def stats_summary(self, since=None):
+        with self._stats_lock:
+            return {name: stats.as_dict((since or {}).get(name)) for name, stats in self.stats.items()}
+
+def build_default_router(api_key):
+    """Cache first, then the offline SEC XBRL index, then Alpha Vantage."""
+    return ReferenceDataRouter([CacheProvider(), XbrlFactsProvider(), AlphaVantageProvider(api_key)])
@@ -1,6 +1,16 @@
 import os.path
 import base64
+import heapq
+import io
+import csv
+import gzip
+import html
+import shutil
+import tempfile
+from string import Template
 from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -8,74 +18,403 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+import allocation
+
 # If modifying these SCOPES, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 # The file credentials.json needs to be obtained from Google Cloud Console
 # for the OAuth 2.0 Client ID. Place it in the same directory as this script.
 CREDENTIALS_FILE = 'credentials.json'
 TOKEN_FILE = 'token.json'
+MAX_HOLDINGS_IN_EMAIL = 20
+MAX_ALLOCATION_GROUPS_IN_REPORT = 10
+MAX_CHANGES_IN_REPORT = 10
+ALLOCATION_SECTIONS = (('sector', "Sector"), ('industry', "Industry"),
+                       ('asset_category', "Asset Category"), ('country', "Country"))
+
+def _market_value_key(holding):
+    try:
+        return float(holding.get('market_value_in_fund', 0))
+    except (ValueError, TypeError):
+        return 0.0
+
+def select_holdings_for_report(detailed_holdings, max_holdings=MAX_HOLDINGS_IN_EMAIL, min_company_ownership_pct=None):
+    """
+    Picks the holdings shown in the report: the largest by market value (bounded heap, no full sort),
+    optionally only those where the fund owns at least min_company_ownership_pct of the company.
+    """
+    if min_company_ownership_pct is not None:
+        detailed_holdings = (h for h in detailed_holdings
+                             if isinstance(h.get('percentage_of_company_owned_by_fund'), float)
+                             and h['percentage_of_company_owned_by_fund'] >= min_company_ownership_pct)
+    return heapq.nlargest(max_holdings, detailed_holdings, key=_market_value_key)
+
+# Report templates are compiled once at import and filled per holding while streaming into a buffer
+_TEXT_HOLDING_TEMPLATE = Template("""
+$index. Name: $name
+   CUSIP: $cusip, Ticker: $ticker
+   Shares/Principal Held by Fund: $shares
+   Market Value in Fund: $market_value
+   Percentage of Fund Assets: $percentage_of_fund
+   Percentage of Company Owned by Fund: $ownership_pct
+   Total Outstanding Shares of Company: $outstanding_shares
+""")
+
+_HTML_HEADER_TEMPLATE = Template("""<html><body style="font-family: Arial, sans-serif;">
+<h2>Fund Analysis Report</h2>
+<table>
+<tr><td><b>Fund Name</b></td><td>$fund_name</td></tr>
+<tr><td><b>Fund CIK</b></td><td>$fund_cik</td></tr>
+<tr><td><b>Total Net Assets</b></td><td>$total_net_assets</td></tr>
+<tr><td><b>Total Holdings Parsed</b></td><td>$holdings_count</td></tr>
+<tr><td><b>Holdings Processed for Company Ownership</b></td><td>$holdings_processed</td></tr>
+<tr><td><b>Ownership Coverage</b></td><td>$coverage</td></tr>
+</table>
+<h3>$criteria</h3>
+<table border="1" cellspacing="0" cellpadding="4">
+<tr><th>#</th><th>Name</th><th>CUSIP</th><th>Ticker</th><th>Shares/Principal</th><th>Market Value</th><th>% of Fund</th><th>% of Company Owned</th><th>Outstanding Shares</th></tr>
+""")
+
+_HTML_ROW_TEMPLATE = Template("""<tr><td>$index</td><td>$name</td><td>$cusip</td><td>$ticker</td><td>$shares</td><td>$market_value</td><td>$percentage_of_fund</td><td>$ownership_pct</td><td>$outstanding_shares</td></tr>
+""")
+
+_HTML_ALLOCATION_HEADER_TEMPLATE = Template("""<h3>Allocation by $dimension</h3>
+<table border="1" cellspacing="0" cellpadding="4">
+<tr><th>$dimension</th><th>% of Holdings</th><th>Market Value</th><th>Holdings</th></tr>
+""")
 
-def format_data_for_email(analysis_result):
+_HTML_ALLOCATION_ROW_TEMPLATE = Template("""<tr><td>$group</td><td>$weight_pct</td><td>$market_value</td><td>$holdings_count</td></tr>
+""")
+
+_HTML_FOOTER_TEMPLATE = Template("""<p>$footer</p>
+</body></html>
+""")
+
+CSV_COLUMNS = ['name', 'cusip', 'ticker', 'shares_held_by_fund_str', 'market_value_in_fund', 'percentage_of_fund',
+               'total_outstanding_shares', 'percentage_of_company_owned_by_fund', 'issuer_securities', 'held_via',
+               'sector', 'industry', 'asset_category', 'country',
+               'position_change', 'carried_forward_from']
+# Gmail rejects messages larger than 25 MB; leave headroom for base64 and MIME overhead
+GMAIL_MAX_ATTACHMENT_BYTES = 18 * 1024 * 1024
+# Holdings CSVs too large to attach are saved here instead
+REPORTS_PATH = os.path.join(os.getcwd(), "reports")
+# The compressed CSV is built in memory up to this size, then in a temporary file
+CSV_SPOOL_BYTES = 1024 * 1024
+
+def _format_currency(value):
+    try:
+        return f"${float(value):,.2f}"
+    except (ValueError, TypeError):
+        return f"{value}"
+
+def _holding_fields(index, holding):
+    pct_fund = holding.get('percentage_of_fund', 0)
+    try:
+        percentage_of_fund = f"{float(pct_fund):.4f}%"
+    except (ValueError, TypeError):
+        percentage_of_fund = f"{pct_fund}%"
+
+    ownership_pct = holding.get('percentage_of_company_owned_by_fund', 'N/A')
+    outstanding_shares = holding.get('total_outstanding_shares', 'N/A')
+    name = holding.get('name', 'N/A')
+    if holding.get('issuer_securities_count', 0) > 1:
+        # Issuer-level row: list the securities it combines
+        name = f"{name} [{holding['issuer_securities']}]"
+    if holding.get('held_via'):
+        name = f"{name} (via {holding['held_via']})"
+    return {
+        'index': index,
+        'name': name,
+        'cusip': holding.get('cusip', 'N/A'),
+        'ticker': holding.get('ticker', 'N/A'),
+        'shares': holding.get('shares_held_by_fund_str', 'N/A'),
+        'market_value': _format_currency(holding.get('market_value_in_fund', 0)),
+        'percentage_of_fund': percentage_of_fund,
+        'ownership_pct': f"{ownership_pct:.6f}%" if isinstance(ownership_pct, float) else f"{ownership_pct}",
+        'outstanding_shares': f"{outstanding_shares:,}" if isinstance(outstanding_shares, int) else f"{outstanding_shares}",
+    }
+
+def _allocation_sections(analysis_result):
+    """
+    (title, groups) for each allocation dimension worth showing, groups capped at
+    MAX_ALLOCATION_GROUPS_IN_REPORT. A dimension where nothing was classified is left out.
+    """
+    allocations = analysis_result.get('allocations') or {}
+    for dimension, title in ALLOCATION_SECTIONS:
+        groups = allocations.get(dimension) or []
+        if not groups or all(group['group'] == allocation.UNCLASSIFIED for group in groups):
+            continue
+        yield title, groups[:MAX_ALLOCATION_GROUPS_IN_REPORT]
+
+def _changes_text(analysis_result):
+    changes = analysis_result.get('changes')
+    if not changes:
+        return None
+    return (f"Changes since {changes['previous_accession']}: {len(changes['added'])} new, "
+            f"{len(changes['changed'])} materially changed, {len(changes['removed'])} removed; "
+            f"{changes['carried_forward_count']} ownership lookups carried forward")
+
+def _change_lines(analysis_result):
+    """(label, name) for the first MAX_CHANGES_IN_REPORT new, changed and removed positions."""
+    changes = analysis_result['changes']
+    for label, key in (("New", 'added'), ("Changed", 'changed'), ("Removed", 'removed')):
+        for entry in changes[key][:MAX_CHANGES_IN_REPORT]:
+            name = entry.get('name') or 'N/A'
+            if key == 'changed':
+                name = f"{name} ({entry.get('previous_shares')} -> {entry.get('shares')} shares)"
+            yield label, name
+
+def _coverage_text(analysis_result):
+    if analysis_result.get('ownership_coverage_pct') is None:
+        return None
+    coverage = f"Ownership computed for {analysis_result['ownership_coverage_pct']:.0f}% of analyzed assets"
+    if analysis_result.get('lookup_budget_exhausted'):
+        coverage += f" (partial result: lookup budget exhausted - {analysis_result['lookup_budget_exhausted']})"
+    return coverage
+
+def _selection_criteria(selected_holdings, detailed_holdings, min_company_ownership_pct):
+    criteria = f"Top {len(selected_holdings)} of {len(detailed_holdings)} holdings by market value"
+    if min_company_ownership_pct is not None:
+        criteria += f" with at least {min_company_ownership_pct}% of the company owned by the fund"
+    return criteria
+
+def _analysis_failed(analysis_result):
+    return (not analysis_result or analysis_result.get('status', '').startswith("Parsing failed")
+            or analysis_result.get('status', '').startswith("Download failed"))
+
+def format_data_for_email(analysis_result, max_holdings=MAX_HOLDINGS_IN_EMAIL, min_company_ownership_pct=None,
+                          attachment_note=None):
     """
     Formats the fund analysis result into a human-readable string for email.
+    Only the largest max_holdings positions by market value are listed. attachment_note says where
+    the full holdings list is (see build_report_message); without it the report does not mention one.
     """
-    if not analysis_result or analysis_result.get('status', '').startswith("Parsing failed") or analysis_result.get('status', '').startswith("Download failed"):
+    if _analysis_failed(analysis_result):
         return f"Fund analysis could not be completed. Status: {analysis_result.get('status', 'Unknown error')}"
 
-    report_lines = []
-    report_lines.append(f"Fund Analysis Report")
-    report_lines.append("======================")
+    out = io.StringIO()
+    out.write("Fund Analysis Report\n")
+    out.write("======================\n")
 
     if analysis_result.get('fund_name'):
-        report_lines.append(f"Fund Name: {analysis_result['fund_name']}")
-    report_lines.append(f"Fund CIK: {analysis_result.get('fund_cik', 'N/A')}")
+        out.write(f"Fund Name: {analysis_result['fund_name']}\n")
+    out.write(f"Fund CIK: {analysis_result.get('fund_cik', 'N/A')}\n")
     if analysis_result.get('total_net_assets') is not None: # Check specifically for None
         try:
-            report_lines.append(f"Total Net Assets: ${float(analysis_result['total_net_assets']):,.2f}")
+            out.write(f"Total Net Assets: ${float(analysis_result['total_net_assets']):,.2f}\n")
         except (ValueError, TypeError):
-            report_lines.append(f"Total Net Assets: {analysis_result['total_net_assets']} (Could not format as currency)")
+            out.write(f"Total Net Assets: {analysis_result['total_net_assets']} (Could not format as currency)\n")
     else:
-        report_lines.append(f"Total Net Assets: N/A")
+        out.write("Total Net Assets: N/A\n")
 
-    report_lines.append(f"Total Holdings Parsed: {analysis_result.get('holdings_count', 0)}")
-    report_lines.append(f"Holdings Processed for Company Ownership: {analysis_result.get('holdings_processed_for_company_ownership', 0)}")
-    report_lines.append("\n--- Holdings Details ---")
+    out.write(f"Total Holdings Parsed: {analysis_result.get('holdings_count', 0)}\n")
+    if analysis_result.get('look_through'):
+        stats = analysis_result['look_through']
+        out.write(f"Fund Positions Looked Through: {stats['expanded']} of {stats['fund_positions']} ({stats['funds_loaded']} underlying funds parsed)\n")
+    if analysis_result.get('issuers_count'):
+        out.write(f"Issuers (holdings grouped by LEI / CUSIP prefix): {analysis_result['issuers_count']}\n")
+    out.write(f"Holdings Processed for Company Ownership: {analysis_result.get('holdings_processed_for_company_ownership', 0)}\n")
+    if analysis_result.get('holdings_resolved_offline'):
+        out.write(f"Holdings Resolved Offline (SEC XBRL): {analysis_result['holdings_resolved_offline']}\n")
+    coverage = _coverage_text(analysis_result)
+    if coverage:
+        out.write(coverage + "\n")
+    changes_text = _changes_text(analysis_result)
+    if changes_text:
+        out.write(f"\n--- {changes_text} ---\n")
+        for label, name in _change_lines(analysis_result):
+            out.write(f"{label}: {name}\n")
+    for title, groups in _allocation_sections(analysis_result):
+        out.write(f"\n--- Allocation by {title} ---\n")
+        for group in groups:
+            out.write(f"{group['group']}: {group['weight_pct']:.2f}% ({_format_currency(group['market_value_usd'])}, "
+                      f"{group['holdings_count']} holdings)\n")
+    out.write("\n--- Holdings Details ---\n")
 
     detailed_holdings = analysis_result.get('detailed_holdings', [])
     if not detailed_holdings:
-        report_lines.append("No detailed holdings information available.")
+        out.write("No detailed holdings information available.\n")
 
-    for i, holding in enumerate(detailed_holdings[:20]): # Limit to first 20 for brevity in email
-        report_lines.append(f"\n{i+1}. Name: {holding.get('name', 'N/A')}")
-        report_lines.append(f"   CUSIP: {holding.get('cusip', 'N/A')}, Ticker: {holding.get('ticker', 'N/A')}")
-        report_lines.append(f"   Shares/Principal Held by Fund: {holding.get('shares_held_by_fund_str', 'N/A')}")
+    selected_holdings = select_holdings_for_report(detailed_holdings, max_holdings, min_company_ownership_pct)
+    if detailed_holdings:
+        out.write(_selection_criteria(selected_holdings, detailed_holdings, min_company_ownership_pct) + ":\n")
 
-        market_val = holding.get('market_value_in_fund', 0)
-        try:
-            report_lines.append(f"   Market Value in Fund: ${float(market_val):,.2f}")
-        except (ValueError, TypeError):
-            report_lines.append(f"   Market Value in Fund: {market_val}")
+    for i, holding in enumerate(selected_holdings):
+        out.write(_TEXT_HOLDING_TEMPLATE.substitute(_holding_fields(i + 1, holding)))
 
-        pct_fund = holding.get('percentage_of_fund', 0)
-        try:
-            report_lines.append(f"   Percentage of Fund Assets: {float(pct_fund):.4f}%")
-        except (ValueError, TypeError):
-            report_lines.append(f"   Percentage of Fund Assets: {pct_fund}%")
-
-        ownership_pct = holding.get('percentage_of_company_owned_by_fund', 'N/A')
-        if isinstance(ownership_pct, float):
-            report_lines.append(f"   Percentage of Company Owned by Fund: {ownership_pct:.6f}%")
-        else:
-            report_lines.append(f"   Percentage of Company Owned by Fund: {ownership_pct}")
-
-        outstanding_shares = holding.get('total_outstanding_shares', 'N/A')
-        if isinstance(outstanding_shares, int):
-             report_lines.append(f"   Total Outstanding Shares of Company: {outstanding_shares:,}")
-        else:
-            report_lines.append(f"   Total Outstanding Shares of Company: {outstanding_shares}")
-
-    report_lines.append("\n\nNote: This report may be truncated for brevity if many holdings exist.")
-    report_lines.append("Full data might be available in logs or a more detailed output.")
+    out.write("\n\nNote: This report may be truncated for brevity if many holdings exist.")
+    if attachment_note:
+        out.write("\n" + attachment_note)
+    return out.getvalue()
+
+def render_html_report(analysis_result, out, max_holdings=MAX_HOLDINGS_IN_EMAIL, min_company_ownership_pct=None,
+                       attachment_note=None):
+    """
+    Streams an HTML summary of the analysis into the writable text stream `out`.
+    """
+    detailed_holdings = analysis_result.get('detailed_holdings', [])
+    selected_holdings = select_holdings_for_report(detailed_holdings, max_holdings, min_company_ownership_pct)
+
+    total_net_assets = analysis_result.get('total_net_assets')
+    out.write(_HTML_HEADER_TEMPLATE.substitute(
+        fund_name=html.escape(str(analysis_result.get('fund_name') or 'N/A')),
+        fund_cik=html.escape(str(analysis_result.get('fund_cik', 'N/A'))),
+        total_net_assets=html.escape(_format_currency(total_net_assets) if total_net_assets is not None else 'N/A'),
+        holdings_count=analysis_result.get('holdings_count', 0),
+        holdings_processed=analysis_result.get('holdings_processed_for_company_ownership', 0),
+        coverage=html.escape(_coverage_text(analysis_result) or 'N/A'),
+        criteria=html.escape(_selection_criteria(selected_holdings, detailed_holdings, min_company_ownership_pct)),
+    ))
+    for i, holding in enumerate(selected_holdings):
+        fields = _holding_fields(i + 1, holding)
+        out.write(_HTML_ROW_TEMPLATE.substitute({key: html.escape(str(value)) for key, value in fields.items()}))
+    out.write("</table>\n")
+    changes_text = _changes_text(analysis_result)
+    if changes_text:
+        out.write(f"<h3>{html.escape(changes_text)}</h3>\n<ul>\n")
+        for label, name in _change_lines(analysis_result):
+            out.write(f"<li>{html.escape(label)}: {html.escape(str(name))}</li>\n")
+        out.write("</ul>\n")
+    for title, groups in _allocation_sections(analysis_result):
+        out.write(_HTML_ALLOCATION_HEADER_TEMPLATE.substitute(dimension=html.escape(title)))
+        for group in groups:
+            out.write(_HTML_ALLOCATION_ROW_TEMPLATE.substitute(
+                group=html.escape(group['group']), weight_pct=f"{group['weight_pct']:.2f}%",
+                market_value=html.escape(_format_currency(group['market_value_usd'])), holdings_count=group['holdings_count']))
+        out.write("</table>\n")
+    out.write(_HTML_FOOTER_TEMPLATE.substitute(
+        footer=html.escape(attachment_note or f"{len(detailed_holdings)} holdings analyzed.")))
+
+def write_holdings_csv_gz(detailed_holdings, fileobj):
+    """
+    Writes every analyzed holding as gzip-compressed CSV into the binary stream `fileobj`.
+    """
+    with gzip.GzipFile(fileobj=fileobj, mode='wb') as gz:
+        with io.TextIOWrapper(gz, encoding='utf-8', newline='') as text_stream:
+            writer = csv.DictWriter(text_stream, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(detailed_holdings)
+
+def _save_holdings_csv_gz(analysis_result, csv_file):
+    """Saves a holdings CSV that could not be attached. Returns its path, or None if it could not be written."""
+    path = os.path.join(REPORTS_PATH, f"holdings_{analysis_result.get('fund_cik', 'fund')}.csv.gz")
+    try:
+        if not os.path.exists(REPORTS_PATH):
+            os.makedirs(REPORTS_PATH)
+        csv_file.seek(0)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(csv_file, f, 1024 * 1024)
+    except OSError as e:
+        print(f"Warning: Could not save holdings CSV to {path}: {e}")
+        return None
+    return path
+
+def build_report_message(recipient_email, subject, analysis_result, max_holdings=MAX_HOLDINGS_IN_EMAIL,
+                         min_company_ownership_pct=None):
+    """
+    Builds the report email: plain-text and HTML alternatives plus the full holdings as a .csv.gz attachment.
+    A CSV too large for Gmail is saved under REPORTS_PATH instead, and the report says so.
+    """
+    message = MIMEMultipart('mixed')
+    message['to'] = recipient_email
+    message['subject'] = subject
+
+    attachment = None
+    attachment_note = None
+    detailed_holdings = analysis_result.get('detailed_holdings') if analysis_result else None
+    if detailed_holdings:
+        # Compressed straight into a spooled file: an oversized CSV goes to disk, not into memory
+        with tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_BYTES) as csv_file:
+            write_holdings_csv_gz(detailed_holdings, csv_file)
+            csv_bytes = csv_file.tell()
+            if csv_bytes > GMAIL_MAX_ATTACHMENT_BYTES:
+                print(f"Warning: Holdings CSV is {csv_bytes:,} bytes compressed, too large to attach. Sending summary only.")
+                saved_path = _save_holdings_csv_gz(analysis_result, csv_file)
+                attachment_note = f"The full holdings list ({len(detailed_holdings)} holdings) was too large to attach and was omitted"
+                attachment_note += f"; it was saved to {saved_path}." if saved_path else "; it could not be saved locally either."
+            else:
+                csv_file.seek(0)
+                attachment = MIMEApplication(csv_file.read(), 'gzip')
+                filename = f"holdings_{analysis_result.get('fund_cik', 'fund')}.csv.gz"
+                attachment.add_header('Content-Disposition', 'attachment', filename=filename)
+                attachment_note = f"All {len(detailed_holdings)} holdings are in the attached compressed CSV ({filename})."
+
+    body = MIMEMultipart('alternative')
+    body.attach(MIMEText(format_data_for_email(analysis_result, max_holdings, min_company_ownership_pct, attachment_note),
+                         'plain', 'utf-8'))
+    if not _analysis_failed(analysis_result):
+        html_buffer = io.StringIO()
+        render_html_report(analysis_result, html_buffer, max_holdings, min_company_ownership_pct, attachment_note)
+        body.attach(MIMEText(html_buffer.getvalue(), 'html', 'utf-8'))
+    message.attach(body)
+    if attachment is not None:
+        message.attach(attachment)
+    return message
+
+def format_holders_for_email(lookup_result):
+    """
+    Formats a reverse-lookup result (funds holding one security) into a human-readable string.
+    """
+    if not lookup_result or not (lookup_result.get('holders') or lookup_result.get('other_holdings')):
+        return f"No funds found holding {lookup_result.get('security', 'N/A')}. Status: {lookup_result.get('status', 'Unknown error')}"
+
+    report_lines = []
+    report_lines.append(f"Fund Holders Report: {lookup_result.get('security')}")
+    report_lines.append("======================")
+    if lookup_result.get('security_name'):
+        report_lines.append(f"Security Name: {lookup_result['security_name']}")
+    report_lines.append(f"Funds Holding: {lookup_result.get('fund_count', 0)}")
+    report_lines.append(f"Total Shares Held by Funds: {lookup_result.get('total_shares_held', 0):,.2f}")
+    report_lines.append(f"Total Market Value Held by Funds: ${lookup_result.get('total_value_usd', 0):,.2f}")
+
+    outstanding_shares = lookup_result.get('total_outstanding_shares', 'N/A')
+    if isinstance(outstanding_shares, int):
+        report_lines.append(f"Total Outstanding Shares of Company: {outstanding_shares:,}")
+    else:
+        report_lines.append(f"Total Outstanding Shares of Company: {outstanding_shares}")
+
+    ownership_pct = lookup_result.get('percentage_of_company_owned_by_funds', 'N/A')
+    if isinstance(ownership_pct, float):
+        report_lines.append(f"Percentage of Company Owned by These Funds: {ownership_pct:.6f}%")
+    else:
+        report_lines.append(f"Percentage of Company Owned by These Funds: {ownership_pct}")
+
+    report_lines.append("\n--- Holders ---")
+    for i, holder in enumerate(lookup_result['holders']):
+        report_lines.append(f"\n{i+1}. Fund: {holder.get('fund_name') or 'N/A'} (CIK: {holder.get('fund_cik')}, Series: {holder.get('series_id') or 'N/A'})")
+        report_lines.append(f"   Accession: {holder.get('accession')}, Report Date: {holder.get('report_date') or 'N/A'}")
+        report_lines.append(f"   Shares Held: {holder.get('balance', 0):,.2f}")
+        report_lines.append(f"   Market Value: ${holder.get('market_value_usd', 0):,.2f}")
+        holder_pct = holder.get('percentage_of_company_owned_by_fund')
+        if isinstance(holder_pct, float):
+            report_lines.append(f"   Percentage of Company Owned by Fund: {holder_pct:.6f}%")
+
+    other_holdings = lookup_result.get('other_holdings') or []
+    if other_holdings:
+        report_lines.append("\n--- Positions Not Held in Shares (not counted above) ---")
+        for i, holding in enumerate(other_holdings):
+            report_lines.append(f"\n{i+1}. Fund: {holding.get('fund_name') or 'N/A'} (CIK: {holding.get('fund_cik')}, Series: {holding.get('series_id') or 'N/A'})")
+            report_lines.append(f"   Accession: {holding.get('accession')}, Report Date: {holding.get('report_date') or 'N/A'}")
+            report_lines.append(f"   Balance: {holding.get('balance', 0):,.2f} ({holding.get('units') or 'units not recorded'})")
+            report_lines.append(f"   Market Value: ${holding.get('market_value_usd', 0):,.2f}")
+    return "\n".join(report_lines)
+
+def format_similar_funds_for_email(similarity_result):
+    """
+    Formats a similarity search result (funds whose holdings resemble one fund's) into a human-readable string.
+    """
+    if not similarity_result or not similarity_result.get('similar_funds'):
+        return f"No similar funds found for {similarity_result.get('fund', 'N/A')}. Status: {similarity_result.get('status', 'Unknown error')}"
+
+    report_lines = []
+    report_lines.append(f"Similar Funds Report: {similarity_result.get('fund_name') or similarity_result.get('fund')}")
+    report_lines.append("======================")
+    for i, similar in enumerate(similarity_result['similar_funds']):
+        report_lines.append(f"\n{i+1}. Fund: {similar.get('fund_name') or 'N/A'} (CIK: {similar.get('fund_cik')}, Series: {similar.get('series_id') or 'N/A'})")
+        report_lines.append(f"   Accession: {similar.get('accession')}, Report Date: {similar.get('report_date') or 'N/A'}, Holdings: {similar.get('holdings_count')}")
+        if similar.get('weight_overlap_pct') is not None:
+            report_lines.append(f"   Portfolio Overlap by Weight: {similar['weight_overlap_pct']:.2f}%")
+        report_lines.append(f"   Estimated Holdings Similarity (Jaccard): {similar['estimated_jaccard']:.2f}")
     return "\n".join(report_lines)
 
 def gmail_authenticate():
@@ -106,20 +445,21 @@ def gmail_authenticate():
                 token.write(creds.to_json())
     return creds
 
-def send_email_report(recipient_email, subject, report_content_str):
+def send_message(message):
+    """
+    Sends an already-built MIME message (with 'to' and 'subject' set) through the Gmail API.
+    """
+    recipient_email = message['to']
     creds = gmail_authenticate()
     if not creds:
         print("Could not authenticate with Gmail. Email not sent.")
         return False
     try:
         service = build('gmail', 'v1', credentials=creds)
-        message = MIMEText(report_content_str)
-        message['to'] = recipient_email
-        message['subject'] = subject
         encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
         create_message = {'raw': encoded_message}
-        send_message = service.users().messages().send(userId="me", body=create_message).execute()
-        print(f"Sent message to {recipient_email}, Message Id: {send_message['id']}")
+        sent_message = service.users().messages().send(userId="me", body=create_message).execute()
+        print(f"Sent message to {recipient_email}, Message Id: {sent_message['id']}")
         return True
     except HttpError as error:
         print(f'An HTTP error occurred while sending email: {error}')
@@ -130,6 +470,20 @@ def send_email_report(recipient_email, subject, report_content_str):
         print(f"An unexpected error occurred while sending email: {e}")
         return False
 
+def send_email_report(recipient_email, subject, report_content_str):
+    message = MIMEText(report_content_str)
+    message['to'] = recipient_email
+    message['subject'] = subject
+    return send_message(message)
+
+def send_analysis_report(recipient_email, subject, analysis_result, min_company_ownership_pct=None):
+    """
+    Sends the full report: HTML and text summary with the compressed holdings CSV attached.
+    """
+    message = build_report_message(recipient_email, subject, analysis_result,
+                                   min_company_ownership_pct=min_company_ownership_pct)
+    return send_message(message)
+
 if __name__ == '__main__':
     print("--- Testing report_generator.py ---")
     dummy_analysis_result = {
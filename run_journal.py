@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import secrets
+from datetime import datetime
+
+# Append-only JSONL journal of one analysis run, so an interrupted run (quota exhausted, crash,
+# Ctrl-C) can be resumed without downloading, parsing or paying for the same lookup twice.
+# One file per run: runs/<run-id>.jsonl. Each line is one record:
+#   {"type": "run_started", "fund": ..., "options": {...}}
+#   {"type": "stage", "stage": "download" | "parse", ...stage output...}
+#   {"type": "lookup", "cusip": ..., "ticker": ..., "total_outstanding_shares": ..., "source": ...}
+#   {"type": "run_completed", "status": ...}
+RUNS_PATH = os.path.join(os.getcwd(), "runs")
+# Records are flushed to the OS as they are written; fsync after this many lookups and after every stage
+CHECKPOINT_INTERVAL = 25
+
+def new_run_id():
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+
+def _lookup_key(cusip, ticker):
+    return f"{(cusip or '').strip().upper()}|{(ticker or '').strip().upper()}"
+
+class RunJournal:
+    """
+    Replays an existing journal on open and appends new records to it.
+    Use RunJournal.start() for a new run and RunJournal.resume() to continue one.
+    """
+    def __init__(self, run_id, runs_path=None):
+        self.run_id = run_id
+        self.runs_path = runs_path or RUNS_PATH
+        self.path = os.path.join(self.runs_path, f"{run_id}.jsonl")
+        self.fund = None
+        self.options = {}
+        self.stages = {}
+        self.lookups = {}
+        self.completed_status = None
+        self._file = None
+        self._unsynced_records = 0
+        if os.path.exists(self.path):
+            self._replay()
+
+    @classmethod
+    def start(cls, fund, options=None, runs_path=None):
+        journal = cls(new_run_id(), runs_path)
+        journal.fund = fund
+        journal.options = dict(options or {})
+        journal._append({'type': 'run_started', 'fund': fund, 'options': journal.options}, sync=True)
+        return journal
+
+    @classmethod
+    def resume(cls, run_id, runs_path=None):
+        """Opens the journal of an earlier run, or returns None if there is no such run."""
+        journal = cls(run_id, runs_path)
+        if journal.fund is None:
+            print(f"No journal found for run {run_id} in {journal.runs_path}.")
+            return None
+        print(f"Resuming run {run_id} for {journal.fund}: {len(journal.stages)} stage(s) and "
+              f"{len(journal.lookups)} lookup(s) already checkpointed.")
+        return journal
+
+    def _replay(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash can leave a torn last line; everything before it is still valid
+                    print(f"Warning: Ignoring unreadable journal line {line_number} in {self.path}")
+                    continue
+                record_type = record.get('type')
+                if record_type == 'run_started':
+                    self.fund = record.get('fund')
+                    self.options = record.get('options') or {}
+                elif record_type == 'stage':
+                    self.stages[record.get('stage')] = record
+                elif record_type == 'lookup':
+                    self.lookups[_lookup_key(record.get('cusip'), record.get('ticker'))] = record
+                elif record_type == 'run_completed':
+                    self.completed_status = record.get('status')
+
+    def _append(self, record, sync=False):
+        if self._file is None:
+            if not os.path.exists(self.runs_path):
+                os.makedirs(self.runs_path)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        record['time'] = time.time()
+        self._file.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self._file.flush()
+        self._unsynced_records += 1
+        if sync or self._unsynced_records >= CHECKPOINT_INTERVAL:
+            os.fsync(self._file.fileno())
+            self._unsynced_records = 0
+
+    def record_stage(self, stage, **stage_output):
+        record = dict(stage_output, type='stage', stage=stage)
+        self.stages[stage] = record
+        self._append(record, sync=True)
+
+    def stage(self, stage):
+        """The checkpointed output of a stage, or None if it has not completed in this run."""
+        return self.stages.get(stage)
+
+    def record_lookup(self, cusip, ticker, total_outstanding_shares, source):
+        record = {'type': 'lookup', 'cusip': cusip, 'ticker': ticker,
+                  'total_outstanding_shares': total_outstanding_shares, 'source': source}
+        self.lookups[_lookup_key(cusip, ticker)] = record
+        self._append(record)
+
+    def lookup_result(self, cusip, ticker):
+        """(total_outstanding_shares, source) checkpointed for this security, or None."""
+        record = self.lookups.get(_lookup_key(cusip, ticker))
+        return (record['total_outstanding_shares'], record.get('source')) if record else None
+
+    def record_completed(self, status):
+        self.completed_status = status
+        self._append({'type': 'run_completed', 'status': status}, sync=True)
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
@@ -0,0 +1,203 @@
+import re
+from html.parser import HTMLParser
+
+import filing_store
+import symbol_table
+
+# Schedules of investments published as documents rather than N-PORT XML: NPORT-EX exhibits and
+# legacy N-Q filings, as HTML tables or as plain (often <PRE>-formatted) text. Documents are read in
+# fixed-size chunks and each table row or text line becomes a holding record as soon as it is
+# complete, so memory stays flat however long the schedule is.
+# Schedules give names, quantities and values only: their holdings have no CUSIP or ticker, so they
+# cannot be looked up for shares outstanding and are left out of the holdings and similarity indexes.
+# Their weight in the fund needs the schedule's closing "Net Assets" line, so holdings streamed
+# with iter_schedule_holdings carry no percentage_of_fund; parse_schedule_document fills it in.
+HTML_SCHEDULE = 'html_schedule'
+TEXT_SCHEDULE = 'text_schedule'
+SCHEDULE_FORMATS = (HTML_SCHEDULE, TEXT_SCHEDULE)
+READ_CHUNK_CHARS = 64 * 1024
+
+# Column headings that mark the start of a schedule and which number is the quantity held
+_QUANTITY_HEADINGS = ('shares', 'principal', 'face amount', 'par value', 'contracts')
+_VALUE_HEADING = 'value'
+_THOUSANDS_HINTS = ('thousands', '$000', '(000)', '000s')
+_NUMBER_PATTERN = re.compile(r'\d+(\.\d+)?|\.\d+')
+_FOOTNOTE_MARKERS = re.compile(r'(\s*(\*|†|‡|\^|\(\w\)|•))+$')
+_TEXT_COLUMN_GAP = re.compile(r'\s{2,}|\t')
+
+def _parse_number(text):
+    """'$ 1,234' -> 1234.0, '(5.5)' -> -5.5; None for anything that is not a plain number."""
+    text = text.replace('$', '').replace(',', '').replace(' ', '')
+    negative = text.startswith('(') and text.endswith(')')
+    text = text.strip('()')
+    if text.startswith('-'):
+        negative, text = True, text[1:]
+    if not _NUMBER_PATTERN.fullmatch(text):
+        return None
+    return -float(text) if negative else float(text)
+
+def _format_quantity(quantity):
+    # Quantities are kept as strings, like shares_or_principal_amount from N-PORT
+    return str(int(quantity)) if quantity.is_integer() else str(quantity)
+
+class _ScheduleRows:
+    """
+    Turns schedule rows (lists of cell texts) into holding records. Rows are only read as holdings
+    after a heading row naming a value column, which also tells whether values are in thousands.
+    A "Net Assets" row sets total_net_assets in filing_metadata.
+    """
+    def __init__(self, filing_metadata):
+        self.filing_metadata = filing_metadata
+        self.header_seen = False
+        self.quantity_first = True
+        self.value_scale = 1.0
+
+    def add(self, cells):
+        cells = [text for text in (' '.join(cell.split()) for cell in cells) if text and text not in ('$', '%')]
+        if not cells:
+            return None
+        numbers = [number for number in (_parse_number(cell) for cell in cells[1:]) if number is not None]
+        if not any(numbers):
+            self._read_heading(' '.join(cells).lower())
+            return None
+        name = _FOOTNOTE_MARKERS.sub('', cells[0])
+        if not self.header_seen or _parse_number(name) is not None or not any(c.isalpha() for c in name):
+            return None
+        lowered_name = name.lower()
+        if lowered_name.startswith('net assets'):
+            self.filing_metadata['total_net_assets'] = numbers[-1] * self.value_scale
+            return None
+        if lowered_name.startswith('total'):
+            return None
+
+        holding_data = {'name': symbol_table.HOLDING_SYMBOLS.intern(name)}
+        if len(numbers) >= 2:
+            quantity, value = (numbers[0], numbers[-1]) if self.quantity_first else (numbers[-1], numbers[0])
+            holding_data['shares_or_principal_amount'] = _format_quantity(quantity)
+        else:
+            value = numbers[0]
+        holding_data['market_value_usd'] = value * self.value_scale
+        return holding_data
+
+    def _read_heading(self, text):
+        if any(hint in text for hint in _THOUSANDS_HINTS):
+            self.value_scale = 1000.0
+        if _VALUE_HEADING in text:
+            quantity_positions = [text.find(heading) for heading in _QUANTITY_HEADINGS if heading in text]
+            self.header_seen = True
+            self.quantity_first = not quantity_positions or min(quantity_positions) < text.find(_VALUE_HEADING)
+
+def _split_text_line(line):
+    # Plain-text schedules separate columns with runs of spaces; names keep their single spaces
+    return _TEXT_COLUMN_GAP.split(line.strip())
+
+class _ScheduleTableParser(HTMLParser):
+    """Collects completed table rows, and <PRE> lines split into columns, as lists of cell texts."""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._row = None
+        self._cell = None
+        self._pre_text = None
+
+    def _close_cell(self):
+        if self._cell is not None and self._row is not None:
+            self._row.append(''.join(self._cell))
+        self._cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        if self._row:
+            self.rows.append(self._row)
+        self._row = None
+
+    def _flush_pre_lines(self, final=False):
+        *lines, self._pre_text = self._pre_text.split('\n')
+        if final:
+            lines.append(self._pre_text)
+            self._pre_text = None
+        self.rows.extend(_split_text_line(line) for line in lines if line.strip())
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._close_row()
+            self._row = []
+        elif tag in ('td', 'th'):
+            self._close_cell() # Cells are not always closed explicitly
+            self._cell = []
+        elif tag in ('br', 'p', 'div') and self._cell is not None:
+            self._cell.append(' ')
+        elif tag == 'pre':
+            self._pre_text = ''
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th'):
+            self._close_cell()
+        elif tag in ('tr', 'table'):
+            self._close_row()
+        elif tag == 'pre' and self._pre_text is not None:
+            self._flush_pre_lines(final=True)
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+        elif self._pre_text is not None:
+            self._pre_text += data
+            if '\n' in data:
+                self._flush_pre_lines()
+
+    def pop_rows(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+def _iter_schedule_rows(document_path, document_format):
+    with filing_store.open_document(document_path) as f:
+        if document_format == TEXT_SCHEDULE:
+            for line in f:
+                if not line.lstrip().startswith('<'): # SGML wrapper lines of a full submission
+                    yield _split_text_line(line)
+            return
+        parser = _ScheduleTableParser()
+        while True:
+            chunk = f.read(READ_CHUNK_CHARS)
+            if chunk:
+                parser.feed(chunk)
+            else:
+                parser.close()
+            yield from parser.pop_rows()
+            if not chunk:
+                return
+
+def iter_schedule_holdings(document_path, document_format, filing_metadata=None):
+    """
+    Streams holdings from an HTML or plain-text schedule of investments (document_format is
+    HTML_SCHEDULE or TEXT_SCHEDULE). Records carry name, market_value_usd (in dollars) and, where the
+    schedule has a quantity column, shares_or_principal_amount. There is no CUSIP, ticker or
+    percentage_of_fund: net assets are only known once the stream is exhausted.
+    """
+    if filing_metadata is None:
+        filing_metadata = {}
+    rows = _ScheduleRows(filing_metadata)
+    for cells in _iter_schedule_rows(document_path, document_format):
+        holding_data = rows.add(cells)
+        if holding_data:
+            yield holding_data
+
+def parse_schedule_document(document_path, document_format, filing_metadata):
+    """
+    Parses a whole schedule of investments. Returns (fund_name, total_net_assets, holdings) like
+    sec_parser.parse_nport_xml_filing; percentage_of_fund is filled in when the schedule states its
+    net assets. The fund name comes from filing_metadata (the submission header).
+    """
+    try:
+        holdings = list(iter_schedule_holdings(document_path, document_format, filing_metadata))
+    except Exception as e:
+        print(f"An error occurred while parsing the schedule of investments in {document_path}: {e}")
+        return None, None, None
+    total_net_assets = filing_metadata.get('total_net_assets')
+    if total_net_assets:
+        for holding_data in holdings:
+            holding_data['percentage_of_fund'] = holding_data['market_value_usd'] / total_net_assets * 100
+    if not holdings:
+        print(f"Warning: No holdings found in the schedule of investments in {document_path}.")
+    return filing_metadata.get('fund_name'), total_net_assets, holdings
@@ -1,8 +1,15 @@
 import os
+import requests
 import xml.etree.ElementTree as ET
 from sec_edgar_downloader import Downloader
-from datetime import date
+from datetime import date, timedelta
 import glob # For finding files
+import holdings_index
+import fund_similarity
+import filing_store
+import edgar_index
+import schedule_parser
+import symbol_table
 
 # Initialize downloader
 COMPANY_NAME_FOR_EDGAR = "My Financial Analysis Tool"
@@ -14,14 +21,83 @@ if not os.path.exists(DOWNLOAD_PATH):
 
 dl = Downloader(COMPANY_NAME_FOR_EDGAR, EMAIL_FOR_EDGAR, DOWNLOAD_PATH)
 
+# Every successfully parsed filing is added to the reverse-lookup index (see holdings_index.py)
+# and, with UPDATE_SIMILARITY_INDEX, sketched into the fund similarity index (see fund_similarity.py).
+UPDATE_HOLDINGS_INDEX = True
+UPDATE_SIMILARITY_INDEX = True
+# Downloads are compressed and kept under a size cap by the filing store (see filing_store.py).
+MANAGE_FILING_STORE = True
+# When a local EDGAR full-index exists (see edgar_index.py), filings are located there and fetched
+# by accession URL instead of asking the downloader for each form type in turn.
+USE_EDGAR_INDEX = True
+EDGAR_REQUEST_TIMEOUT_SECONDS = 60
+
+def _ingest_into_filing_store(accession_dir):
+    if MANAGE_FILING_STORE:
+        try:
+            filing_store.get_filing_store().ingest(accession_dir)
+        except Exception as e:
+            print(f"Warning: Could not compress downloaded filing in {accession_dir}: {e}")
+
+def download_filing_from_index(filing):
+    """
+    Fetches one filing found in the local EDGAR index straight from its archive URL, into the same
+    CIK/FILING_TYPE/ACCESSION layout the downloader uses. Skips the request if the filing is already stored.
+    Returns the filing type directory, or None if the download failed.
+    """
+    filing_directory_path = os.path.join(DOWNLOAD_PATH, 'sec-edgar-filings', filing['cik'], filing['form_type'])
+    accession_dir = os.path.join(filing_directory_path, filing['accession'])
+    document_path = os.path.join(accession_dir, "full-submission.txt")
+    if filing_store.resolve_document(document_path):
+        print(f"Filing {filing['accession']} is already stored locally.")
+        return filing_directory_path
+
+    print(f"Downloading {filing['form_type']} {filing['accession']} from {filing['url']}")
+    try:
+        response = requests.get(filing['url'], headers={'User-Agent': f"{COMPANY_NAME_FOR_EDGAR} {EMAIL_FOR_EDGAR}"},
+                                timeout=EDGAR_REQUEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Error downloading {filing['url']}: {e}")
+        return None
+
+    if not os.path.exists(accession_dir):
+        os.makedirs(accession_dir)
+    with open(document_path, 'wb') as f:
+        f.write(response.content)
+    _ingest_into_filing_store(accession_dir)
+    return filing_directory_path
+
 def download_latest_fund_holding_filing(fund_cik):
     """
     Downloads the latest NPORT-P, NPORT-EX, or N-Q filing for a given fund CIK.
     Returns the path to the specific downloaded filing directory or None.
     """
-    print(f"Attempting to download filings for CIK: {fund_cik}")
     # Define filing types in order of preference
-    filing_types_to_try = ["NPORT-P", "NPORT-EX", "N-Q"]
+    return _download_latest_filing(fund_cik, ["NPORT-P", "NPORT-EX", "N-Q"])
+
+def download_latest_13f_filing(manager_cik):
+    """
+    Downloads the latest 13F-HR filing (institutional manager holdings) for a given manager CIK.
+    Returns the path to the specific downloaded filing directory or None.
+    """
+    return _download_latest_filing(manager_cik, ["13F-HR"])
+
+def _download_latest_filing(fund_cik, filing_types_to_try):
+    print(f"Attempting to download filings for CIK: {fund_cik}")
+
+    if USE_EDGAR_INDEX and edgar_index.has_index():
+        for filing_type in filing_types_to_try:
+            filing = edgar_index.latest_filing(fund_cik, (filing_type,))
+            if not filing:
+                continue
+            print(f"Local EDGAR index: latest {filing_type} for {fund_cik} is {filing['accession']} filed {filing['date_filed']}.")
+            filing_directory_path = download_filing_from_index(filing)
+            if filing_directory_path:
+                return filing_directory_path
+            break # Fall back to the downloader
+        else:
+            print(f"No {', '.join(filing_types_to_try)} filings for {fund_cik} in the local EDGAR index; asking the downloader.")
 
     for filing_type in filing_types_to_try:
         try:
@@ -34,6 +110,11 @@ def download_latest_fund_holding_filing(fund_cik):
                 print(f"Successfully downloaded {num_filings} {filing_type} filing(s) for {fund_cik}.")
                 # Path to the directory for this CIK and filing type
                 specific_filing_dir = os.path.join(DOWNLOAD_PATH, 'sec-edgar-filings', fund_cik, filing_type)
+                if MANAGE_FILING_STORE and os.path.isdir(specific_filing_dir):
+                    try:
+                        filing_store.get_filing_store().ingest_directory(specific_filing_dir)
+                    except Exception as e:
+                        print(f"Warning: Could not compress downloaded filings in {specific_filing_dir}: {e}")
                 return specific_filing_dir # Return the directory containing the filing(s)
             else:
                 print(f"No {filing_type} filings found for {fund_cik}.")
@@ -46,10 +127,362 @@ def download_latest_fund_holding_filing(fund_cik):
     print(f"No suitable filings found for {fund_cik} after trying all types.")
     return None
 
-def parse_nport_xml_filing(filing_directory_path):
+# Trusts file one NPORT-P per series, all around the same date; finding one series' latest filing
+# means looking through the trust's recent filings.
+SERIES_SEARCH_LIMIT = 60
+SERIES_LOOKBACK_DAYS = 200
+
+def _find_series_accession(filing_directory_path, series_id):
+    """Newest accession under an NPORT-P directory whose submission header names series_id, or None."""
+    if not os.path.isdir(filing_directory_path):
+        return None
+    for accession in sorted(os.listdir(filing_directory_path), reverse=True):
+        document_path = filing_store.resolve_document(os.path.join(filing_directory_path, accession, "full-submission.txt"))
+        if document_path and sniff_document(document_path)[1].get('series_id') == series_id:
+            return accession
+    return None
+
+def download_latest_series_filing(fund_cik, series_id, search_limit=SERIES_SEARCH_LIMIT):
+    """
+    Downloads the latest NPORT-P of one series of a trust (a trust's CIK covers many funds).
+    Recent filings of the trust are fetched, skipping accessions already on disk, and the one whose
+    SGML header carries series_id is picked. Returns (filing_directory_path, accession) or (None, None).
+    """
+    filing_directory_path = os.path.join(DOWNLOAD_PATH, 'sec-edgar-filings', fund_cik, "NPORT-P")
+    stored_accessions = set(os.listdir(filing_directory_path)) if os.path.isdir(filing_directory_path) else set()
+    try:
+        print(f"Looking for the latest NPORT-P of series {series_id} among recent filings of {fund_cik}...")
+        dl.get("NPORT-P", fund_cik, limit=search_limit, after=(date.today() - timedelta(days=SERIES_LOOKBACK_DAYS)).isoformat(),
+               accession_numbers_to_skip=stored_accessions)
+    except Exception as e:
+        print(f"An error occurred while downloading NPORT-P filings for {fund_cik}: {e}")
+    if MANAGE_FILING_STORE and os.path.isdir(filing_directory_path):
+        try:
+            filing_store.get_filing_store().ingest_directory(filing_directory_path)
+        except Exception as e:
+            print(f"Warning: Could not compress downloaded filings in {filing_directory_path}: {e}")
+    accession = _find_series_accession(filing_directory_path, series_id)
+    if not accession:
+        print(f"No NPORT-P filing for series {series_id} found under CIK {fund_cik}.")
+        return None, None
+    return filing_directory_path, accession
+
+def latest_accession(filing_directory_path):
+    """The accession number find_filing_document parses by default (the latest one on disk), or None."""
+    if not os.path.isdir(filing_directory_path or ''):
+        return None
+    accessions = [d for d in os.listdir(filing_directory_path) if os.path.isdir(os.path.join(filing_directory_path, d))]
+    return max(accessions) if accessions else None
+
+def find_filing_document(filing_directory_path, accession=None):
+    """
+    Locates the document to parse in the latest accession directory under filing_directory_path
+    (or in the given accession): an N-PORT XML document, then full-submission.txt, then any XML or
+    HTML document. Returns (accession_dir, document_path, is_text_submission); document_path is None if nothing suitable exists.
+    """
+    # The sec-edgar-downloader library creates a structure like:
+    # DOWNLOAD_PATH/sec-edgar-filings/CIK/FILING_TYPE/ACCESSION_NUMBER/primary_doc.xml or full-submission.txt
+    # Let's list all subdirectories (accession numbers) in filing_directory_path
+    accession_dirs = [d for d in os.listdir(filing_directory_path) if os.path.isdir(os.path.join(filing_directory_path, d))]
+    if accession is not None:
+        accession_dirs = [d for d in accession_dirs if d == accession]
+    if not accession_dirs:
+        print(f"No accession number directories found in {filing_directory_path}")
+        return None, None, False
+
+    # Assume the latest accession number directory by sorting (optional, or just take first if limit=1)
+    accession_dirs.sort(reverse=True)
+    latest_accession_dir = os.path.join(filing_directory_path, accession_dirs[0])
+
+    # Revised file searching logic:
+    # Prefer specific XML file names, then full-submission.txt
+    # Then any other .xml file as a last resort.
+    xml_file_path = None
+    potential_files_to_check = [
+        os.path.join(latest_accession_dir, "primary_doc.xml"), # Common name for actual XML content
+        os.path.join(latest_accession_dir, "formNPORT-P.xml"),
+        os.path.join(latest_accession_dir, "NPORT-P.xml")
+    ]
+
+    # Documents may be stored gzip-compressed by the filing store
+    for pf_path in potential_files_to_check:
+        stored_path = filing_store.resolve_document(pf_path)
+        if stored_path:
+            xml_file_path = stored_path
+            print(f"Found preferred XML file: {xml_file_path}")
+            break
+
+    is_text_submission = False
+    if not xml_file_path:
+        # Fallback to full-submission.txt if no direct XML file is found
+        txt_submission_path = filing_store.resolve_document(os.path.join(latest_accession_dir, "full-submission.txt"))
+        if txt_submission_path:
+            xml_file_path = txt_submission_path
+            is_text_submission = True
+            print(f"Found text submission file (will attempt to parse as XML): {xml_file_path}")
+        else:
+            # Last resort: any other .xml file in the directory
+            xml_files = glob.glob(os.path.join(latest_accession_dir, '*.xml')) or glob.glob(os.path.join(latest_accession_dir, '*.xml.gz'))
+            if xml_files:
+                xml_file_path = xml_files[0] # Take the first one found
+                print(f"Found other XML file: {xml_file_path}")
+            else:
+                # NPORT-EX and N-Q documents may only be saved as HTML (e.g. primary-document.html)
+                html_files = sorted(path for pattern in ('*.htm', '*.html', '*.htm.gz', '*.html.gz')
+                                    for path in glob.glob(os.path.join(latest_accession_dir, pattern)))
+                if html_files:
+                    xml_file_path = html_files[0]
+                    print(f"Found HTML document: {xml_file_path}")
+
+    if not xml_file_path:
+        print(f"No suitable XML or text submission file found in {latest_accession_dir}")
+        return latest_accession_dir, None, False
+    return latest_accession_dir, xml_file_path, is_text_submission
+
+def parse_holding_element(holding_elem):
+    """
+    Extracts one holding record from an N-PORT <invstOrSec> element.
+    """
+    holding_data = {}
+
+    # Using more direct child searches first, then .//{} as fallback
+    name_elem = holding_elem.find("./{*}name") or holding_elem.find(".//{*}name")
+    if name_elem is not None:
+        holding_data['name'] = name_elem.text
+
+    cusip_elem = holding_elem.find("./{*}cusip") or holding_elem.find(".//{*}cusip")
+    if cusip_elem is not None:
+        holding_data['cusip'] = cusip_elem.text
+
+    lei_elem = holding_elem.find("./{*}lei")
+    if lei_elem is not None and lei_elem.text and lei_elem.text.strip():
+        holding_data['lei'] = lei_elem.text.strip() # Issuer LEI, used to group holdings by issuer
+
+    ticker_elem = holding_elem.find("./{*}securityTicker") or holding_elem.find(".//{*}securityTicker")
+    if ticker_elem is not None:
+        holding_data['ticker'] = ticker_elem.text
+
+    val_usd_elem = holding_elem.find("./{*}valUSD") or holding_elem.find(".//{*}valUSD")
+    if val_usd_elem is not None:
+        try:
+            holding_data['market_value_usd'] = float(val_usd_elem.text)
+        except ValueError:
+            pass
+
+    balance_elem = holding_elem.find("./{*}balance") or holding_elem.find(".//{*}balance")
+    if balance_elem is not None:
+         holding_data['shares_or_principal_amount'] = balance_elem.text
+
+    issuer_category_elem = holding_elem.find("./{*}issuerCat")
+    if issuer_category_elem is not None and issuer_category_elem.text and issuer_category_elem.text.strip():
+        holding_data['issuer_category'] = issuer_category_elem.text.strip() # RF marks a registered fund
+
+    asset_category_elem = holding_elem.find("./{*}assetCat")
+    if asset_category_elem is not None and asset_category_elem.text and asset_category_elem.text.strip():
+        holding_data['asset_category'] = asset_category_elem.text.strip() # EC (common equity), DBT, STIV, ...
+
+    country_elem = holding_elem.find("./{*}invCountry")
+    if country_elem is not None and country_elem.text and country_elem.text.strip() not in ('', 'N/A'):
+        holding_data['country'] = country_elem.text.strip() # ISO 3166 country of the issuer
+
+    units_elem = holding_elem.find("./{*}units")
+    if units_elem is not None and units_elem.text and units_elem.text.strip():
+        holding_data['units'] = units_elem.text.strip() # NS (shares), PA (principal amount), NC (contracts), ...
+
+    pct_val_elem = holding_elem.find("./{*}pctVal") or holding_elem.find(".//{*}pctVal")
+    if pct_val_elem is not None:
+        try:
+            holding_data['percentage_of_fund'] = float(pct_val_elem.text)
+        except ValueError:
+            pass
+    # Names and categories repeat across rows and filings; share one instance of each
+    return symbol_table.HOLDING_SYMBOLS.intern_fields(holding_data)
+
+def _is_reportable_holding(holding_data):
+    return bool(holding_data.get('name') and (holding_data.get('market_value_usd') is not None or holding_data.get('shares_or_principal_amount')))
+
+def _accession_metadata(accession_dir):
+    # The downloader layout is .../sec-edgar-filings/CIK/FILING_TYPE/ACCESSION
+    accession_dir = os.path.normpath(accession_dir)
+    return {'accession': os.path.basename(accession_dir),
+            'form_type': os.path.basename(os.path.dirname(accession_dir)),
+            'fund_cik': os.path.basename(os.path.dirname(os.path.dirname(accession_dir)))}
+
+def _filing_metadata_from_root(root, accession_dir):
+    def find_text(*paths):
+        for path in paths:
+            elem = root.find(path)
+            if elem is not None and elem.text and elem.text.strip():
+                return elem.text.strip()
+        return None
+
+    filing_metadata = _accession_metadata(accession_dir)
+    filing_metadata['fund_cik'] = find_text(".//{*}genInfo/{*}regCik", ".//{*}issuerCredentials/{*}cik") or filing_metadata['fund_cik']
+    filing_metadata['series_id'] = find_text(".//{*}genInfo/{*}seriesId", ".//{*}seriesId")
+    filing_metadata['report_date'] = find_text(".//{*}genInfo/{*}repPdDate", ".//{*}repPdDate")
+    return filing_metadata
+
+def record_filing_in_index(filing_metadata, fund_name, total_net_assets, holdings):
     """
-    Parses an NPORT-P XML filing to extract fund holdings.
+    Records a parsed filing in the holdings index so reverse lookups never need to re-scan filings.
+    Indexing problems are reported but never fail the parse itself.
+    """
+    if not UPDATE_HOLDINGS_INDEX:
+        return
+    accession = filing_metadata.get('accession')
+    try:
+        indexed = holdings_index.index_filing(accession, filing_metadata.get('fund_cik'), filing_metadata.get('series_id'),
+                                              fund_name, filing_metadata.get('report_date'), total_net_assets, holdings,
+                                              form_type=filing_metadata.get('form_type'))
+        if indexed:
+            print(f"Indexed {indexed} positions from accession {accession} for reverse lookups.")
+    except Exception as e:
+        print(f"Warning: Could not update holdings index for {accession}: {e}")
+    if UPDATE_SIMILARITY_INDEX:
+        try:
+            if fund_similarity.index_fund(filing_metadata.get('fund_cik'), filing_metadata.get('series_id'), fund_name,
+                                          accession, filing_metadata.get('report_date'), holdings,
+                                          form_type=filing_metadata.get('form_type')):
+                print(f"Added accession {accession} to the fund similarity index.")
+        except Exception as e:
+            print(f"Warning: Could not update fund similarity index for {accession}: {e}")
+
+class FilingIndexRecorder:
+    """
+    Streaming counterpart of record_filing_in_index, for holdings that are not kept once parsed:
+    add() each holding as it arrives and finish() once the stream is done. filing_metadata is the
+    dict the parser stream fills in. Indexing problems are reported but never fail the parse itself.
+    """
+    def __init__(self, filing_metadata):
+        self.filing_metadata = filing_metadata
+        self.holdings_count = 0
+        self._writer = None
+        self._writer_failed = not UPDATE_HOLDINGS_INDEX
+        self._weights = fund_similarity.HoldingWeights() if UPDATE_SIMILARITY_INDEX else None
+
+    def add(self, holding):
+        self.holdings_count += 1
+        if self._weights is not None:
+            self._weights.add(holding)
+        if self._writer_failed:
+            return
+        accession = self.filing_metadata.get('accession')
+        try:
+            if self._writer is None:
+                if not accession or not self.filing_metadata.get('fund_cik'):
+                    print("Warning: Cannot index filing without accession number and fund CIK.")
+                    self._writer_failed = True
+                    return
+                self._writer = holdings_index.FilingIndexWriter(accession)
+            self._writer.add(holding)
+        except Exception as e:
+            print(f"Warning: Could not update holdings index for {accession}: {e}")
+            self.close()
+            self._writer_failed = True
+
+    def finish(self, fund_name, total_net_assets):
+        filing_metadata = self.filing_metadata
+        accession = filing_metadata.get('accession')
+        if self._writer is not None:
+            try:
+                indexed = self._writer.finish(filing_metadata.get('fund_cik'), filing_metadata.get('series_id'), fund_name,
+                                              filing_metadata.get('report_date'), total_net_assets,
+                                              filing_metadata.get('form_type'))
+                if indexed:
+                    print(f"Indexed {indexed} positions from accession {accession} for reverse lookups.")
+            except Exception as e:
+                print(f"Warning: Could not update holdings index for {accession}: {e}")
+            self._writer = None
+        if self._weights is not None and self.holdings_count:
+            try:
+                if fund_similarity.index_fund(filing_metadata.get('fund_cik'), filing_metadata.get('series_id'), fund_name,
+                                              accession, filing_metadata.get('report_date'), None,
+                                              weights=self._weights.weights(), form_type=filing_metadata.get('form_type')):
+                    print(f"Added accession {accession} to the fund similarity index.")
+            except Exception as e:
+                print(f"Warning: Could not update fund similarity index for {accession}: {e}")
+
+    def close(self):
+        """Drops whatever finish() has not committed (e.g. after a parse error)."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+# Characters read to classify a document: enough for the SGML header and the start of the first document
+SNIFF_CHARS = 64 * 1024
+_SGML_HEADER_FIELDS = {
+    'CONFORMED SUBMISSION TYPE:': 'form_type',
+    'COMPANY CONFORMED NAME:': 'registrant_name',
+    'CONFORMED PERIOD OF REPORT:': 'report_date',
+    '<SERIES-ID>': 'series_id',
+    '<SERIES-NAME>': 'fund_name',
+}
+_XML_DOCUMENT_MARKERS = ('<xml>', '<edgarsubmission', '<informationtable')
+_HTML_DOCUMENT_MARKERS = ('<html', '<body', '<table', '<pre')
+
+def sniff_document(document_path):
+    """
+    Classifies a filing document from its first SNIFF_CHARS characters. Returns (document_format,
+    header_fields): document_format is 'nport_xml', '13f_xml', schedule_parser.HTML_SCHEDULE,
+    schedule_parser.TEXT_SCHEDULE or None (empty document); header_fields holds what the SGML header
+    of a full submission says (form_type, registrant_name, report_date and, for a single series,
+    series_id and fund_name).
+    """
+    with filing_store.open_document(document_path) as f:
+        head = f.read(SNIFF_CHARS)
+
+    header_fields, series_seen = {}, 0
+    header_end = head.find('</SEC-HEADER>')
+    for line in head[:max(header_end, 0)].splitlines():
+        line = line.strip()
+        for marker, key in _SGML_HEADER_FIELDS.items():
+            if line.startswith(marker):
+                value = line[len(marker):].strip()
+                if key in ('series_id', 'fund_name'):
+                    series_seen += key == 'series_id'
+                if value and key not in header_fields:
+                    header_fields[key] = value
+    if series_seen > 1: # A multi-series submission: the header does not say which fund this is
+        header_fields.pop('series_id', None)
+        header_fields.pop('fund_name', None)
+    report_date = header_fields.get('report_date')
+    if report_date and len(report_date) == 8 and report_date.isdigit():
+        header_fields['report_date'] = f"{report_date[:4]}-{report_date[4:6]}-{report_date[6:]}"
+
+    body = head[header_end:].lower() if header_end != -1 else head.lower()
+    first_xml = min((i for i in (body.find(m) for m in _XML_DOCUMENT_MARKERS) if i != -1), default=-1)
+    first_html = min((i for i in (body.find(m) for m in _HTML_DOCUMENT_MARKERS) if i != -1), default=-1)
+    if first_xml != -1 and (first_html == -1 or first_xml < first_html):
+        is_13f = 'informationtable' in body or 'thirteenf' in body or header_fields.get('form_type', '').startswith('13F')
+        return ('13f_xml' if is_13f else 'nport_xml'), header_fields
+    if first_html != -1:
+        return schedule_parser.HTML_SCHEDULE, header_fields
+    return (schedule_parser.TEXT_SCHEDULE if body.strip() else None), header_fields
+
+def _document_format(document_path, is_text_submission):
+    # Stand-alone XML documents need no sniffing
+    if not is_text_submission and document_path.lower().endswith(('.xml', '.xml.gz')):
+        return 'nport_xml', {}
+    return sniff_document(document_path)
+
+def _parse_schedule_filing(accession_dir, document_path, document_format, header_fields):
+    """Parses an HTML or text schedule of investments (NPORT-EX, legacy N-Q) into (fund_name, total_net_assets, holdings)."""
+    print(f"Parsing {header_fields.get('form_type', 'filing')} schedule of investments ({document_format}): {document_path}")
+    filing_metadata = _accession_metadata(accession_dir)
+    filing_metadata.update(header_fields)
+    filing_metadata['document_path'] = document_path
+    if not filing_metadata.get('fund_name'):
+        filing_metadata['fund_name'] = filing_metadata.get('registrant_name')
+    fund_name, total_net_assets, holdings = schedule_parser.parse_schedule_document(document_path, document_format, filing_metadata)
+    if holdings:
+        record_filing_in_index(filing_metadata, fund_name, total_net_assets, holdings)
+    return fund_name, total_net_assets, holdings
+
+def parse_nport_xml_filing(filing_directory_path, accession=None):
+    """
+    Parses an NPORT-P XML filing (the latest one, or the given accession) to extract fund holdings.
     This is a simplified parser and might need adjustments based on XML variations.
+    HTML and plain-text schedules (NPORT-EX, N-Q) are detected with sniff_document and handed to schedule_parser.
     """
     holdings = []
     total_net_assets = None
@@ -67,55 +500,17 @@ def parse_nport_xml_filing(filing_directory_path):
         # DOWNLOAD_PATH/sec-edgar-filings/CIK/FILING_TYPE/ACCESSION_NUMBER_cleaned/primary_doc.xml or full_submission.txt
         # We need to find the primary XML document. Often it's called 'formNPORT-P.xml' or similar within the accession number folder.
 
-        # Let's list all subdirectories (accession numbers) in filing_directory_path
-        accession_dirs = [d for d in os.listdir(filing_directory_path) if os.path.isdir(os.path.join(filing_directory_path, d))]
-        if not accession_dirs:
-            print(f"No accession number directories found in {filing_directory_path}")
-            return None, None, None
-
-        # Assume the latest accession number directory by sorting (optional, or just take first if limit=1)
-        accession_dirs.sort(reverse=True)
-        latest_accession_dir = os.path.join(filing_directory_path, accession_dirs[0])
-
-        # Revised file searching logic:
-        # Prefer specific XML file names, then full-submission.txt
-        # Then any other .xml file as a last resort.
-        xml_file_path = None
-        potential_files_to_check = [
-            os.path.join(latest_accession_dir, "primary_doc.xml"), # Common name for actual XML content
-            os.path.join(latest_accession_dir, "formNPORT-P.xml"),
-            os.path.join(latest_accession_dir, "NPORT-P.xml")
-        ]
-
-        for pf_path in potential_files_to_check:
-            if os.path.exists(pf_path):
-                xml_file_path = pf_path
-                print(f"Found preferred XML file: {xml_file_path}")
-                break
-
-        is_text_submission = False
-        if not xml_file_path:
-            # Fallback to full-submission.txt if no direct XML file is found
-            txt_submission_path = os.path.join(latest_accession_dir, "full-submission.txt")
-            if os.path.exists(txt_submission_path):
-                xml_file_path = txt_submission_path
-                is_text_submission = True
-                print(f"Found text submission file (will attempt to parse as XML): {xml_file_path}")
-            else:
-                # Last resort: any other .xml file in the directory
-                xml_files = glob.glob(os.path.join(latest_accession_dir, '*.xml'))
-                if xml_files:
-                    xml_file_path = xml_files[0] # Take the first one found
-                    print(f"Found other XML file: {xml_file_path}")
-
+        latest_accession_dir, xml_file_path, is_text_submission = find_filing_document(filing_directory_path, accession)
         if not xml_file_path:
-            print(f"No suitable XML or text submission file found in {latest_accession_dir}")
             return None, None, None
+        document_format, header_fields = _document_format(xml_file_path, is_text_submission)
+        if document_format in schedule_parser.SCHEDULE_FORMATS:
+            return _parse_schedule_filing(latest_accession_dir, xml_file_path, document_format, header_fields)
 
         root = None
         if is_text_submission:
             print(f"Parsing text submission file: {xml_file_path}")
-            with open(xml_file_path, 'r', encoding='utf-8') as f:
+            with filing_store.open_document(xml_file_path) as f:
                 file_content = f.read()
             # NPORT-P XML content is usually enclosed in <XML> tags within the submission txt file
             # Or sometimes starts directly with <?xml ...?> or the root tag like <edgarSubmission>
@@ -175,7 +570,8 @@ def parse_nport_xml_filing(filing_directory_path):
                 return None, None, None
         else:
             print(f"Parsing XML file: {xml_file_path}")
-            tree = ET.parse(xml_file_path)
+            with filing_store.open_document(xml_file_path, 'rb') as f:
+                tree = ET.parse(f)
             root = tree.getroot()
 
         if root is None:
@@ -235,45 +631,16 @@ def parse_nport_xml_filing(filing_directory_path):
             holdings_elements = root.findall(".//{*}invstOrSec")
 
         for holding_elem in holdings_elements:
-            holding_data = {}
-
-            # Using more direct child searches first, then .//{} as fallback
-            name_elem = holding_elem.find("./{*}name") or holding_elem.find(".//{*}name")
-            if name_elem is not None:
-                holding_data['name'] = name_elem.text
-
-            cusip_elem = holding_elem.find("./{*}cusip") or holding_elem.find(".//{*}cusip")
-            if cusip_elem is not None:
-                holding_data['cusip'] = cusip_elem.text
-
-            ticker_elem = holding_elem.find("./{*}securityTicker") or holding_elem.find(".//{*}securityTicker")
-            if ticker_elem is not None:
-                holding_data['ticker'] = ticker_elem.text
-
-            val_usd_elem = holding_elem.find("./{*}valUSD") or holding_elem.find(".//{*}valUSD")
-            if val_usd_elem is not None:
-                try:
-                    holding_data['market_value_usd'] = float(val_usd_elem.text)
-                except ValueError:
-                    pass
-
-            balance_elem = holding_elem.find("./{*}balance") or holding_elem.find(".//{*}balance")
-            if balance_elem is not None:
-                 holding_data['shares_or_principal_amount'] = balance_elem.text
-
-            pct_val_elem = holding_elem.find("./{*}pctVal") or holding_elem.find(".//{*}pctVal")
-            if pct_val_elem is not None:
-                try:
-                    holding_data['percentage_of_fund'] = float(pct_val_elem.text)
-                except ValueError:
-                    pass
-
-            if holding_data.get('name') and (holding_data.get('market_value_usd') is not None or holding_data.get('shares_or_principal_amount')):
+            holding_data = parse_holding_element(holding_elem)
+            if _is_reportable_holding(holding_data):
                 holdings.append(holding_data)
 
         if not fund_name and root.find(".//{*}regName") is not None : # Check if regName was found as a fallback
              fund_name = root.find(".//{*}regName").text # Attempt to get it if seriesName was missed
 
+        if holdings:
+            record_filing_in_index(_filing_metadata_from_root(root, latest_accession_dir), fund_name, total_net_assets, holdings)
+
         if not fund_name:
             print("Warning: Could not determine fund name from XML.")
         if total_net_assets is None:
@@ -297,6 +664,277 @@ def parse_nport_xml_filing(filing_directory_path):
         # traceback.print_exc() # For more detailed debugging if needed
         return None, None, None
 
+# Fund-level N-PORT fields captured while streaming, mapped to filing_metadata keys.
+# They all appear in genInfo/fundInfo, which come before the holdings in the document.
+_STREAM_METADATA_TAGS = {
+    'seriesName': 'fund_name',
+    'regName': 'registrant_name',
+    'totAssets': 'total_net_assets',
+    'seriesId': 'series_id',
+    'regCik': 'fund_cik',
+    'repPdDate': 'report_date',
+}
+# 13F-HR fields from the primary document, which precedes the information table in the submission.
+# 'parent/tag' keys only match the tag under that parent (13F documents have several <name> elements).
+_13F_METADATA_TAGS = {
+    'filingManager/name': 'fund_name',
+    'tableValueTotal': 'total_net_assets',
+    'periodOfReport': 'report_date',
+    'cik': 'fund_cik',
+}
+_NUMERIC_METADATA_KEYS = ('total_net_assets',)
+# Filings made from January 2023 report 13F values in dollars; earlier ones in thousands of dollars
+_13F_DOLLAR_VALUES_FROM_PERIOD = "2022-12-31"
+
+def _local_tag_name(tag):
+    return tag.split('}', 1)[1] if '}' in tag else tag
+
+def _iter_xml_text(document_path, is_text_submission, max_blocks=1):
+    """
+    Yields (block_number, text) for the XML of a filing, line by line. For full-submission.txt files
+    the first max_blocks <XML>...</XML> blocks are yielded (all of them if max_blocks is None), each
+    starting at its first non-blank character; the rest of the file is not read.
+    """
+    with filing_store.open_document(document_path) as f:
+        if not is_text_submission:
+            for line in f:
+                yield 0, line
+            return
+
+        block_number = -1
+        in_xml_block = False
+        started = False
+        for line in f:
+            if not in_xml_block:
+                if '<XML>' not in line:
+                    continue
+                if max_blocks is not None and block_number + 1 >= max_blocks:
+                    return
+                in_xml_block = True
+                started = False
+                block_number += 1
+                line = line.split('<XML>', 1)[1]
+            block_ended = '</XML>' in line
+            if block_ended:
+                line = line.split('</XML>', 1)[0]
+                in_xml_block = False
+            if not started:
+                # The XML declaration must be the first thing the parser sees
+                line = line.lstrip()
+                started = bool(line)
+            if line:
+                yield block_number, line
+
+def _stream_xml_records(document_path, is_text_submission, record_tag, parse_record, metadata_tags,
+                        filing_metadata, max_blocks=1):
+    """
+    The streaming engine shared by the N-PORT and 13F parsers. Yields parse_record(elem) for every
+    completed record_tag element and detaches it, so memory stays flat however long the filing is.
+    Fields named in metadata_tags are written into filing_metadata (first occurrence wins).
+    """
+    seen_metadata = set()
+    parser = None
+    current_block = None
+    open_elements = []
+    try:
+        for block_number, text in _iter_xml_text(document_path, is_text_submission, max_blocks):
+            if block_number != current_block:
+                # Every <XML> block of a submission is a separate document
+                parser = ET.XMLPullParser(events=('start', 'end'))
+                open_elements = []
+                current_block = block_number
+            parser.feed(text)
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    open_elements.append(elem)
+                    continue
+                open_elements.pop()
+                tag = _local_tag_name(elem.tag)
+                if tag == record_tag:
+                    record = parse_record(elem)
+                    if open_elements:
+                        open_elements[-1].remove(elem)
+                    if record is not None:
+                        yield record
+                    continue
+                metadata_tag = tag
+                if open_elements:
+                    qualified_tag = f"{_local_tag_name(open_elements[-1].tag)}/{tag}"
+                    if qualified_tag in metadata_tags:
+                        metadata_tag = qualified_tag
+                if metadata_tag in metadata_tags and metadata_tag not in seen_metadata and elem.text and elem.text.strip():
+                    seen_metadata.add(metadata_tag)
+                    metadata_key = metadata_tags[metadata_tag]
+                    value = elem.text.strip()
+                    if metadata_key in _NUMERIC_METADATA_KEYS:
+                        try:
+                            value = float(value)
+                        except ValueError:
+                            print(f"Could not parse {metadata_key}: {value}")
+                            continue
+                    filing_metadata[metadata_key] = value
+                elif len(open_elements) <= 2 and not any(_local_tag_name(e.tag) == record_tag for e in open_elements):
+                    # Top-level sections (headerData, genInfo, coverPage, ...) are no longer needed.
+                    # 13F records sit at depth two, so fields inside a record are left alone.
+                    elem.clear()
+    except ET.ParseError as e:
+        print(f"XML ParseError while streaming {document_path}: {e}")
+
+def _reportable_nport_holding(holding_elem):
+    holding_data = parse_holding_element(holding_elem)
+    return holding_data if _is_reportable_holding(holding_data) else None
+
+def iter_nport_holdings(filing_directory_path, filing_metadata=None, accession=None):
+    """
+    Streams holdings from the latest N-PORT filing under filing_directory_path (or the given accession) one at a time,
+    without building the whole document tree first (HTML and text schedules go to schedule_parser). Fund-level fields (fund_name, total_net_assets,
+    series_id, report_date, fund_cik, accession) are written into filing_metadata as they are read.
+    """
+    if filing_metadata is None:
+        filing_metadata = {}
+    latest_accession_dir, xml_file_path, is_text_submission = find_filing_document(filing_directory_path, accession)
+    if not xml_file_path:
+        return
+    filing_metadata.update(_accession_metadata(latest_accession_dir))
+    filing_metadata['document_path'] = xml_file_path
+    document_format, header_fields = _document_format(xml_file_path, is_text_submission)
+    if document_format in schedule_parser.SCHEDULE_FORMATS:
+        filing_metadata.update(header_fields)
+        if not filing_metadata.get('fund_name'):
+            filing_metadata['fund_name'] = filing_metadata.get('registrant_name')
+        yield from schedule_parser.iter_schedule_holdings(xml_file_path, document_format, filing_metadata)
+        return
+    try:
+        yield from _stream_xml_records(xml_file_path, is_text_submission, 'invstOrSec', _reportable_nport_holding,
+                                       _STREAM_METADATA_TAGS, filing_metadata)
+    finally:
+        if not filing_metadata.get('fund_name') and filing_metadata.get('registrant_name'):
+            filing_metadata['fund_name'] = filing_metadata['registrant_name']
+
+def read_filing_metadata(filing_directory_path, accession=None):
+    """
+    Fund-level fields (series_id, fund_name, report_date, ...) of the latest N-PORT filing under
+    filing_directory_path. Only the document up to its first holding is read.
+    """
+    filing_metadata = {}
+    holdings = iter_nport_holdings(filing_directory_path, filing_metadata, accession)
+    try:
+        next(holdings, None)
+    except Exception as e:
+        print(f"Could not read filing metadata from {filing_directory_path}: {e}")
+    finally:
+        holdings.close()
+    return filing_metadata
+
+def parse_info_table_element(info_table_elem):
+    """
+    Extracts one holding record from a 13F <infoTable> element, with the same keys as the N-PORT
+    holdings plus title_of_class, put_call and units (SH or PRN). Values are as reported.
+    """
+    def find_text(path):
+        elem = info_table_elem.find(path)
+        return elem.text.strip() if elem is not None and elem.text and elem.text.strip() else None
+
+    holding_data = {}
+    name = find_text("./{*}nameOfIssuer")
+    if name:
+        holding_data['name'] = name
+    cusip = find_text("./{*}cusip")
+    if cusip:
+        holding_data['cusip'] = cusip
+    title_of_class = find_text("./{*}titleOfClass")
+    if title_of_class:
+        holding_data['title_of_class'] = title_of_class
+    value = find_text("./{*}value")
+    if value:
+        try:
+            holding_data['market_value_usd'] = float(value)
+        except ValueError:
+            pass
+    shares = find_text("./{*}shrsOrPrnAmt/{*}sshPrnamt")
+    if shares:
+        holding_data['shares_or_principal_amount'] = shares
+    units = find_text("./{*}shrsOrPrnAmt/{*}sshPrnamtType")
+    if units:
+        holding_data['units'] = units
+    put_call = find_text("./{*}putCall")
+    if put_call:
+        holding_data['put_call'] = put_call
+    return symbol_table.HOLDING_SYMBOLS.intern_fields(holding_data)
+
+def _normalize_13f_period(period):
+    # 13F periodOfReport is MM-DD-YYYY; keep ISO dates everywhere else
+    if period and len(period) == 10 and period[2] == '-' and period[5] == '-':
+        return f"{period[6:]}-{period[:2]}-{period[3:5]}"
+    return period
+
+def _find_13f_documents(accession_dir):
+    """The documents holding a 13F-HR: the full submission, or else every stored XML document."""
+    full_submission_path = filing_store.resolve_document(os.path.join(accession_dir, "full-submission.txt"))
+    if full_submission_path:
+        return [(full_submission_path, True)]
+    xml_paths = sorted(glob.glob(os.path.join(accession_dir, '*.xml')) + glob.glob(os.path.join(accession_dir, '*.xml.gz')),
+                       key=lambda path: not os.path.basename(path).startswith('primary_doc'))
+    return [(path, False) for path in xml_paths]
+
+def iter_13f_holdings(filing_directory_path, filing_metadata=None):
+    """
+    Streams holdings from the latest 13F-HR filing under filing_directory_path, one <infoTable> row at a
+    time, as records shaped like the N-PORT holdings. Manager-level fields (fund_name, total_net_assets
+    from tableValueTotal, report_date, fund_cik, accession) are written into filing_metadata. Values are
+    converted to dollars and, when the table total is known, percentage_of_fund is filled in.
+    """
+    if filing_metadata is None:
+        filing_metadata = {}
+    accession_dirs = sorted(d for d in os.listdir(filing_directory_path) if os.path.isdir(os.path.join(filing_directory_path, d)))
+    if not accession_dirs:
+        print(f"No accession number directories found in {filing_directory_path}")
+        return
+    latest_accession_dir = os.path.join(filing_directory_path, accession_dirs[-1])
+    documents = _find_13f_documents(latest_accession_dir)
+    if not documents:
+        print(f"No 13F documents found in {latest_accession_dir}")
+        return
+    filing_metadata.update(_accession_metadata(latest_accession_dir))
+    if not filing_metadata['form_type'].upper().startswith('13F'):
+        filing_metadata['form_type'] = '13F-HR' # Keeps managers out of fund-holder totals (see holdings_index.py)
+    value_scale = None
+    for document_path, is_text_submission in documents:
+        for holding_data in _stream_xml_records(document_path, is_text_submission, 'infoTable', parse_info_table_element,
+                                                _13F_METADATA_TAGS, filing_metadata, max_blocks=None):
+            if value_scale is None:
+                # The primary document (period, table total) has been read by the time the table starts
+                filing_metadata['report_date'] = _normalize_13f_period(filing_metadata.get('report_date'))
+                report_date = filing_metadata.get('report_date')
+                value_scale = 1000.0 if report_date and report_date < _13F_DOLLAR_VALUES_FROM_PERIOD else 1.0
+                if filing_metadata.get('total_net_assets') is not None:
+                    filing_metadata['total_net_assets'] *= value_scale
+            if 'market_value_usd' in holding_data:
+                holding_data['market_value_usd'] *= value_scale
+                if filing_metadata.get('total_net_assets'):
+                    holding_data['percentage_of_fund'] = holding_data['market_value_usd'] / filing_metadata['total_net_assets'] * 100
+            if _is_reportable_holding(holding_data):
+                yield holding_data
+
+def parse_13f_filing(filing_directory_path):
+    """
+    Parses the latest 13F-HR filing under filing_directory_path.
+    Returns (manager_name, table_value_total, holdings) like parse_nport_xml_filing.
+    """
+    filing_metadata = {}
+    try:
+        holdings = list(iter_13f_holdings(filing_directory_path, filing_metadata))
+    except Exception as e:
+        print(f"An error occurred during parsing of {filing_directory_path}: {e}")
+        return None, None, None
+    manager_name = filing_metadata.get('fund_name')
+    total_value = filing_metadata.get('total_net_assets')
+    if holdings:
+        record_filing_in_index(filing_metadata, manager_name, total_value, holdings)
+    else:
+        print(f"Warning: No 13F information table rows extracted from {filing_directory_path}.")
+    return manager_name, total_value, holdings
+
 if __name__ == '__main__':
     # This CIK (VANGUARD STAR FUNDS) is known to have NPORT-P filings.
     # The downloader should place them in: ./sec_filings/sec-edgar-filings/0000751158/NPORT-P/
@@ -0,0 +1,76 @@
+import threading
+
+# Dictionary encoding for holding attributes that repeat heavily within and across filings (issuer
+# names, countries, asset/issuer categories, units). A SymbolTable maps each distinct string to a small
+# integer code. Parsed holdings keep strings, but every repeated value is the table's one shared
+# instance rather than a fresh copy per row, so large multi-fund runs hold each value once and
+# equality checks on them short-circuit on identity. The rollup's spill files store codes instead of
+# filing keys, with the table kept in memory for that run only. Codes are never persisted beyond a run:
+# the holdings index, run journal and reports keep plain strings.
+CATEGORICAL_FIELDS = ('name', 'issuer_category', 'asset_category', 'country', 'units', 'title_of_class', 'put_call')
+# Cap on the process-wide table, so universe-wide runs stay in bounded memory; values first seen
+# after it fills are kept as plain strings
+MAX_SHARED_SYMBOLS = 200000
+
+class SymbolTable:
+    """
+    Bidirectional string <-> integer code table. Codes are dense and assigned in first-seen order.
+    max_symbols limits how many values intern() adds; encode() always assigns a code.
+    Safe to share between threads (e.g. the pipeline's parser thread and look-through).
+    """
+    def __init__(self, symbols=None, max_symbols=None):
+        self.max_symbols = max_symbols
+        self._symbols = []
+        self._codes = {}
+        self._lock = threading.Lock()
+        for symbol in symbols or []:
+            self.encode(symbol)
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def encode(self, value):
+        """Code of value, adding it on first sight. None stays None."""
+        if value is None:
+            return None
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    # Appended before it is published in _codes, so a lock-free reader never sees a code without its symbol
+                    code = len(self._symbols)
+                    self._symbols.append(value)
+                    self._codes[value] = code
+        return code
+
+    def decode(self, code):
+        return self._symbols[code] if code is not None else None
+
+    def intern(self, value):
+        """The table's shared instance of value (added if new and the table is not full)."""
+        code = self._codes.get(value)
+        if code is not None:
+            return self._symbols[code]
+        if value is None:
+            return value
+        with self._lock:
+            code = self._codes.get(value)
+            if code is None:
+                if self.max_symbols is not None and len(self._symbols) >= self.max_symbols:
+                    return value
+                code = len(self._symbols)
+                self._symbols.append(value)
+                self._codes[value] = code
+            return self._symbols[code]
+
+    def intern_fields(self, record, fields=CATEGORICAL_FIELDS):
+        """Replaces the given string fields of record with their shared instances, in place."""
+        for field in fields:
+            value = record.get(field)
+            if value is not None:
+                record[field] = self.intern(value)
+        return record
+
+# Shared by the parsers for the whole process, so the same value is one object across every filing parsed
+HOLDING_SYMBOLS = SymbolTable(max_symbols=MAX_SHARED_SYMBOLS)
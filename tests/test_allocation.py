@@ -0,0 +1,69 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import allocation
+import report_generator
+
+CLASSIFICATION_CSV = """lei,cusip,sector,industry
+HWUPKR0MPOU8FGXBT394,,Information Technology,Technology Hardware
+,594918,Information Technology,Software
+,30231G102,Energy,Oil & Gas
+"""
+
+class TestAllocation(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.temp_dir, "issuer_classification.csv")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(CLASSIFICATION_CSV)
+        self.classification = allocation.IssuerClassification.load(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_classification_matches_lei_then_cusip_prefix(self):
+        apple = {'name': 'Apple Inc', 'lei': 'HWUPKR0MPOU8FGXBT394', 'cusip': '037833100'}
+        microsoft = {'name': 'Microsoft Corp', 'cusip': '594918104'}
+        exxon = {'name': 'Exxon Mobil Corp', 'cusip': '30231G102'}
+        unknown = {'name': 'Unknown Co', 'cusip': '999999999'}
+        allocation.classify_holdings([apple, microsoft, exxon, unknown], self.classification)
+
+        self.assertEqual((apple['sector'], apple['industry']), ("Information Technology", "Technology Hardware"))
+        self.assertEqual(microsoft['industry'], "Software")
+        self.assertEqual(exxon['sector'], "Energy")
+        self.assertNotIn('sector', unknown)
+
+    def test_compute_allocations_weights_every_dimension(self):
+        holdings = [
+            {'market_value_usd': 600.0, 'sector': 'Information Technology', 'industry': 'Software', 'asset_category': 'EC', 'country': 'US'},
+            {'market_value_usd': 300.0, 'sector': 'Energy', 'industry': 'Oil & Gas', 'asset_category': 'EC', 'country': 'US'},
+            {'market_value_usd': 100.0, 'asset_category': 'STIV', 'country': 'IE'},
+        ]
+        allocations = allocation.compute_allocations(holdings)
+
+        self.assertEqual([(g['group'], g['weight_pct']) for g in allocations['sector']],
+                         [("Information Technology", 60.0), ("Energy", 30.0), (allocation.UNCLASSIFIED, 10.0)])
+        self.assertEqual([(g['group'], g['holdings_count']) for g in allocations['asset_category']],
+                         [("Equity-common", 2), ("Short-term investment vehicle", 1)])
+        self.assertEqual(allocations['country'][0], {'group': 'US', 'market_value_usd': 900.0, 'weight_pct': 90.0, 'holdings_count': 2})
+        self.assertEqual(allocation.compute_allocations([])['sector'], [])
+
+    def test_report_lists_allocation_sections(self):
+        allocations = allocation.compute_allocations([
+            {'market_value_usd': 750.0, 'sector': 'Energy', 'asset_category': 'EC', 'country': 'US'},
+            {'market_value_usd': 250.0, 'asset_category': 'DBT', 'country': 'CA'}])
+        report = report_generator.format_data_for_email({'fund_cik': '123', 'detailed_holdings': [],
+                                                         'allocations': allocations, 'status': "Analysis complete."})
+
+        self.assertIn("--- Allocation by Sector ---\nEnergy: 75.00% ($750.00, 1 holdings)", report)
+        self.assertIn("Debt: 25.00%", report)
+        self.assertNotIn("Allocation by Industry", report) # Nothing classified by industry
+
+if __name__ == '__main__':
+    unittest.main()
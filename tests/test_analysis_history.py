@@ -0,0 +1,109 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import analysis_history
+
+def _row(name, cusip, shares, total_outstanding_shares, **extra):
+    return dict({'name': name, 'cusip': cusip, 'shares_held_by_fund_str': shares,
+                 'total_outstanding_shares': total_outstanding_shares, 'shares_outstanding_source': 'alpha_vantage'}, **extra)
+
+PREVIOUS_RESULT = {
+    'fund_cik': '0000036405', 'accession': '0001752724-25-000001',
+    'detailed_holdings': [
+        _row('Apple Inc', '037833100', '1000', 15000000000),
+        _row('Microsoft Corp', '594918104', '500', 7400000000),
+        _row('Exxon Mobil Corp', '30231G102', '200', "N/A (AV Fail/No Data)"),
+        _row('Old Position', '999999999', '10', 1000),
+        _row('Stale Corp', '888888888', '10', 1000, carried_forward_from='0001752724-24-000001', carried_forward_periods=4),
+    ],
+}
+
+class TestAnalysisHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.history = analysis_history.AnalysisHistory(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_save_and_find_previous_result(self):
+        self.assertIsNone(self.history.previous('0000036405'))
+        self.history.save(PREVIOUS_RESULT)
+        later = dict(PREVIOUS_RESULT, accession='0001752724-25-000002', detailed_holdings=[])
+        self.history.save(later)
+        # Saved (and modified) out of filing order: the latest earlier accession still wins
+        self.history.save(dict(PREVIOUS_RESULT, accession='0001752724-24-000009', detailed_holdings=[]))
+
+        self.assertEqual(self.history.previous('0000036405', '0001752724-25-000003')['accession'], '0001752724-25-000002')
+        self.assertEqual(self.history.previous('0000036405', '0001752724-25-000002')['accession'], '0001752724-25-000002')
+        self.assertIsNone(self.history.previous('0000036405', '0001752724-23-000001')) # Nothing earlier to build on
+        # Re-analyzing a filing that was saved before builds on that same filing
+        self.assertEqual(self.history.previous('0000036405', '0001752724-25-000001'), PREVIOUS_RESULT)
+        self.assertIsNone(self.history.save({'fund_cik': '0000036405'}))
+
+    def test_only_full_results_with_the_same_grouping_are_baselines(self):
+        self.history.save(dict(PREVIOUS_RESULT, selection={'top_n': None, 'min_percentage_of_fund': None,
+                                                           'group_by_issuer': False, 'look_through_depth': None}))
+        subset = dict(PREVIOUS_RESULT, accession='0001752724-25-000002', detailed_holdings=[],
+                      selection={'top_n': 25, 'min_percentage_of_fund': 0.5, 'group_by_issuer': False, 'look_through_depth': None})
+        by_issuer = dict(subset, selection={'top_n': None, 'min_percentage_of_fund': None,
+                                            'group_by_issuer': True, 'look_through_depth': None})
+        self.history.save(subset)
+        self.history.save(by_issuer)
+        # A top-N run of the same filing is saved beside the full result, not over it
+        self.history.save(dict(subset, accession=PREVIOUS_RESULT['accession']))
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.temp_dir, '0000036405'))),
+                         ['0001752724-25-000001.json.gz', '0001752724-25-000001.top-25.min-0.5.json.gz',
+                          '0001752724-25-000002.by-issuer.json.gz', '0001752724-25-000002.top-25.min-0.5.json.gz'])
+        self.assertEqual(self.history.previous('0000036405', '0001752724-25-000003', subset['selection'])['detailed_holdings'],
+                         PREVIOUS_RESULT['detailed_holdings'])
+        self.assertEqual(self.history.previous('0000036405', '0001752724-25-000003', by_issuer['selection'])['accession'],
+                         '0001752724-25-000002')
+        self.assertIsNone(self.history.previous('0000036405', '0001752724-25-000003', {'look_through_depth': 2}))
+
+    def test_baseline_carries_forward_unchanged_positions_only(self):
+        baseline = analysis_history.IncrementalBaseline(PREVIOUS_RESULT)
+        apple = {'name': 'Apple Inc', 'cusip': '037833100', 'shares_held_by_fund_str': '1020'}
+        microsoft = {'name': 'Microsoft Corp', 'cusip': '594918104', 'shares_held_by_fund_str': '800'}
+        exxon = {'name': 'Exxon Mobil Corp', 'cusip': '30231G102', 'shares_held_by_fund_str': '200'}
+        stale = {'name': 'Stale Corp', 'cusip': '888888888', 'shares_held_by_fund_str': '10'}
+        nvidia = {'name': 'NVIDIA Corp', 'cusip': '67066G104', 'shares_held_by_fund_str': '50'}
+
+        self.assertEqual(baseline.compare(apple, 1020.0), (15000000000, 'alpha_vantage')) # 2% move is not material
+        self.assertIsNone(baseline.compare(microsoft, 800.0))
+        self.assertIsNone(baseline.compare(exxon, 200.0)) # The previous lookup failed, so it is retried
+        self.assertIsNone(baseline.compare(stale, 10.0)) # Carried forward too many periods already
+        self.assertIsNone(baseline.compare(nvidia, 50.0))
+
+        self.assertEqual([h['position_change'] for h in (apple, microsoft, exxon, stale, nvidia)],
+                         ['unchanged', 'changed', 'unchanged', 'unchanged', 'new'])
+        self.assertEqual(apple['carried_forward_from'], '0001752724-25-000001')
+        changes = baseline.change_set()
+        self.assertEqual([c['name'] for c in changes['added']], ['NVIDIA Corp'])
+        self.assertEqual(changes['changed'][0]['previous_shares'], '500')
+        self.assertEqual([c['name'] for c in changes['removed']], ['Old Position'])
+        self.assertEqual((changes['unchanged_count'], changes['carried_forward_count']), (3, 1))
+
+    def test_unselected_positions_are_not_removed(self):
+        previous = {'accession': '0001752724-25-000001', 'detailed_holdings': [
+            {'name': f'Company {i}', 'cusip': f'{i:06d}AB1', 'shares_held_by_fund_str': '100'} for i in range(1, 6)]}
+        baseline = analysis_history.IncrementalBaseline(previous)
+        current = [dict(row) for row in previous['detailed_holdings'][:4]] # Company 5 was sold
+        for row in current:
+            baseline.record_held(row)
+        for row in current[:2]: # Only the top 2 are analyzed
+            baseline.compare(row, 100.0)
+
+        changes = baseline.change_set()
+        self.assertEqual([c['name'] for c in changes['removed']], ['Company 5'])
+        self.assertEqual((changes['added'], changes['changed'], changes['unchanged_count']), ([], [], 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import edgar_index
+import sec_parser
+
+SAMPLE_MASTER_IDX = """Description:           Master Index of EDGAR Dissemination Feed
+Last Data Received:    March 31, 2025
+Comments:              webmaster@sec.gov
+Anonymous FTP:         ftp://ftp.sec.gov/edgar/
+
+CIK|Company Name|Form Type|Date Filed|Filename
+--------------------------------------------------------------------------------
+36405|VANGUARD INDEX FUNDS|NPORT-P|2025-02-27|edgar/data/36405/0001752724-25-040001.txt
+36405|VANGUARD INDEX FUNDS|NPORT-P|2025-03-28|edgar/data/36405/0001752724-25-126276.txt
+36405|VANGUARD INDEX FUNDS|N-CSR|2025-03-01|edgar/data/36405/0001104659-25-000002.txt
+894051|SPDR S&P 500 ETF TRUST|NPORT-P|2025-03-20|edgar/data/894051/0001193125-25-000003.txt
+"""
+
+def _form_idx_line(form_type, company_name, cik, date_filed, filename):
+    return f"{form_type:<12}{company_name:<62}{cik:<12}{date_filed:<12}{filename}"
+
+SAMPLE_FORM_IDX = "\n".join([
+    "Description:           Daily Index of EDGAR Dissemination Feed by Form Type",
+    "",
+    _form_idx_line("Form Type", "Company Name", "CIK", "Date Filed", "File Name"),
+    "-" * 140,
+    _form_idx_line("NPORT-P", "VANGUARD STAR FUNDS", "751158", "2025-05-29", "edgar/data/751158/0001752724-25-200001.txt"),
+    _form_idx_line("SC 13G/A", "SOME HOLDER LLC", "1234567", "2025-05-30", "edgar/data/1234567/0001234567-25-000009.txt"),
+]) + "\n"
+
+class TestEdgarIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.temp_dir, "edgar_full_index.db")
+        quarter_dir = os.path.join(self.temp_dir, "full-index", "2025", "QTR1")
+        os.makedirs(quarter_dir)
+        with open(os.path.join(quarter_dir, "master.idx"), 'w', encoding='latin-1') as f:
+            f.write(SAMPLE_MASTER_IDX)
+        self.form_idx_path = os.path.join(self.temp_dir, "form.idx")
+        with open(self.form_idx_path, 'w', encoding='latin-1') as f:
+            f.write(SAMPLE_FORM_IDX)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_parse_form_idx_handles_spaces_in_columns(self):
+        rows = list(edgar_index.parse_form_idx(SAMPLE_FORM_IDX.splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1]['form_type'], "SC 13G/A")
+        self.assertEqual(rows[1]['company_name'], "SOME HOLDER LLC")
+        self.assertEqual(rows[0]['cik'], "0000751158")
+        self.assertEqual(rows[0]['accession'], "0001752724-25-200001")
+
+    def test_ingest_and_query(self):
+        self.assertEqual(edgar_index.ingest_directory(os.path.join(self.temp_dir, "full-index"), self.index_path), 4)
+        edgar_index.ingest_index_file(self.form_idx_path, self.index_path)
+
+        latest = edgar_index.latest_filing("36405", index_path=self.index_path)
+        self.assertEqual(latest['accession'], "0001752724-25-126276")
+        self.assertEqual(latest['url'], "https://www.sec.gov/Archives/edgar/data/36405/0001752724-25-126276.txt")
+        self.assertIsNone(edgar_index.latest_filing("0000000001", index_path=self.index_path))
+
+        quarter_filers = edgar_index.filers("NPORT-P", "2025-01-01", "2025-03-31", index_path=self.index_path)
+        self.assertEqual([(f['cik'], f['date_filed']) for f in quarter_filers],
+                         [("0000036405", "2025-03-28"), ("0000894051", "2025-03-20")])
+        self.assertEqual(len(edgar_index.filers("NPORT-P", index_path=self.index_path)), 3)
+        # Every filing, not just each filer's latest
+        quarter_filings = edgar_index.filings("NPORT-P", "2025-01-01", "2025-03-31", index_path=self.index_path)
+        self.assertEqual([f['accession'] for f in quarter_filings],
+                         ["0001752724-25-040001", "0001752724-25-126276", "0001193125-25-000003"])
+
+    def test_already_ingested_files_are_skipped(self):
+        edgar_index.ingest_index_file(self.form_idx_path, self.index_path)
+        self.assertEqual(edgar_index.ingest_index_file(self.form_idx_path, self.index_path), 0)
+        self.assertEqual(edgar_index.ingest_index_file(self.form_idx_path, self.index_path, force=True), 2)
+
+    @patch('sec_parser.requests.get')
+    @patch('sec_parser.dl')
+    def test_download_uses_index_instead_of_downloader(self, mock_dl, mock_get):
+        edgar_index.ingest_directory(os.path.join(self.temp_dir, "full-index"), self.index_path)
+        mock_get.return_value = MagicMock(content=b"<SEC-DOCUMENT>...</SEC-DOCUMENT>")
+        download_path = os.path.join(self.temp_dir, "sec_filings")
+
+        with patch('sec_parser.edgar_index.INDEX_PATH', self.index_path), \
+             patch('sec_parser.DOWNLOAD_PATH', download_path), \
+             patch('sec_parser.MANAGE_FILING_STORE', False):
+            filing_dir = sec_parser.download_latest_fund_holding_filing("0000036405")
+            # A second request for the same filing needs no network at all
+            sec_parser.download_latest_fund_holding_filing("0000036405")
+
+        self.assertEqual(filing_dir, os.path.join(download_path, 'sec-edgar-filings', "0000036405", "NPORT-P"))
+        self.assertTrue(os.path.exists(os.path.join(filing_dir, "0001752724-25-126276", "full-submission.txt")))
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args.args[0], "https://www.sec.gov/Archives/edgar/data/36405/0001752724-25-126276.txt")
+        mock_dl.get.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
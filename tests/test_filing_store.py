@@ -0,0 +1,125 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import itertools
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import filing_store
+import sec_parser
+
+SAMPLE_SUBMISSION = "<SEC-DOCUMENT>\n<XML>\n<edgarSubmission>" + "<invstOrSec><name>APPLE INC</name></invstOrSec>" * 200 + "</edgarSubmission>\n</XML>\n</SEC-DOCUMENT>\n"
+
+class TestFilingStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.temp_dir, "sec-edgar-filings")
+        self.manifest_path = os.path.join(self.temp_dir, "filing_store.json")
+        # open_document goes through the shared store; keep it off the real sec_filings manifest
+        self.store_patch = patch('filing_store._default_store', filing_store.FilingStore(self.root, self.manifest_path))
+        self.store_patch.start()
+
+    def tearDown(self):
+        self.store_patch.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _write_accession(self, accession, content=SAMPLE_SUBMISSION, cik="0000036405"):
+        accession_dir = os.path.join(self.root, cik, "NPORT-P", accession)
+        os.makedirs(accession_dir)
+        with open(os.path.join(accession_dir, "full-submission.txt"), 'w', encoding='utf-8') as f:
+            f.write(content)
+        return accession_dir
+
+    def test_ingest_compresses_and_documents_open_transparently(self):
+        accession_dir = self._write_accession("0001752724-25-000001")
+        store = filing_store.FilingStore(self.root, self.manifest_path, max_bytes=10 ** 9)
+        store.ingest(accession_dir)
+
+        document_path = os.path.join(accession_dir, "full-submission.txt")
+        self.assertFalse(os.path.exists(document_path))
+        self.assertEqual(filing_store.resolve_document(document_path), document_path + '.gz')
+        self.assertLess(os.path.getsize(document_path + '.gz'), len(SAMPLE_SUBMISSION) / 5)
+        with filing_store.open_document(document_path) as f:
+            self.assertEqual(f.read(), SAMPLE_SUBMISSION)
+        self.assertIsNone(filing_store.resolve_document(os.path.join(accession_dir, "primary_doc.xml")))
+
+    def test_least_recently_used_accessions_are_evicted(self):
+        first, second, third = [self._write_accession(f"0001752724-25-00000{i}") for i in range(1, 4)]
+        store = filing_store.FilingStore(self.root, self.manifest_path, max_bytes=10 ** 9)
+        with patch('filing_store.time.time', side_effect=itertools.count(100)):
+            for accession_dir in (first, second, third):
+                store.ingest(accession_dir)
+            store.touch(first) # Read again: now the most recently used
+
+        store.max_bytes = store.total_bytes() - 1
+        evicted = store.evict()
+
+        self.assertEqual(evicted, [os.path.relpath(second, self.root)])
+        self.assertFalse(os.path.exists(second))
+        self.assertTrue(os.path.exists(first) and os.path.exists(third))
+
+    def test_reads_update_the_manifest_only_when_saved(self):
+        accession_dir = self._write_accession("0001752724-25-000001")
+        store = filing_store.FilingStore(self.root, self.manifest_path, max_bytes=10 ** 9)
+        store.ingest(accession_dir)
+        manifest_mtime = os.path.getmtime(self.manifest_path)
+        with patch('filing_store.FilingStore._save', wraps=store._save) as mock_save:
+            for _ in range(5):
+                store.touch(accession_dir)
+            mock_save.assert_not_called()
+            store.save()
+            store.save() # Nothing new to write
+            mock_save.assert_called_once()
+        self.assertGreaterEqual(os.path.getmtime(self.manifest_path), manifest_mtime)
+
+    def test_pinned_accessions_are_never_compressed_or_evicted(self):
+        pinned = self._write_accession("0001752724-25-000001")
+        unpinned = self._write_accession("0001752724-25-000002")
+
+        store = filing_store.FilingStore(self.root, self.manifest_path, max_bytes=1, pinned={"0001752724-25-000001"})
+        store.compact()
+        self.assertTrue(os.path.exists(os.path.join(pinned, "full-submission.txt")))
+        self.assertTrue(os.path.exists(os.path.join(unpinned, "full-submission.txt.gz")))
+        # Over the 1 byte cap, only the unpinned accession can go
+        self.assertEqual(store.evict(), [os.path.relpath(unpinned, self.root)])
+        self.assertTrue(os.path.exists(os.path.join(pinned, "full-submission.txt")))
+
+    def test_pinned_accessions_from_env(self):
+        with patch.dict(os.environ, {'FILING_STORE_PINNED_ACCESSIONS': "0001752724-25-000002, 0001752724-25-000003"}):
+            store = filing_store.FilingStore(self.root, self.manifest_path)
+        self.assertEqual(store.pinned, {"0001752724-25-000002", "0001752724-25-000003"})
+        with patch.dict(os.environ, {'FILING_STORE_PINNED_ACCESSIONS': ""}):
+            self.assertEqual(filing_store.FilingStore(self.root, self.manifest_path).pinned, set())
+
+    def test_manifest_persists_and_ingest_enforces_cap(self):
+        first = self._write_accession("0001752724-25-000001")
+        store = filing_store.FilingStore(self.root, self.manifest_path, max_bytes=10 ** 9)
+        store.ingest(first)
+        one_accession_bytes = store.total_bytes()
+
+        # A new process with a cap that only fits one accession keeps the newest download
+        reopened = filing_store.FilingStore(self.root, self.manifest_path, max_bytes=one_accession_bytes)
+        self.assertEqual(reopened.total_bytes(), one_accession_bytes)
+        second = self._write_accession("0001752724-25-000002")
+        reopened.ingest(second)
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+    def test_streaming_parser_reads_compressed_submission(self):
+        xml = ("<edgarSubmission><formData><genInfo><seriesName>Test Fund</seriesName></genInfo><invstOrSecs>"
+               "<invstOrSec><name>APPLE INC</name><balance>5000</balance></invstOrSec>"
+               "</invstOrSecs></formData></edgarSubmission>")
+        accession_dir = self._write_accession("0001752724-25-000001", f"<SEC-DOCUMENT>\n<XML>\n{xml}\n</XML>\n")
+        filing_store.compress_accession(accession_dir)
+
+        filing_metadata = {}
+        holdings = list(sec_parser.iter_nport_holdings(os.path.dirname(accession_dir), filing_metadata))
+        self.assertEqual(holdings, [{'name': 'APPLE INC', 'shares_or_principal_amount': '5000'}])
+        self.assertEqual(filing_metadata['fund_name'], "Test Fund")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,25 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import os
+import threading
+import tempfile
+import shutil
 
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import fund_analyzer
+import analysis_history
 
 class TestFundAnalyzer(unittest.TestCase):
 
+    def setUp(self):
+        # The reference-data router caches answers across calls; start every test with a fresh one
+        fund_analyzer.reset_reference_data_router()
+
     @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing')
     @patch('fund_analyzer.sec_parser.parse_nport_xml_filing')
-    @patch('fund_analyzer.get_company_shares_outstanding') # Mocks the function within fund_analyzer
+    @patch('fund_analyzer.lookup_company_shares_outstanding') # Mocks the function within fund_analyzer
     def test_analyze_fund_ownership_success(self, mock_get_shares, mock_parse_nport, mock_download_filing):
         # Setup mocks
         mock_download_filing.return_value = "/fake/path/to/filings/0001234567/NPORT-P"
@@ -25,7 +33,7 @@ class TestFundAnalyzer(unittest.TestCase):
             ]
         )
         # Mock return for shares outstanding: first call for CMPA, second for CMPCT (if it were equity)
-        mock_get_shares.side_effect = [1000000, 5000000]
+        mock_get_shares.side_effect = [(1000000, 'alpha_vantage'), (5000000, 'alpha_vantage')]
 
         # Ensure API_KEY is not 'demo' for this test to allow processing all holdings
         # Also, ensure that fund_analyzer.API_KEY is updated if it's checked at module load time
@@ -86,6 +94,331 @@ class TestFundAnalyzer(unittest.TestCase):
         finally:
             fund_analyzer.API_KEY = original_api_key
 
+    @patch('fund_analyzer.holdings_index.find_holders')
+    @patch('fund_analyzer.get_company_shares_outstanding', return_value=1000000)
+    def test_find_fund_holders(self, mock_get_shares, mock_find_holders):
+        mock_find_holders.return_value = [
+            {'fund_cik': '0000000001', 'fund_name': 'Fund One', 'cusip': 'CUSIPA', 'ticker': 'CMPA', 'name': 'Company A', 'balance': 30000.0, 'market_value_usd': 3000.0, 'units': 'NS'},
+            {'fund_cik': '0000000002', 'fund_name': 'Fund Two', 'cusip': 'CUSIPA', 'ticker': None, 'name': 'Company A', 'balance': 20000.0, 'market_value_usd': 2000.0, 'units': 'NS'},
+            # A principal amount and a position of unknown units are not shares of the company
+            {'fund_cik': '0000000003', 'fund_name': 'Fund Three', 'cusip': 'CUSIPA', 'ticker': None, 'name': 'Company A', 'balance': 900000.0, 'market_value_usd': 9000.0, 'units': 'PA'},
+            {'fund_cik': '0000000004', 'fund_name': 'Fund Four', 'cusip': 'CUSIPA', 'ticker': None, 'name': 'Company A', 'balance': 700000.0, 'market_value_usd': 7000.0, 'units': None},
+        ]
+        with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+            result = fund_analyzer.find_fund_holders("CUSIPA")
+
+        self.assertEqual(result['status'], "Lookup complete.")
+        self.assertEqual(result['fund_count'], 2)
+        self.assertEqual(result['total_shares_held'], 50000.0)
+        mock_get_shares.assert_called_once_with('CMPA', cusip='CUSIPA')
+        self.assertAlmostEqual(result['percentage_of_company_owned_by_funds'], 5.0)
+        self.assertAlmostEqual(result['holders'][1]['percentage_of_company_owned_by_fund'], 2.0)
+        self.assertEqual([h['fund_name'] for h in result['other_holdings']], ['Fund Three', 'Fund Four'])
+        self.assertEqual(result['total_value_usd'], 5000.0)
+        self.assertEqual(fund_analyzer.API_KEY, 'fakekey_for_test')
+
+    @patch('fund_analyzer.holdings_index.find_holders')
+    @patch('fund_analyzer.get_company_shares_outstanding', return_value=1000000)
+    def test_find_fund_holders_by_cusip_only(self, mock_get_shares, mock_find_holders):
+        mock_find_holders.return_value = [
+            {'fund_cik': '0000000001', 'fund_name': 'Fund One', 'cusip': 'CUSIPA', 'ticker': None, 'name': 'Company A', 'balance': 30000.0, 'market_value_usd': 3000.0, 'units': 'NS'},
+        ]
+        result = fund_analyzer.find_fund_holders("cusipa")
+
+        mock_get_shares.assert_called_once_with(None, cusip='CUSIPA')
+        self.assertAlmostEqual(result['percentage_of_company_owned_by_funds'], 3.0)
+
+    @patch('fund_analyzer.holdings_index.find_holders', return_value=[])
+    def test_find_fund_holders_no_match(self, mock_find_holders):
+        result = fund_analyzer.find_fund_holders("NOPE")
+        self.assertEqual(result['fund_count'], 0)
+        self.assertEqual(result['holders'], [])
+
+    def test_select_top_holdings(self):
+        holdings = [
+            {'name': 'Small', 'market_value_usd': 100.0, 'percentage_of_fund': 0.1},
+            {'name': 'Large', 'market_value_usd': 900.0, 'percentage_of_fund': 0.9},
+            {'name': 'Medium', 'market_value_usd': 500.0, 'percentage_of_fund': 0.5},
+            {'name': 'No Value', 'percentage_of_fund': 0.2},
+        ]
+        top = fund_analyzer.select_top_holdings(iter(holdings), top_n=2)
+        self.assertEqual([h['name'] for h in top], ['Large', 'Medium'])
+
+        # A threshold alone keeps filing order; nothing is sorted
+        above_threshold = fund_analyzer.select_top_holdings(reversed(holdings), min_percentage_of_fund=0.2)
+        self.assertEqual([h['name'] for h in above_threshold], ['No Value', 'Medium', 'Large'])
+
+        # Streamed schedule-of-investments rows have no weight yet and are not dropped by the threshold
+        unweighted = {'name': 'Schedule Row', 'market_value_usd': 50.0}
+        with patch('builtins.print') as mock_print:
+            kept = fund_analyzer.select_top_holdings(holdings + [unweighted], min_percentage_of_fund=0.5)
+        self.assertEqual([h['name'] for h in kept], ['Large', 'Medium', 'Schedule Row'])
+        self.assertIn("1 holdings have no weight in the fund", mock_print.call_args.args[0])
+
+    @patch('fund_analyzer.sec_parser.FilingIndexRecorder')
+    @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing', return_value="/fake/path")
+    @patch('fund_analyzer.sec_parser.parse_nport_xml_filing')
+    @patch('fund_analyzer.sec_parser.iter_nport_holdings')
+    @patch('fund_analyzer.lookup_company_shares_outstanding', return_value=(1000000, 'alpha_vantage'))
+    def test_analyze_fund_ownership_top_n_limits_lookups(self, mock_get_shares, mock_iter_nport, mock_parse_nport,
+                                                         mock_download_filing, mock_recorder_class):
+        holdings = [
+            {'name': 'Company A', 'ticker': 'CMPA', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 0.1},
+            {'name': 'Company B', 'ticker': 'CMPB', 'shares_or_principal_amount': '100', 'market_value_usd': 700.0, 'percentage_of_fund': 0.7},
+            {'name': 'Company C', 'ticker': 'CMPC', 'shares_or_principal_amount': '100', 'market_value_usd': 200.0, 'percentage_of_fund': 0.2},
+        ]
+        def stream(filing_directory_path, filing_metadata):
+            filing_metadata.update({'fund_name': "Test Fund", 'total_net_assets': 1000.0})
+            yield from holdings
+        mock_iter_nport.side_effect = stream
+        mock_recorder = mock_recorder_class.return_value
+        mock_recorder.holdings_count = 3
+        journal = MagicMock()
+        journal.stage.return_value = None
+        journal.lookup_result.return_value = None
+        with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+            with patch('fund_analyzer.time.sleep'):
+                result = fund_analyzer.analyze_fund_ownership("VFINX", top_n=2, journal=journal)
+
+        # Selection consumed the parser stream, even with a journal; the whole-document parser was never used
+        mock_parse_nport.assert_not_called()
+        self.assertEqual([c.args[0] for c in mock_recorder.add.call_args_list], holdings)
+        mock_recorder.finish.assert_called_once_with("Test Fund", 1000.0)
+        # Only the selected holdings are checkpointed
+        parse_stage = next(c for c in journal.record_stage.call_args_list if c.args[0] == 'parse')
+        self.assertEqual([h['name'] for h in parse_stage.kwargs['holdings']], ['Company B', 'Company C'])
+        self.assertEqual(parse_stage.kwargs['holdings_count'], 3)
+        self.assertTrue(parse_stage.kwargs['selected_while_parsing'])
+        self.assertEqual(result['allocations']['sector'][0]['holdings_count'], 3)
+        self.assertEqual(result['fund_name'], "Test Fund")
+        self.assertEqual(result['holdings_count'], 3)
+        self.assertEqual(result['holdings_selected'], 2)
+        self.assertEqual([h['name'] for h in result['detailed_holdings']], ['Company B', 'Company C'])
+        self.assertEqual(mock_get_shares.call_count, 2)
+        # Holdings without a CUSIP are looked up by ticker alone, never under an "N/A" placeholder
+        self.assertEqual([c.args for c in mock_get_shares.call_args_list], [('CMPB', None), ('CMPC', None)])
+
+    @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing', return_value="/fake/path")
+    @patch('fund_analyzer.sec_parser.parse_nport_xml_filing')
+    @patch('fund_analyzer.lookup_company_shares_outstanding', return_value=(1000000, 'alpha_vantage'))
+    def test_analyze_fund_ownership_groups_by_issuer(self, mock_get_shares, mock_parse_nport, mock_download_filing):
+        mock_parse_nport.return_value = ("Test Fund", 1000.0, [
+            {'name': 'Alphabet Inc Class A', 'cusip': '02079K305', 'lei': '5493006MHB84DD0ZWV18', 'ticker': 'GOOGL',
+             'shares_or_principal_amount': '300', 'units': 'NS', 'market_value_usd': 300.0, 'percentage_of_fund': 30.0},
+            {'name': 'Company B', 'cusip': '111111111', 'ticker': 'CMPB', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+            {'name': 'Alphabet Inc Class C', 'cusip': '02079K107', 'lei': '5493006MHB84DD0ZWV18', 'ticker': 'GOOG',
+             'shares_or_principal_amount': '200', 'units': 'NS', 'market_value_usd': 200.0, 'percentage_of_fund': 20.0},
+        ])
+        with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+            with patch('fund_analyzer.time.sleep'):
+                result = fund_analyzer.analyze_fund_ownership("VFINX", group_by_issuer=True)
+
+        self.assertEqual(result['holdings_count'], 3)
+        self.assertEqual(result['issuers_count'], 2)
+        self.assertEqual([c.args[0] for c in mock_get_shares.call_args_list], ['GOOGL', 'CMPB'])
+        alphabet = result['detailed_holdings'][0]
+        self.assertEqual(alphabet['shares_held_by_fund_str'], '500')
+        self.assertEqual(alphabet['market_value_in_fund'], 500.0)
+        self.assertEqual(alphabet['issuer_securities'], "GOOGL; GOOG")
+        self.assertAlmostEqual(alphabet['percentage_of_company_owned_by_fund'], 0.05)
+
+    @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing')
+    @patch('fund_analyzer.sec_parser.parse_nport_xml_filing')
+    @patch('fund_analyzer.lookup_company_shares_outstanding', return_value=(1000000, 'alpha_vantage'))
+    def test_analyze_fund_ownership_incremental_reuses_previous_lookups(self, mock_get_shares, mock_parse_nport, mock_download_filing):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filing_directory_path = os.path.join(temp_dir, "NPORT-P")
+            os.makedirs(os.path.join(filing_directory_path, "0001752724-25-000001"))
+            mock_download_filing.return_value = filing_directory_path
+            history = analysis_history.AnalysisHistory(os.path.join(temp_dir, "results"))
+            mock_parse_nport.return_value = ("Test Fund", 1000.0, [
+                {'name': 'Company A', 'cusip': '111111111', 'ticker': 'CMPA', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+                {'name': 'Company B', 'cusip': '222222222', 'ticker': 'CMPB', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+            ])
+            with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+                with patch('fund_analyzer.time.sleep'):
+                    fund_analyzer.analyze_fund_ownership("VFINX", history=history, incremental=True)
+                    # Next quarter: A unchanged, B doubled, C new
+                    os.makedirs(os.path.join(filing_directory_path, "0001752724-25-000002"))
+                    mock_parse_nport.return_value = ("Test Fund", 1000.0, [
+                        {'name': 'Company A', 'cusip': '111111111', 'ticker': 'CMPA', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+                        {'name': 'Company B', 'cusip': '222222222', 'ticker': 'CMPB', 'shares_or_principal_amount': '200', 'market_value_usd': 200.0, 'percentage_of_fund': 20.0},
+                        {'name': 'Company C', 'cusip': '333333333', 'ticker': 'CMPC', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+                    ])
+                    fund_analyzer.reset_reference_data_router()
+                    mock_get_shares.reset_mock()
+                    result = fund_analyzer.analyze_fund_ownership("VFINX", history=history, incremental=True)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        self.assertEqual([c.args[0] for c in mock_get_shares.call_args_list], ['CMPB', 'CMPC'])
+        self.assertEqual(result['accession'], "0001752724-25-000002")
+        self.assertEqual(result['holdings_carried_forward'], 1)
+        company_a = result['detailed_holdings'][0]
+        self.assertEqual(company_a['carried_forward_from'], "0001752724-25-000001")
+        self.assertAlmostEqual(company_a['percentage_of_company_owned_by_fund'], 0.01)
+        self.assertEqual([c['name'] for c in result['changes']['added']], ['Company C'])
+        self.assertEqual([c['name'] for c in result['changes']['changed']], ['Company B'])
+
+    @patch('fund_analyzer.sec_parser.FilingIndexRecorder')
+    @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing')
+    @patch('fund_analyzer.sec_parser.iter_nport_holdings')
+    @patch('fund_analyzer.sec_parser.parse_nport_xml_filing')
+    @patch('fund_analyzer.lookup_company_shares_outstanding', return_value=(1000000, 'alpha_vantage'))
+    def test_analyze_fund_ownership_incremental_top_n_does_not_remove_unselected(self, mock_get_shares, mock_parse_nport,
+                                                                                mock_iter_nport, mock_download_filing, mock_recorder_class):
+        holdings = [
+            {'name': 'Company A', 'cusip': '111111111', 'ticker': 'CMPA', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+            {'name': 'Company B', 'cusip': '222222222', 'ticker': 'CMPB', 'shares_or_principal_amount': '100', 'market_value_usd': 700.0, 'percentage_of_fund': 70.0},
+            {'name': 'Company C', 'cusip': '333333333', 'ticker': 'CMPC', 'shares_or_principal_amount': '100', 'market_value_usd': 200.0, 'percentage_of_fund': 20.0},
+        ]
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filing_directory_path = os.path.join(temp_dir, "NPORT-P")
+            os.makedirs(os.path.join(filing_directory_path, "0001752724-25-000001"))
+            mock_download_filing.return_value = filing_directory_path
+            history = analysis_history.AnalysisHistory(os.path.join(temp_dir, "results"))
+            mock_parse_nport.return_value = ("Test Fund", 1000.0, holdings)
+            with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+                with patch('fund_analyzer.time.sleep'):
+                    fund_analyzer.analyze_fund_ownership("VFINX", history=history, incremental=True)
+                    # Next quarter: the same positions but Company C, analyzed for the top 1 only
+                    os.makedirs(os.path.join(filing_directory_path, "0001752724-25-000002"))
+                    mock_iter_nport.side_effect = lambda path, filing_metadata: iter([dict(h) for h in holdings[:2]])
+                    mock_recorder_class.return_value.holdings_count = 2
+                    fund_analyzer.reset_reference_data_router()
+                    result = fund_analyzer.analyze_fund_ownership("VFINX", top_n=1, history=history, incremental=True)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        self.assertEqual([h['name'] for h in result['detailed_holdings']], ['Company B'])
+        self.assertEqual([c['name'] for c in result['changes']['removed']], ['Company C'])
+
+    @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing', return_value="/fake/path")
+    @patch('fund_analyzer.sec_parser.parse_nport_xml_filing')
+    @patch('fund_analyzer.lookup_company_shares_outstanding', return_value=(1000000, 'alpha_vantage'))
+    def test_analyze_fund_ownership_budget_prioritizes_fund_weight(self, mock_get_shares, mock_parse_nport, mock_download_filing):
+        mock_parse_nport.return_value = ("Test Fund", 1000.0, [
+            {'name': 'Company A', 'ticker': 'CMPA', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+            {'name': 'Company B', 'ticker': 'CMPB', 'shares_or_principal_amount': '100', 'market_value_usd': 700.0, 'percentage_of_fund': 70.0},
+            {'name': 'Company C', 'ticker': 'CMPC', 'shares_or_principal_amount': '100', 'market_value_usd': 200.0, 'percentage_of_fund': 20.0},
+        ])
+        with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+            with patch('fund_analyzer.time.sleep'):
+                result = fund_analyzer.analyze_fund_ownership("VFINX", max_api_calls=2)
+
+        self.assertEqual([c.args[0] for c in mock_get_shares.call_args_list], ['CMPB', 'CMPC'])
+        # Results stay in filing order; the lightest position is the one skipped
+        self.assertEqual(result['detailed_holdings'][0]['percentage_of_company_owned_by_fund'], "Skipped (API Call Limit)")
+        self.assertAlmostEqual(result['ownership_coverage_pct'], 90.0)
+        self.assertEqual(result['lookup_budget_exhausted'], "API Call Limit")
+        self.assertEqual(result['status'], "Analysis complete.")
+
+    @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing', return_value="/fake/path")
+    @patch('fund_analyzer.sec_parser.parse_nport_xml_filing')
+    @patch('fund_analyzer.lookup_company_shares_outstanding', return_value=(1000000, 'alpha_vantage'))
+    @patch('fund_analyzer.get_reference_data_router')
+    def test_analyze_fund_ownership_uses_offline_index_first(self, mock_get_router, mock_get_shares, mock_parse_nport, mock_download_filing):
+        offline_index = fund_analyzer.reference_data.xbrl_facts.SharesOutstandingIndex(
+            {'0000000001': [['2024-12-31', 500]]}, cusip_to_cik={'CUSIPB': '0000000001'})
+        mock_get_router.return_value = fund_analyzer.reference_data.ReferenceDataRouter(
+            [fund_analyzer.reference_data.XbrlFactsProvider(index=offline_index)])
+        mock_parse_nport.return_value = ("Test Fund", 1000.0, [
+            {'name': 'Company A', 'cusip': 'CUSIPA', 'ticker': 'CMPA', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+            {'name': 'Company B', 'cusip': 'CUSIPB', 'ticker': None, 'shares_or_principal_amount': '100', 'market_value_usd': 700.0, 'percentage_of_fund': 70.0},
+        ])
+        with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+            with patch('fund_analyzer.time.sleep'):
+                result = fund_analyzer.analyze_fund_ownership("VFINX")
+
+        mock_get_shares.assert_called_once_with('CMPA', 'CUSIPA')
+        offline_holding = result['detailed_holdings'][1]
+        self.assertEqual(offline_holding['total_outstanding_shares'], 500)
+        self.assertAlmostEqual(offline_holding['percentage_of_company_owned_by_fund'], 20.0)
+        self.assertEqual(offline_holding['shares_outstanding_source'], "sec_xbrl")
+        self.assertEqual(result['holdings_resolved_offline'], 1)
+
+    def test_lookup_budget_deadline(self):
+        budget = fund_analyzer.LookupBudget(deadline_seconds=5)
+        self.assertIsNone(budget.exhausted_reason())
+        self.assertEqual(budget.exhausted_reason(next_call_delay=10), "Deadline")
+        self.assertFalse(fund_analyzer.LookupBudget().is_bounded())
+
+    def _run_concurrently(self, count, target):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def test_single_flight_coalesces_concurrent_calls(self):
+        flight = fund_analyzer.SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow_lookup():
+            calls.append(1)
+            release.wait(5)
+            return 42
+
+        threads = self._run_concurrently(5, lambda: results.append(flight.do("AAPL", slow_lookup)))
+        # Let every follower reach the in-flight call before the leader finishes
+        while flight.stats()['coalesced'] < 4:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(flight.stats(), {'calls': 1, 'coalesced': 4, 'in_flight': 0})
+        # Once the call has finished, the next caller makes a fresh call
+        self.assertEqual(flight.do("AAPL", lambda: 7), 7)
+
+    def test_single_flight_shares_errors(self):
+        flight = fund_analyzer.SingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def failing_lookup():
+            release.wait(5)
+            raise ValueError("provider down")
+
+        def caller():
+            try:
+                flight.do("MSFT", failing_lookup)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = self._run_concurrently(3, caller)
+        while flight.stats()['coalesced'] < 2:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, ["provider down"] * 3)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+    @patch('fund_analyzer.get_reference_data_router')
+    def test_get_company_shares_outstanding_coalesces_same_ticker(self, mock_get_router):
+        release = threading.Event()
+        def slow_shares(ticker=None, cusip=None):
+            release.wait(5)
+            return 1000, 'alpha_vantage'
+        mock_get_router.return_value.lookup_shares_outstanding.side_effect = slow_shares
+        results = []
+
+        threads = self._run_concurrently(3, lambda: results.append(fund_analyzer.get_company_shares_outstanding("aapl")))
+        while fund_analyzer.lookup_coalescing_stats()['coalesced'] < 2:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [1000] * 3)
+        self.assertEqual(mock_get_router.return_value.lookup_shares_outstanding.call_count, 1)
+
     def test_resolve_fund_ticker_to_cik(self):
         self.assertEqual(fund_analyzer.resolve_fund_ticker_to_cik("VFINX"), "0000036405")
         self.assertIsNone(fund_analyzer.resolve_fund_ticker_to_cik("UNKNOWNTICKER"))
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fund_similarity
+import fund_analyzer
+
+def _holdings(cusips, weight=None):
+    return [{'cusip': cusip, 'percentage_of_fund': weight if weight is not None else 100.0 / len(cusips)} for cusip in cusips]
+
+# Synthetic CUSIP universe: funds are index-like slices of it
+UNIVERSE = [f"{i:06d}AB1" for i in range(1, 1001)]
+
+class TestFundSimilarity(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.temp_dir, "fund_similarity.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _index(self, cik, series_id, holdings, accession=None, report_date="2025-03-31", form_type="NPORT-P"):
+        return fund_similarity.index_fund(cik, series_id, f"Fund {series_id}", accession or f"acc-{series_id}-{report_date}",
+                                          report_date, holdings, index_path=self.index_path, form_type=form_type)
+
+    def test_13f_managers_are_not_similar_funds(self):
+        self._index("0000000001", "S000000001", _holdings(UNIVERSE[:500]))
+        self._index("0000000002", None, _holdings(UNIVERSE[:500]))
+        # Same CIK as the single-series fund: kept apart from its N-PORT sketch
+        self._index("0000000002", None, _holdings(UNIVERSE[:400]), report_date="2025-06-30", form_type="13F-HR")
+        self._index("0000000009", None, _holdings(UNIVERSE[:500]), form_type="13F-HR")
+
+        fund = fund_similarity.find_fund_sketch(fund_cik="0000000001", index_path=self.index_path)
+        similar = fund_similarity.find_similar_funds(fund['signature'], fund['weights'], top_n=5,
+                                                     exclude_fund_key=fund['fund_key'], index_path=self.index_path)
+        self.assertEqual([(s['fund_cik'], s['accession']) for s in similar], [("0000000002", "acc-None-2025-03-31")])
+        self.assertEqual(len(fund_similarity.find_fund_sketch(fund_cik="0000000002", index_path=self.index_path)['weights']), 500)
+
+    def test_minhash_estimates_jaccard(self):
+        set_a, set_b = UNIVERSE[:600], UNIVERSE[200:800] # Jaccard 400 / 800
+        estimate = fund_similarity.estimate_jaccard(fund_similarity.minhash_signature(set_a),
+                                                    fund_similarity.minhash_signature(set_b))
+        self.assertAlmostEqual(estimate, 0.5, delta=0.15)
+        self.assertEqual(fund_similarity.minhash_signature(set_a), fund_similarity.minhash_signature(reversed(set_a)))
+        self.assertIsNone(fund_similarity.minhash_signature([]))
+
+    def test_similar_funds_are_found_and_reranked_by_weight(self):
+        self._index("0000000001", "S000000001", _holdings(UNIVERSE[:500]))      # Query fund
+        self._index("0000000002", "S000000002", _holdings(UNIVERSE[10:500]))    # Near copy
+        # Same CUSIPs as the query, but nearly all weight in one position: lower weight overlap
+        concentrated = _holdings(UNIVERSE[:500], weight=0.01)
+        concentrated[499]['percentage_of_fund'] = 95.0
+        self._index("0000000003", "S000000003", concentrated)
+        self._index("0000000004", "S000000004", _holdings(UNIVERSE[500:1000]))  # Disjoint
+
+        fund = fund_similarity.find_fund_sketch(fund_cik="0000000001", index_path=self.index_path)
+        similar = fund_similarity.find_similar_funds(fund['signature'], fund['weights'], top_n=5,
+                                                     exclude_fund_key=fund['fund_key'], index_path=self.index_path)
+        self.assertEqual([s['series_id'] for s in similar], ["S000000002", "S000000003"])
+        self.assertAlmostEqual(similar[0]['weight_overlap_pct'], 98.0)
+        self.assertGreater(similar[1]['estimated_jaccard'], similar[0]['estimated_jaccard'])
+
+        unranked = fund_similarity.find_similar_funds(fund['signature'], top_n=5, exclude_fund_key=fund['fund_key'],
+                                                      index_path=self.index_path)
+        self.assertEqual(unranked[0]['series_id'], "S000000003")
+        self.assertNotIn('weight_overlap_pct', unranked[0])
+
+    def test_fund_entry_keeps_its_latest_filing(self):
+        self.assertTrue(self._index("0000000001", "S000000001", _holdings(UNIVERSE[:100]), report_date="2025-03-31"))
+        self.assertFalse(self._index("0000000001", "S000000001", _holdings(UNIVERSE[500:600]), report_date="2024-12-31"))
+        self.assertTrue(self._index("0000000001", "S000000001", _holdings(UNIVERSE[100:200]), report_date="2025-06-30"))
+        self.assertFalse(self._index("0000000001", "S000000001", [{'cusip': '000000000'}], report_date="2025-09-30"))
+
+        fund = fund_similarity.find_fund_sketch(series_id="S000000001", index_path=self.index_path)
+        self.assertEqual(sorted(fund['weights']), UNIVERSE[100:200])
+
+    def test_find_similar_funds_by_series(self):
+        self._index("0000000001", "S000000001", _holdings(UNIVERSE[:200]))
+        self._index("0000000002", "S000000002", _holdings(UNIVERSE[:190]))
+        with patch('fund_similarity.INDEX_PATH', self.index_path):
+            result = fund_analyzer.find_similar_funds("s000000001")
+            missing = fund_analyzer.find_similar_funds("S000009999")
+
+        self.assertEqual(result['status'], "Lookup complete.")
+        self.assertEqual([s['series_id'] for s in result['similar_funds']], ["S000000002"])
+        self.assertEqual(missing['similar_funds'], [])
+
+if __name__ == '__main__':
+    unittest.main()
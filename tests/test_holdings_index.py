@@ -0,0 +1,98 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import holdings_index
+
+SAMPLE_HOLDINGS = [
+    {'name': 'APPLE INC', 'cusip': '037833100', 'ticker': 'AAPL', 'shares_or_principal_amount': '5000', 'market_value_usd': 1000000.0},
+    {'name': 'MICROSOFT CORP', 'cusip': '594918104', 'shares_or_principal_amount': '2000', 'market_value_usd': 800000.0},
+    {'name': 'NO IDENTIFIERS LP', 'shares_or_principal_amount': '10'},
+]
+
+class TestHoldingsIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.temp_dir, "holdings_index.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_index_filing_and_find_holders_by_cusip_and_ticker(self):
+        written = holdings_index.index_filing("0000001-25-000001", "0000000001", "S000000001", "Fund One",
+                                              "2025-03-31", 1e7, SAMPLE_HOLDINGS, index_path=self.index_path)
+        self.assertEqual(written, 2) # The holding without CUSIP or ticker is not indexed
+        holdings_index.index_filing("0000002-25-000001", "0000000002", "S000000002", "Fund Two",
+                                    "2025-03-31", 1e7, [SAMPLE_HOLDINGS[0]], index_path=self.index_path)
+
+        holders = holdings_index.find_holders("037833100", index_path=self.index_path)
+        self.assertEqual(len(holders), 2)
+        self.assertEqual({h['fund_name'] for h in holders}, {"Fund One", "Fund Two"})
+        self.assertEqual(holders[0]['balance'], 5000.0)
+
+        by_ticker = holdings_index.find_holders("aapl", index_path=self.index_path)
+        self.assertEqual(len(by_ticker), 2)
+
+        msft = holdings_index.find_holders("594918104", index_path=self.index_path)
+        self.assertEqual([h['fund_cik'] for h in msft], ["0000000001"])
+        self.assertEqual(holdings_index.find_holders("UNKNOWN", index_path=self.index_path), [])
+
+    def test_positions_are_summed_per_balance_unit(self):
+        holdings = [
+            {'name': 'APPLE INC', 'cusip': '037833100', 'shares_or_principal_amount': '100', 'market_value_usd': 10.0, 'units': 'NS'},
+            {'name': 'APPLE INC', 'cusip': '037833100', 'shares_or_principal_amount': '50', 'market_value_usd': 5.0, 'units': 'NS'},
+            {'name': 'APPLE INC', 'cusip': '037833100', 'shares_or_principal_amount': '20000', 'market_value_usd': 20.0, 'units': 'pa'},
+        ]
+        holdings_index.index_filing("0000001-25-000001", "0000000001", "S000000001", "Fund One",
+                                    "2025-03-31", 1e7, holdings, index_path=self.index_path)
+
+        holders = holdings_index.find_holders("037833100", index_path=self.index_path)
+        self.assertEqual([(h['units'], h['balance']) for h in holders], [('PA', 20000.0), ('NS', 150.0)])
+
+    def test_reindexing_same_accession_is_skipped(self):
+        args = ("0000001-25-000001", "0000000001", "S000000001", "Fund One", "2025-03-31", 1e7, SAMPLE_HOLDINGS)
+        self.assertEqual(holdings_index.index_filing(*args, index_path=self.index_path), 2)
+        self.assertEqual(holdings_index.index_filing(*args, index_path=self.index_path), 0)
+        self.assertTrue(holdings_index.is_indexed("0000001-25-000001", index_path=self.index_path))
+        self.assertEqual(len(holdings_index.find_holders("AAPL", index_path=self.index_path)), 1)
+
+    def test_only_latest_filing_per_series_is_reported(self):
+        holdings_index.index_filing("0000001-24-000001", "0000000001", "S000000001", "Fund One",
+                                    "2024-12-31", 1e7, SAMPLE_HOLDINGS, index_path=self.index_path)
+        # The newer filing no longer holds AAPL
+        holdings_index.index_filing("0000001-25-000001", "0000000001", "S000000001", "Fund One",
+                                    "2025-03-31", 1e7, [SAMPLE_HOLDINGS[1]], index_path=self.index_path)
+        self.assertEqual(holdings_index.find_holders("AAPL", index_path=self.index_path), [])
+        msft = holdings_index.find_holders("594918104", index_path=self.index_path)
+        self.assertEqual([h['accession'] for h in msft], ["0000001-25-000001"])
+
+    def test_amendment_for_same_report_date_replaces_original(self):
+        holdings_index.index_filing("0000001-25-000001", "0000000001", "S000000001", "Fund One",
+                                    "2025-03-31", 1e7, SAMPLE_HOLDINGS, index_path=self.index_path)
+        holdings_index.index_filing("0000001-25-000007", "0000000001", "S000000001", "Fund One",
+                                    "2025-03-31", 1e7, SAMPLE_HOLDINGS, index_path=self.index_path)
+        holders = holdings_index.find_holders("AAPL", index_path=self.index_path)
+        self.assertEqual([h['accession'] for h in holders], ["0000001-25-000007"])
+        self.assertEqual(holders[0]['balance'], 5000.0)
+
+    def test_13f_managers_are_not_counted_as_fund_holders(self):
+        holdings_index.index_filing("0000001-25-000001", "0000000001", "S000000001", "Fund One",
+                                    "2025-03-31", 1e7, SAMPLE_HOLDINGS, index_path=self.index_path, form_type="NPORT-P")
+        # The adviser's 13F repeats its fund's position; a single-series CIK has no series ID either way
+        holdings_index.index_filing("0000002-25-000001", "0000000002", None, "Adviser LLC",
+                                    "2025-06-30", 1e8, SAMPLE_HOLDINGS, index_path=self.index_path, form_type="13F-HR")
+        holdings_index.index_filing("0000003-25-000001", "0000000003", None, "Single Series Fund",
+                                    "2025-03-31", 1e7, SAMPLE_HOLDINGS, index_path=self.index_path, form_type="NPORT-P")
+        holdings_index.index_filing("0000003-25-000002", "0000000003", None, "Single Series Fund",
+                                    "2025-06-30", 1e7, SAMPLE_HOLDINGS, index_path=self.index_path, form_type="13F-HR")
+
+        holders = holdings_index.find_holders("AAPL", index_path=self.index_path)
+        self.assertEqual(sorted(h['accession'] for h in holders), ["0000001-25-000001", "0000003-25-000001"])
+
+if __name__ == '__main__':
+    unittest.main()
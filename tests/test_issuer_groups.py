@@ -0,0 +1,64 @@
+import unittest
+import os
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import issuer_groups
+
+ALPHABET_LEI = "5493006MHB84DD0ZWV18"
+
+class TestIssuerGroups(unittest.TestCase):
+
+    def test_identifier_normalization(self):
+        self.assertEqual(issuer_groups.normalize_lei(" 5493006mhb84dd0zwv18 "), ALPHABET_LEI)
+        self.assertIsNone(issuer_groups.normalize_lei("N/A"))
+        self.assertEqual(issuer_groups.cusip_issuer_prefix("02079K305"), "02079K")
+        self.assertIsNone(issuer_groups.cusip_issuer_prefix("000000000"))
+        self.assertIsNone(issuer_groups.cusip_issuer_prefix("N/A"))
+
+    def test_groups_join_on_lei_or_cusip_prefix(self):
+        holdings = [
+            {'name': 'Alphabet A', 'cusip': '02079K305', 'lei': ALPHABET_LEI},
+            {'name': 'Apple', 'cusip': '037833100', 'lei': 'N/A'},
+            {'name': 'Alphabet C', 'cusip': '02079K107'}, # No LEI: joins on the CUSIP prefix
+            {'name': 'Alphabet Bond', 'cusip': '38259PAB8', 'lei': ALPHABET_LEI}, # Old prefix, same LEI
+            {'name': 'Apple 2030 Note', 'cusip': '037833DX5'},
+            {'name': 'Cash', 'cusip': 'N/A'},
+        ]
+        groups = issuer_groups.group_holdings_by_issuer(holdings)
+        self.assertEqual([[h['name'] for h in g['holdings']] for g in groups],
+                         [['Alphabet A', 'Alphabet C', 'Alphabet Bond'], ['Apple', 'Apple 2030 Note'], ['Cash']])
+        self.assertEqual([g['issuer_key'] for g in groups], [f"LEI:{ALPHABET_LEI}", "CUSIP6:037833", "HOLDING:5"])
+
+    def test_different_leis_keep_separate_funds_of_one_family(self):
+        holdings = [
+            {'name': 'Vanguard Total Stock Market ETF', 'cusip': '922908769', 'lei': 'MW6OYM3ZCLWXOMFVYQ06'},
+            {'name': 'Vanguard Small-Cap ETF', 'cusip': '922908751', 'lei': '5493003VGNOPS8UZFF43'},
+        ]
+        self.assertEqual(len(issuer_groups.group_holdings_by_issuer(holdings)), 2)
+
+    def test_aggregate_counts_shares_not_principal(self):
+        holdings = [
+            {'name': 'Alphabet Inc Class A', 'cusip': '02079K305', 'lei': ALPHABET_LEI, 'ticker': 'GOOGL',
+             'shares_or_principal_amount': '300', 'units': 'NS', 'market_value_usd': 300.0, 'percentage_of_fund': 3.0},
+            {'name': 'Alphabet 1.1% 2030', 'cusip': '02079KAD9', 'lei': ALPHABET_LEI,
+             'shares_or_principal_amount': '5000', 'units': 'PA', 'market_value_usd': 4500.0, 'percentage_of_fund': 45.0},
+            {'name': 'Alphabet Inc Class C', 'cusip': '02079K107', 'lei': ALPHABET_LEI, 'ticker': 'GOOG',
+             'shares_or_principal_amount': '200', 'units': 'NS', 'market_value_usd': 200.0, 'percentage_of_fund': 2.0},
+        ]
+        [issuer] = issuer_groups.aggregate_by_issuer(holdings)
+        self.assertEqual(issuer['shares_or_principal_amount'], '500')
+        self.assertEqual(issuer['market_value_usd'], 5000.0)
+        self.assertEqual(issuer['percentage_of_fund'], 50.0)
+        # Named after, and looked up through, the largest share class
+        self.assertEqual(issuer['name'], 'Alphabet Inc Class A')
+        self.assertEqual((issuer['ticker'], issuer['cusip']), ('GOOGL', '02079K305'))
+        self.assertEqual(issuer['issuer_securities'], ['GOOGL', '02079KAD9', 'GOOG'])
+
+    def test_single_security_issuer_is_unchanged(self):
+        holding = {'name': 'Apple', 'cusip': '037833100', 'ticker': 'AAPL', 'shares_or_principal_amount': '10'}
+        self.assertEqual(issuer_groups.aggregate_by_issuer([holding]), [dict(holding, issuer_key="CUSIP6:037833")])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import json
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import look_through
+import sec_parser
+import filing_store
+
+TOTAL_STOCK_KEY = ("0000036405", "S000002848")
+INTERNATIONAL_KEY = ("0000857489", "S000002932")
+
+def _fund_position(name, lei, value, pct):
+    return {'name': name, 'lei': lei, 'issuer_category': 'RF', 'shares_or_principal_amount': '1000',
+            'market_value_usd': value, 'percentage_of_fund': pct}
+
+class TestLookThrough(unittest.TestCase):
+
+    def setUp(self):
+        self.resolver = look_through.FundResolver(tickers_path=None, series_map_path=None)
+        self.resolver.add("LEI-TOTAL-STOCK", *TOTAL_STOCK_KEY)
+        self.resolver.add("LEI-INTERNATIONAL", *INTERNATIONAL_KEY)
+        self.funds = {
+            TOTAL_STOCK_KEY: ("Total Stock Market Index Fund", 1000.0, [
+                {'name': 'Apple Inc', 'cusip': '037833100', 'shares_or_principal_amount': '50', 'market_value_usd': 600.0, 'percentage_of_fund': 60.0},
+                _fund_position("Total International Stock Index Fund", "LEI-INTERNATIONAL", 400.0, 40.0),
+            ]),
+            INTERNATIONAL_KEY: ("Total International Stock Index Fund", 2000.0, [
+                {'name': 'Nestle SA', 'shares_or_principal_amount': '300', 'market_value_usd': 1500.0, 'percentage_of_fund': 75.0},
+                # A fund holding its parent is a cycle and must not recurse forever
+                _fund_position("Total Stock Market Index Fund", "LEI-TOTAL-STOCK", 500.0, 25.0),
+            ]),
+        }
+        self.load_fund = MagicMock(side_effect=lambda cik, series_id: self.funds.get((cik, series_id)))
+        # Reads of the sample filing record access times; keep them out of the real store's manifest
+        self.manifest_dir = tempfile.mkdtemp()
+        self.store_patch = patch('filing_store._default_store',
+                                 filing_store.FilingStore(manifest_path=os.path.join(self.manifest_dir, "filing_store.json")))
+        self.store_patch.start()
+
+    def tearDown(self):
+        self.store_patch.stop()
+        shutil.rmtree(self.manifest_dir)
+
+    def test_positions_are_weighted_through_each_level(self):
+        holdings = [
+            {'name': 'Cash', 'market_value_usd': 50.0, 'percentage_of_fund': 5.0},
+            _fund_position("Vanguard Total Stock Market Index Fund Investor", "LEI-TOTAL-STOCK", 100.0, 10.0),
+        ]
+        expander = look_through.LookThrough(self.resolver, max_depth=3, load_fund=self.load_fund)
+        exposures = expander.expand(holdings)
+
+        by_name = {e['name']: e for e in exposures}
+        self.assertIs(exposures[0], holdings[0]) # Direct holdings are passed through untouched
+        # 100 of 1000 in Total Stock: a tenth of its Apple position
+        apple = by_name['Apple Inc']
+        self.assertAlmostEqual(apple['market_value_usd'], 60.0)
+        self.assertEqual(apple['shares_or_principal_amount'], '5')
+        self.assertAlmostEqual(apple['percentage_of_fund'], 6.0)
+        self.assertEqual(apple['look_through_path'], ["Total Stock Market Index Fund"])
+        # ...and through Total Stock's 400 of 2000 in International: 40 / 2000 of Nestle
+        nestle = by_name['Nestle SA']
+        self.assertAlmostEqual(nestle['market_value_usd'], 30.0)
+        self.assertAlmostEqual(nestle['percentage_of_fund'], 3.0)
+        self.assertEqual(nestle['look_through_path'], ["Total Stock Market Index Fund", "Total International Stock Index Fund"])
+        self.assertEqual(by_name['Total Stock Market Index Fund']['look_through'], 'cycle')
+        self.assertEqual(expander.stats['cycle'], 1)
+
+    def test_shared_funds_are_loaded_once_and_depth_is_bounded(self):
+        holdings = [_fund_position("Total Stock A", "LEI-TOTAL-STOCK", 100.0, 10.0),
+                    _fund_position("Total Stock B", "LEI-TOTAL-STOCK", 200.0, 20.0),
+                    _fund_position("Unknown Fund", "LEI-UNKNOWN", 10.0, 1.0)]
+        expander = look_through.LookThrough(self.resolver, max_depth=1, load_fund=self.load_fund)
+        exposures = expander.expand(holdings)
+
+        self.load_fund.assert_called_once_with(*TOTAL_STOCK_KEY)
+        self.assertEqual([e.get('look_through') for e in exposures], [None, 'depth_limit', None, 'depth_limit', 'unresolved'])
+        self.assertEqual(expander.stats['expanded'], 2)
+
+    def test_root_series_is_a_cycle_from_the_start(self):
+        holdings = [_fund_position("Total Stock Market Index Fund", "LEI-TOTAL-STOCK", 100.0, 10.0)]
+        expander = look_through.LookThrough(self.resolver, max_depth=3, load_fund=self.load_fund)
+        exposures = expander.expand(holdings, root_key=TOTAL_STOCK_KEY)
+
+        self.load_fund.assert_not_called()
+        self.assertEqual(exposures[0]['look_through'], 'cycle')
+        self.assertEqual(expander.stats['cycle'], 1)
+
+    def test_read_filing_metadata_gives_the_root_series(self):
+        sample_dir = os.path.join(os.path.dirname(__file__), '..', 'sec_filings', 'sec-edgar-filings', '0000036405', 'NPORT-P')
+        filing_metadata = sec_parser.read_filing_metadata(sample_dir)
+        self.assertEqual(filing_metadata['series_id'], "S000012756")
+        self.assertEqual(filing_metadata['accession'], "0001752724-25-126276")
+
+    def test_resolver_reads_fund_tickers_and_series_map(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            tickers_path = os.path.join(temp_dir, "company_tickers_mf.json")
+            with open(tickers_path, 'w') as f:
+                json.dump({'fields': ['cik', 'seriesId', 'classId', 'symbol'], 'data': [[36405, 'S000002848', 'C000007806', 'VTSMX']]}, f)
+            series_map_path = os.path.join(temp_dir, "fund_series_map.json")
+            with open(series_map_path, 'w') as f:
+                json.dump({'549300FMUHDRE8RWWO12': {'cik': '857489', 'series_id': 'S000002932'}}, f)
+            resolver = look_through.FundResolver(tickers_path, series_map_path)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        self.assertEqual(resolver.resolve({'ticker': 'vtsmx'}), TOTAL_STOCK_KEY)
+        self.assertEqual(resolver.resolve({'lei': '549300FMUHDRE8RWWO12', 'cusip': '921909768'}), INTERNATIONAL_KEY)
+        self.assertIsNone(resolver.resolve({'name': 'Unknown'}))
+
+class TestSeriesFilingDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write_series_filing(self, accession, series_id):
+        accession_dir = os.path.join(self.temp_dir, 'sec-edgar-filings', "0000036405", "NPORT-P", accession)
+        os.makedirs(accession_dir, exist_ok=True)
+        with open(os.path.join(accession_dir, "full-submission.txt"), 'w') as f:
+            f.write(f"<SEC-DOCUMENT>\n<SEC-HEADER>\nCONFORMED SUBMISSION TYPE:\tNPORT-P\n<SERIES>\n<SERIES-ID>{series_id}\n"
+                    f"</SEC-HEADER>\n<DOCUMENT>\n<TEXT>\n<XML>\n<edgarSubmission/>\n</XML>\n")
+
+    @patch('sec_parser.dl')
+    def test_download_latest_series_filing_picks_series_by_header(self, mock_dl):
+        self._write_series_filing("0001752724-25-000001", "S000002848")
+        mock_dl.get.side_effect = lambda *args, **kwargs: self._write_series_filing("0001752724-25-000002", "S000012756")
+
+        with patch('sec_parser.DOWNLOAD_PATH', self.temp_dir), patch('sec_parser.MANAGE_FILING_STORE', False):
+            filing_directory_path, accession = sec_parser.download_latest_series_filing("0000036405", "S000002848")
+            missing = sec_parser.download_latest_series_filing("0000036405", "S000099999")
+
+        self.assertEqual(accession, "0001752724-25-000001")
+        self.assertEqual(filing_directory_path, os.path.join(self.temp_dir, 'sec-edgar-filings', "0000036405", "NPORT-P"))
+        self.assertEqual(mock_dl.get.call_args_list[0].kwargs['accession_numbers_to_skip'], {"0001752724-25-000001"})
+        self.assertEqual(missing, (None, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mail_delivery
+
+def make_http_error(status, content=b'{}'):
+    return HttpError(httplib2.Response({'status': status}), content)
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.batches_executed += 1
+        if self.service.execute_errors:
+            raise self.service.execute_errors.pop(0)
+        for request_id, request in self.requests:
+            outcome = self.service.outcomes.pop(0) if self.service.outcomes else None
+            if isinstance(outcome, Exception):
+                self.callback(request_id, None, outcome)
+            else:
+                self.service.sent.append(request['body']['raw'])
+                self.callback(request_id, {'id': f"msg-{request_id}"}, None)
+
+class FakeGmailService:
+    """Local stand-in for the Gmail service: records sends, can fail requests in order."""
+    def __init__(self, outcomes=None):
+        self.outcomes = list(outcomes or [])
+        self.execute_errors = []
+        self.sent = []
+        self.batches_executed = 0
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def users(self):
+        messages = MagicMock()
+        messages.messages.return_value.send.side_effect = lambda userId, body: {'userId': userId, 'body': body}
+        return messages
+
+class TestMailDelivery(unittest.TestCase):
+
+    def test_flush_sends_in_batches_with_one_service(self):
+        service = FakeGmailService()
+        queue = mail_delivery.GmailDeliveryQueue(service=service, batch_size=2)
+        request_ids = queue.add_text([f"user{i}@example.com" for i in range(5)], "Subject", "Body")
+
+        results = queue.flush()
+
+        self.assertEqual(len(service.sent), 5)
+        self.assertEqual(service.batches_executed, 3)
+        self.assertEqual([results[request_id] for request_id in request_ids], [f"msg-{r}" for r in request_ids])
+        self.assertEqual(queue.flush(), {}) # Queue is empty after flushing
+
+    @patch('mail_delivery.time.sleep')
+    def test_rate_limited_messages_are_retried(self, mock_sleep):
+        service = FakeGmailService(outcomes=[make_http_error(429), None, None])
+        queue = mail_delivery.GmailDeliveryQueue(service=service)
+        first, second = queue.add_text(["a@example.com", "b@example.com"], "Subject", "Body")
+
+        results = queue.flush()
+
+        self.assertEqual(results[first], f"msg-{first}")
+        self.assertEqual(results[second], f"msg-{second}")
+        self.assertEqual(service.batches_executed, 2)
+        mock_sleep.assert_called_once_with(mail_delivery.RETRY_BACKOFF_SECONDS)
+
+    @patch('mail_delivery.time.sleep')
+    def test_permanent_errors_and_exhausted_retries_fail(self, mock_sleep):
+        service = FakeGmailService(outcomes=[make_http_error(400)] + [make_http_error(429)] * 10)
+        queue = mail_delivery.GmailDeliveryQueue(service=service, max_retries=2)
+        bad_request, throttled = queue.add_text(["a@example.com", "b@example.com"], "Subject", "Body")
+
+        results = queue.flush()
+
+        self.assertIsNone(results[bad_request])
+        self.assertIsNone(results[throttled])
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch('mail_delivery.time.sleep')
+    def test_connection_errors_are_retried_and_never_escape(self, mock_sleep):
+        service = FakeGmailService()
+        service.execute_errors = [TimeoutError("timed out"), httplib2.ServerNotFoundError("no route")]
+        queue = mail_delivery.GmailDeliveryQueue(service=service)
+        request_ids = queue.add_text(["a@example.com", "b@example.com"], "Subject", "Body")
+        results = queue.flush()
+        self.assertTrue(all(results[request_id] for request_id in request_ids))
+        self.assertEqual(len(service.sent), 2)
+
+        service.execute_errors = [ValueError("unexpected")]
+        request_ids = queue.add_text(["c@example.com"], "Subject", "Body")
+        self.assertEqual(queue.flush(), {request_ids[0]: None})
+
+    def test_is_retryable_error(self):
+        self.assertTrue(mail_delivery.is_retryable_error(make_http_error(429)))
+        self.assertTrue(mail_delivery.is_retryable_error(make_http_error(503)))
+        self.assertTrue(mail_delivery.is_retryable_error(
+            make_http_error(403, b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}')))
+        self.assertFalse(mail_delivery.is_retryable_error(make_http_error(403, b'{"error": "forbidden"}')))
+        self.assertFalse(mail_delivery.is_retryable_error(ValueError("not http")))
+
+    @patch('mail_delivery.build')
+    @patch('mail_delivery.report_generator.gmail_authenticate')
+    def test_authenticates_once_across_flushes(self, mock_authenticate, mock_build):
+        mock_build.return_value = FakeGmailService()
+        queue = mail_delivery.GmailDeliveryQueue()
+        queue.add_text(["a@example.com"], "Subject", "Body")
+        queue.flush()
+        queue.add_text(["b@example.com"], "Subject", "Body")
+        queue.flush()
+
+        mock_authenticate.assert_called_once()
+        mock_build.assert_called_once()
+
+    @patch('mail_delivery.report_generator.gmail_authenticate', return_value=None)
+    def test_auth_failure_marks_all_messages_failed(self, mock_authenticate):
+        queue = mail_delivery.GmailDeliveryQueue()
+        request_ids = queue.add_text(["a@example.com", "b@example.com"], "Subject", "Body")
+        results = queue.flush()
+        self.assertEqual(results, {request_id: None for request_id in request_ids})
+
+if __name__ == '__main__':
+    unittest.main()
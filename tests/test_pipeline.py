@@ -0,0 +1,188 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import csv
+import gzip
+import tempfile
+import shutil
+import threading
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pipeline
+import fund_analyzer
+import reference_data
+
+SAMPLE_HOLDINGS = [
+    {'name': 'APPLE INC', 'cusip': '037833100', 'ticker': 'AAPL', 'market_value_usd': 1000000.0, 'shares_or_principal_amount': '5000', 'percentage_of_fund': 8.1},
+    {'name': 'MICROSOFT CORP', 'cusip': '594918104', 'ticker': 'MSFT', 'market_value_usd': 800000.0, 'shares_or_principal_amount': '2000', 'percentage_of_fund': 6.5},
+    {'name': 'NO TICKER CO', 'cusip': '000000000', 'ticker': None, 'market_value_usd': 5000.0, 'shares_or_principal_amount': '10', 'percentage_of_fund': 0.1},
+    {'name': 'ALPHABET INC', 'cusip': '02079K305', 'ticker': 'GOOGL', 'market_value_usd': 600000.0, 'shares_or_principal_amount': '1500', 'percentage_of_fund': 4.9},
+]
+
+def fake_stream(filing_directory_path, filing_metadata):
+    filing_metadata.update({'fund_name': "Test Fund", 'total_net_assets': 12345000.0,
+                            'accession': "0000123-45-678910", 'fund_cik': "0000036405"})
+    for holding in SAMPLE_HOLDINGS:
+        yield dict(holding)
+
+class FakeProvider(reference_data.SharesOutstandingProvider):
+    name = "fake_paid"
+    cost = 10
+
+    def __init__(self):
+        self.threads_seen = set()
+
+    def get_shares_outstanding(self, ticker=None, cusip=None, cik=None):
+        self.threads_seen.add(threading.current_thread().name)
+        return 1000000
+
+@patch('pipeline.sec_parser.FilingIndexRecorder')
+@patch('pipeline.sec_parser.iter_nport_holdings', side_effect=fake_stream)
+@patch('pipeline.sec_parser.download_latest_fund_holding_filing', return_value="/fake/path")
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        fund_analyzer.reset_reference_data_router()
+        self.provider = FakeProvider()
+        self.router = reference_data.ReferenceDataRouter([reference_data.CacheProvider(), self.provider])
+        self.router_patch = patch('pipeline.fund_analyzer.get_reference_data_router', return_value=self.router)
+        self.router_patch.start()
+        self.env_patch = patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'})
+        self.env_patch.start()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.router_patch.stop()
+        self.env_patch.stop()
+        shutil.rmtree(self.temp_dir)
+
+    @patch('fund_analyzer.time.sleep')
+    def test_pipeline_returns_results_in_filing_order(self, mock_sleep, mock_download, mock_stream, mock_record):
+        result = pipeline.run_analysis_pipeline("VFINX", lookup_workers=3, queue_size=2)
+
+        self.assertEqual(result['status'], "Analysis complete.")
+        self.assertEqual(result['fund_name'], "Test Fund")
+        self.assertEqual(result['holdings_count'], 4)
+        self.assertEqual([h['name'] for h in result['detailed_holdings']], [h['name'] for h in SAMPLE_HOLDINGS])
+        self.assertEqual(result['holdings_processed_for_company_ownership'], 3)
+        self.assertAlmostEqual(result['detailed_holdings'][0]['percentage_of_company_owned_by_fund'], 0.5)
+        self.assertEqual(result['detailed_holdings'][2]['total_outstanding_shares'], "N/A (No Ticker/Shares)")
+        self.assertTrue(all(name.startswith("pipeline-lookup-") for name in self.provider.threads_seen))
+        mock_record.return_value.finish.assert_called_once_with("Test Fund", 12345000.0)
+        self.assertEqual(mock_record.return_value.add.call_count, 4)
+        self.assertEqual(result['allocations']['sector'][0]['holdings_count'], 4)
+
+    @patch('fund_analyzer.time.sleep')
+    def test_pipeline_respects_shared_budget(self, mock_sleep, mock_download, mock_stream, mock_record):
+        result = pipeline.run_analysis_pipeline("VFINX", lookup_workers=4, max_api_calls=1)
+
+        self.assertEqual(result['holdings_processed_for_company_ownership'], 1)
+        self.assertEqual(result['lookup_budget_exhausted'], "API Call Limit")
+        skipped = [h for h in result['detailed_holdings'] if h['total_outstanding_shares'] == "Skipped (API Call Limit)"]
+        self.assertEqual(len(skipped), 2)
+
+    @patch('fund_analyzer.time.sleep')
+    def test_pipeline_feeds_export_writers(self, mock_sleep, mock_download, mock_stream, mock_record):
+        export_path = os.path.join(self.temp_dir, "holdings.csv.gz")
+        writer = pipeline.CsvExportWriter(export_path)
+        extra_writer = MagicMock()
+
+        pipeline.run_analysis_pipeline("VFINX", writers=[writer, extra_writer], min_percentage_of_fund=1.0)
+
+        with gzip.open(export_path, 'rt', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(sorted(row['name'] for row in rows), ["ALPHABET INC", "APPLE INC", "MICROSOFT CORP"])
+        self.assertEqual(extra_writer.write.call_count, 3)
+        extra_writer.close.assert_called_once()
+
+    @patch('fund_analyzer.time.sleep')
+    def test_pipeline_makes_one_metered_call_per_ticker(self, mock_sleep, mock_download, mock_stream, mock_record):
+        share_classes = [dict(SAMPLE_HOLDINGS[0], name=f"APPLE INC LOT {i}") for i in range(6)]
+        def duplicate_stream(filing_directory_path, filing_metadata):
+            filing_metadata['fund_name'] = "Test Fund"
+            for holding in share_classes:
+                yield dict(holding)
+        mock_stream.side_effect = duplicate_stream
+        paid_calls = []
+        self.provider.get_shares_outstanding = lambda ticker=None, cusip=None, cik=None: paid_calls.append(ticker) or 1000000
+
+        result = pipeline.run_analysis_pipeline("VFINX", lookup_workers=4)
+
+        self.assertEqual(paid_calls, ["AAPL"])
+        self.assertEqual(result['holdings_processed_for_company_ownership'], 1)
+        self.assertTrue(all(h['total_outstanding_shares'] == 1000000 for h in result['detailed_holdings']))
+
+    @patch('fund_analyzer.time.sleep')
+    def test_pipeline_does_not_coalesce_tickerless_holdings_with_different_cusips(self, mock_sleep, mock_download,
+                                                                                 mock_stream, mock_record):
+        tickerless = [
+            {'name': 'BOND ISSUER A', 'cusip': '111111AA1', 'shares_or_principal_amount': '100', 'percentage_of_fund': 1.0},
+            {'name': 'BOND ISSUER B', 'cusip': '222222BB2', 'shares_or_principal_amount': '100', 'percentage_of_fund': 1.0},
+        ]
+        def tickerless_stream(filing_directory_path, filing_metadata):
+            filing_metadata['fund_name'] = "Test Fund"
+            for holding in tickerless:
+                yield dict(holding)
+        mock_stream.side_effect = tickerless_stream
+        # Both lookups must be in flight at once; a coalesced second caller would leave the first one waiting
+        both_in_flight = threading.Barrier(2, timeout=5)
+        outstanding = {'111111AA1': 1000, '222222BB2': 4000}
+        def get_shares_outstanding(ticker=None, cusip=None, cik=None):
+            both_in_flight.wait()
+            return outstanding[cusip]
+        self.provider.get_shares_outstanding = get_shares_outstanding
+
+        result = pipeline.run_analysis_pipeline("VFINX", lookup_workers=2)
+
+        self.assertEqual([h['total_outstanding_shares'] for h in result['detailed_holdings']], [1000, 4000])
+        self.assertEqual(result['holdings_processed_for_company_ownership'], 2)
+
+    @patch('fund_analyzer.time.sleep')
+    def test_pipeline_stats_cover_only_the_current_run(self, mock_sleep, mock_download, mock_stream, mock_record):
+        first = pipeline.run_analysis_pipeline("VFINX", lookup_workers=2)
+        # Same process, same router and coalescing layer: the second run's cache answers everything
+        second = pipeline.run_analysis_pipeline("VFINX", lookup_workers=2)
+
+        self.assertEqual(first['reference_data_stats']['fake_paid']['calls'], 3)
+        self.assertEqual(second['reference_data_stats']['fake_paid']['calls'], 0)
+        # One free lookup per holding, not this run's plus the first run's
+        self.assertEqual(second['reference_data_stats']['cache']['calls'], len(SAMPLE_HOLDINGS))
+        self.assertEqual(second['lookup_coalescing']['calls'], 0)
+        self.assertEqual(first['lookup_coalescing']['calls'], 3)
+
+    @patch('fund_analyzer.time.sleep')
+    def test_pipeline_reports_parser_failure(self, mock_sleep, mock_download, mock_stream, mock_record):
+        def failing_stream(filing_directory_path, filing_metadata):
+            filing_metadata['fund_name'] = "Test Fund"
+            yield dict(SAMPLE_HOLDINGS[0])
+            raise ValueError("truncated XML")
+        mock_stream.side_effect = failing_stream
+
+        result = pipeline.run_analysis_pipeline("VFINX", lookup_workers=2)
+
+        self.assertEqual(result['status'], "Parsing failed after 1 holdings: truncated XML")
+        self.assertEqual(len(result['detailed_holdings']), 1)
+        self.assertIsNone(result['allocations'])
+        mock_record.return_value.close.assert_called_once()
+        mock_record.return_value.finish.assert_not_called()
+
+    def test_pipeline_unknown_fund(self, mock_download, mock_stream, mock_record):
+        result = pipeline.run_analysis_pipeline("UNKNOWN_FUND")
+        self.assertEqual(result['status'], "CIK resolution failed.")
+        mock_download.assert_not_called()
+
+class TestCallSpacer(unittest.TestCase):
+
+    @patch('fund_analyzer.time.sleep')
+    @patch('fund_analyzer.time.monotonic', return_value=100.0)
+    def test_calls_are_spaced_across_callers(self, mock_monotonic, mock_sleep):
+        spacer = fund_analyzer.CallSpacer(1.5)
+        spacer.wait()
+        spacer.wait()
+        spacer.wait()
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [1.5, 3.0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import patch
+import os
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import reference_data
+
+class FakeProvider(reference_data.SharesOutstandingProvider):
+    def __init__(self, name, cost, answers=None, error=None):
+        self.name = name
+        self.cost = cost
+        self.answers = answers or {}
+        self.error = error
+        self.calls = 0
+
+    def get_shares_outstanding(self, ticker=None, cusip=None, cik=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.answers.get(ticker)
+
+class TestReferenceDataRouter(unittest.TestCase):
+
+    def test_cheapest_provider_answers_first_and_result_is_cached(self):
+        cache = reference_data.CacheProvider()
+        offline = FakeProvider("offline", 0, {'AAA': 100})
+        paid = FakeProvider("paid", 10, {'AAA': 999, 'BBB': 200})
+        router = reference_data.ReferenceDataRouter([paid, cache, offline])
+
+        self.assertEqual(router.lookup_shares_outstanding(ticker='AAA'), (100, "offline"))
+        self.assertEqual(paid.calls, 0)
+
+        self.assertEqual(router.lookup_shares_outstanding(ticker='BBB'), (200, "paid"))
+        self.assertEqual(router.lookup_shares_outstanding(ticker='bbb'), (200, "cache"))
+        self.assertEqual(paid.calls, 1)
+
+        stats = router.stats_summary()
+        self.assertEqual(stats['paid']['successes'], 1)
+        self.assertEqual(stats['cache']['successes'], 1)
+
+    def test_max_cost_restricts_to_free_providers(self):
+        paid = FakeProvider("paid", 10, {'AAA': 999})
+        router = reference_data.ReferenceDataRouter([paid])
+        self.assertEqual(router.lookup_shares_outstanding(ticker='AAA', max_cost=0), (None, None))
+        self.assertEqual(paid.calls, 0)
+
+    def test_throttled_provider_is_skipped_until_cooldown(self):
+        throttled = FakeProvider("throttled", 1, error=reference_data.ProviderThrottled("5 calls per minute"))
+        fallback = FakeProvider("fallback", 5, {'AAA': 300})
+        router = reference_data.ReferenceDataRouter([throttled, fallback], throttle_cooldown_seconds=60)
+
+        self.assertEqual(router.get_shares_outstanding(ticker='AAA'), 300)
+        self.assertEqual(router.get_shares_outstanding(ticker='AAA'), 300)
+        self.assertEqual(throttled.calls, 1)
+        self.assertEqual(router.stats_summary()['throttled']['throttled'], 1)
+
+    def test_slow_provider_is_tried_last_among_its_cost(self):
+        slow = FakeProvider("slow", 0, {'AAA': 1, 'BBB': 3})
+        fast = FakeProvider("fast", 0, {'AAA': 2})
+        paid = FakeProvider("paid", 5, {'AAA': 9, 'BBB': 9})
+        router = reference_data.ReferenceDataRouter([paid, slow, fast], slow_threshold_seconds=1.0)
+        router.stats['slow'].latencies.extend([3.0] * 20)
+
+        self.assertEqual(router.lookup_shares_outstanding(ticker='AAA'), (2, "fast"))
+        self.assertEqual(slow.calls, 0)
+        self.assertEqual(router.stats['slow'].p95_latency, 3.0)
+        # A slow free provider still comes before paid quota
+        self.assertEqual(router.lookup_shares_outstanding(ticker='BBB'), (3, "slow"))
+        self.assertEqual(paid.calls, 0)
+
+    def test_placeholder_cusip_is_not_a_cache_key(self):
+        cache = reference_data.CacheProvider()
+        paid = FakeProvider("paid", 10, {'IBM': 900, 'AAPL': 15000})
+        router = reference_data.ReferenceDataRouter([cache, paid])
+
+        self.assertEqual(router.lookup_shares_outstanding(ticker='IBM', cusip='N/A'), (900, "paid"))
+        self.assertEqual(router.lookup_shares_outstanding(ticker='AAPL', cusip='N/A'), (15000, "paid"))
+        cache.store_shares_outstanding(123, ticker='MSFT', cusip='000000000')
+        self.assertIsNone(cache.get_shares_outstanding(ticker='GOOG', cusip='000000000'))
+        self.assertEqual(router.lookup_shares_outstanding(ticker='aapl', cusip=None), (15000, "cache"))
+
+    def test_provider_must_implement_shares_lookup(self):
+        class IncompleteProvider(reference_data.SharesOutstandingProvider):
+            name = "incomplete"
+        with self.assertRaises(TypeError):
+            IncompleteProvider()
+
+    def test_failing_provider_falls_through(self):
+        broken = FakeProvider("broken", 0, error=reference_data.ProviderError("boom"))
+        working = FakeProvider("working", 1, {'AAA': 5})
+        router = reference_data.ReferenceDataRouter([broken, working])
+        self.assertEqual(router.get_shares_outstanding(ticker='AAA'), 5)
+        self.assertEqual(router.stats_summary()['broken']['success_rate'], 0.0)
+
+class TestAlphaVantageProvider(unittest.TestCase):
+
+    @patch('alpha_vantage.fundamentaldata.FundamentalData.get_company_overview')
+    def test_rate_limit_message_raises_throttled(self, mock_get_overview):
+        mock_get_overview.side_effect = ValueError("Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute.")
+        provider = reference_data.AlphaVantageProvider("fake_key")
+        with self.assertRaises(reference_data.ProviderThrottled):
+            provider.get_shares_outstanding(ticker="AAA")
+
+    @patch('alpha_vantage.fundamentaldata.FundamentalData.get_company_overview')
+    def test_invalid_symbol_is_a_miss(self, mock_get_overview):
+        mock_get_overview.side_effect = ValueError("Invalid API call. Please retry or visit the documentation.")
+        provider = reference_data.AlphaVantageProvider("fake_key")
+        self.assertIsNone(provider.get_shares_outstanding(ticker="NOPE"))
+
+    @patch('alpha_vantage.fundamentaldata.FundamentalData.get_company_overview')
+    def test_one_overview_call_answers_shares_and_metadata(self, mock_get_overview):
+        mock_get_overview.return_value = ({'SharesOutstanding': '1000', 'Name': 'AAA Corp', 'Sector': 'TECHNOLOGY', 'CIK': '123'}, None)
+        provider = reference_data.AlphaVantageProvider("fake_key")
+        self.assertEqual(provider.get_shares_outstanding(ticker="AAA"), 1000)
+        metadata = provider.get_ticker_metadata("AAA")
+        self.assertEqual(metadata['sector'], 'TECHNOLOGY')
+        self.assertEqual(metadata['cik'], '0000000123')
+        mock_get_overview.assert_called_once()
+
+    def test_demo_key_only_answers_ibm(self):
+        provider = reference_data.AlphaVantageProvider("demo")
+        self.assertIsNone(provider.get_shares_outstanding(ticker="AAPL"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import os
+import io
+import gzip
+import csv
+import tempfile
+import shutil
 
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -35,6 +40,71 @@ class TestReportGenerator(unittest.TestCase):
         self.assertIn("Name: Test Company XYZ", report)
         self.assertIn("Percentage of Company Owned by Fund: 0.010000%", report)
 
+    def test_format_data_for_email_orders_by_market_value(self):
+        detailed_holdings = [
+            {'name': f'Company {i}', 'market_value_in_fund': float(i), 'percentage_of_company_owned_by_fund': i / 100.0}
+            for i in range(30)
+        ]
+        analysis_result = {"fund_cik": "000TESTCIK", "detailed_holdings": detailed_holdings, "status": "Analysis complete."}
+
+        report = report_generator.format_data_for_email(analysis_result, max_holdings=3)
+        self.assertIn("Top 3 of 30 holdings by market value", report)
+        self.assertIn("1. Name: Company 29", report)
+        self.assertIn("3. Name: Company 27", report)
+        self.assertNotIn("Company 26", report)
+
+        report = report_generator.format_data_for_email(analysis_result, min_company_ownership_pct=0.285)
+        self.assertIn("Name: Company 29", report)
+        self.assertNotIn("Company 28", report)
+
+    def test_build_report_message_html_and_csv_attachment(self):
+        detailed_holdings = [
+            {'name': f'Company <{i}>', 'cusip': f'CUSIP{i}', 'ticker': f'T{i}', 'shares_held_by_fund_str': '100',
+             'market_value_in_fund': float(i), 'percentage_of_fund': 0.1,
+             'total_outstanding_shares': 1000, 'percentage_of_company_owned_by_fund': 10.0}
+            for i in range(50)
+        ]
+        analysis_result = {"fund_cik": "000TESTCIK", "fund_name": "Test & Fund", "holdings_count": 50,
+                           "detailed_holdings": detailed_holdings, "status": "Analysis complete."}
+
+        message = report_generator.build_report_message("test@example.com", "Subject", analysis_result, max_holdings=5)
+        self.assertEqual(message['to'], "test@example.com")
+        body, attachment = message.get_payload()
+        text_part, html_part = body.get_payload()
+        self.assertEqual(html_part.get_content_type(), "text/html")
+        html_report = html_part.get_payload(decode=True).decode('utf-8')
+        self.assertIn("Test &amp; Fund", html_report)
+        self.assertIn("Company &lt;49&gt;", html_report)
+        self.assertNotIn("Company &lt;44&gt;", html_report)
+        text_report = text_part.get_payload(decode=True).decode('utf-8')
+        self.assertIn("Name: Company <49>", text_report)
+        self.assertIn("attached compressed CSV (holdings_000TESTCIK.csv.gz)", text_report)
+
+        self.assertEqual(attachment.get_filename(), "holdings_000TESTCIK.csv.gz")
+        csv_text = gzip.decompress(attachment.get_payload(decode=True)).decode('utf-8')
+        rows = list(csv.DictReader(io.StringIO(csv_text)))
+        self.assertEqual(len(rows), 50) # The attachment carries every holding, not just the top ones
+        self.assertEqual(rows[0]['cusip'], 'CUSIP0')
+
+    def test_build_report_message_omits_oversized_csv(self):
+        analysis_result = {"fund_cik": "000TESTCIK", "fund_name": "Test Fund", "holdings_count": 1,
+                           "detailed_holdings": [{'name': 'Company A', 'market_value_in_fund': 1.0}],
+                           "status": "Analysis complete."}
+        reports_path = tempfile.mkdtemp()
+        try:
+            with patch('report_generator.GMAIL_MAX_ATTACHMENT_BYTES', 10), \
+                 patch('report_generator.REPORTS_PATH', reports_path):
+                message = report_generator.build_report_message("test@example.com", "Subject", analysis_result)
+            saved_path = os.path.join(reports_path, "holdings_000TESTCIK.csv.gz")
+            self.assertTrue(os.path.exists(saved_path))
+        finally:
+            shutil.rmtree(reports_path)
+
+        (body,) = message.get_payload() # No attachment part
+        text_report = body.get_payload()[0].get_payload(decode=True).decode('utf-8')
+        self.assertNotIn("attached", text_report)
+        self.assertIn(f"too large to attach and was omitted; it was saved to {saved_path}", text_report)
+
     def test_format_data_for_email_failure_status(self):
         analysis_result = {"status": "Download failed.", "fund_cik": "000FAIL"}
         report = report_generator.format_data_for_email(analysis_result)
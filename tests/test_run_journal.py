@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import run_journal
+import fund_analyzer
+
+SAMPLE_HOLDINGS = [
+    {'name': 'Company A', 'ticker': 'CMPA', 'shares_or_principal_amount': '100', 'market_value_usd': 100.0, 'percentage_of_fund': 10.0},
+    {'name': 'Company B', 'ticker': 'CMPB', 'shares_or_principal_amount': '100', 'market_value_usd': 700.0, 'percentage_of_fund': 70.0},
+    {'name': 'Company C', 'ticker': 'CMPC', 'shares_or_principal_amount': '100', 'market_value_usd': 200.0, 'percentage_of_fund': 20.0},
+]
+
+class TestRunJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.runs_path = os.path.join(self.temp_dir, "runs")
+        fund_analyzer.reset_reference_data_router()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_journal_replays_stages_and_lookups(self):
+        journal = run_journal.RunJournal.start("VFINX", {'top': 10}, runs_path=self.runs_path)
+        journal.record_stage('parse', fund_name="Test Fund", holdings=SAMPLE_HOLDINGS)
+        journal.record_lookup("037833100", "aapl", 15000000000, "alpha_vantage")
+        journal.close()
+
+        resumed = run_journal.RunJournal.resume(journal.run_id, runs_path=self.runs_path)
+        self.assertEqual(resumed.fund, "VFINX")
+        self.assertEqual(resumed.options, {'top': 10})
+        self.assertEqual(resumed.stage('parse')['holdings'], SAMPLE_HOLDINGS)
+        self.assertIsNone(resumed.stage('download'))
+        self.assertEqual(resumed.lookup_result("037833100", "AAPL"), (15000000000, "alpha_vantage"))
+        self.assertIsNone(resumed.lookup_result("594918104", "MSFT"))
+        self.assertIsNone(resumed.completed_status)
+
+    def test_torn_last_line_is_ignored(self):
+        journal = run_journal.RunJournal.start("VFINX", runs_path=self.runs_path)
+        journal.record_lookup(None, "CMPA", 1000, "alpha_vantage")
+        journal.close()
+        with open(journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"type": "lookup", "ticker": "CM') # Crash in the middle of a write
+
+        resumed = run_journal.RunJournal.resume(journal.run_id, runs_path=self.runs_path)
+        self.assertEqual(resumed.lookup_result(None, "CMPA"), (1000, "alpha_vantage"))
+        self.assertEqual(len(resumed.lookups), 1)
+
+    def test_resume_unknown_run(self):
+        self.assertIsNone(run_journal.RunJournal.resume("no-such-run", runs_path=self.runs_path))
+
+    @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing')
+    @patch('fund_analyzer.sec_parser.parse_nport_xml_filing', return_value=("Test Fund", 1000.0, SAMPLE_HOLDINGS))
+    @patch('fund_analyzer.lookup_company_shares_outstanding')
+    def test_interrupted_analysis_resumes_without_repeating_work(self, mock_get_shares, mock_parse_nport, mock_download_filing):
+        mock_download_filing.return_value = self.temp_dir
+        # The second lookup dies (e.g. Ctrl-C) after the first one was paid for
+        mock_get_shares.side_effect = [(1000, 'alpha_vantage'), KeyboardInterrupt()]
+        journal = run_journal.RunJournal.start("VFINX", runs_path=self.runs_path)
+        with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+            with patch('fund_analyzer.time.sleep'):
+                with self.assertRaises(KeyboardInterrupt):
+                    fund_analyzer.analyze_fund_ownership("VFINX", journal=journal)
+                journal.close()
+
+                mock_get_shares.reset_mock(side_effect=True)
+                mock_get_shares.return_value = (2000, 'alpha_vantage')
+                resumed = run_journal.RunJournal.resume(journal.run_id, runs_path=self.runs_path)
+                result = fund_analyzer.analyze_fund_ownership("VFINX", journal=resumed)
+
+        self.assertEqual(mock_download_filing.call_count, 1)
+        self.assertEqual(mock_parse_nport.call_count, 1)
+        self.assertEqual([c.args[0] for c in mock_get_shares.call_args_list], ['CMPB', 'CMPC'])
+        self.assertEqual(result['holdings_resumed_from_checkpoint'], 1)
+        self.assertEqual(result['detailed_holdings'][0]['total_outstanding_shares'], 1000)
+        self.assertEqual(result['run_id'], journal.run_id)
+        self.assertEqual(resumed.completed_status, "Analysis complete.")
+
+    @patch('fund_analyzer.sec_parser.FilingIndexRecorder')
+    @patch('fund_analyzer.sec_parser.download_latest_fund_holding_filing')
+    @patch('fund_analyzer.sec_parser.iter_nport_holdings')
+    @patch('fund_analyzer.lookup_company_shares_outstanding')
+    def test_selection_while_parsing_checkpoints_selected_holdings(self, mock_get_shares, mock_iter_nport,
+                                                                   mock_download_filing, mock_recorder_class):
+        mock_download_filing.return_value = self.temp_dir
+        mock_iter_nport.side_effect = lambda path, filing_metadata: iter([dict(h) for h in SAMPLE_HOLDINGS])
+        mock_recorder_class.return_value.holdings_count = len(SAMPLE_HOLDINGS)
+        mock_get_shares.side_effect = [(1000, 'alpha_vantage'), KeyboardInterrupt()]
+        journal = run_journal.RunJournal.start("VFINX", {'top': 2}, runs_path=self.runs_path)
+        with patch.dict(os.environ, {'ALPHA_VANTAGE_API_KEY': 'fakekey_for_test'}):
+            with patch('fund_analyzer.time.sleep'):
+                with self.assertRaises(KeyboardInterrupt):
+                    fund_analyzer.analyze_fund_ownership("VFINX", top_n=2, journal=journal)
+                journal.close()
+
+                mock_get_shares.reset_mock(side_effect=True)
+                mock_get_shares.return_value = (2000, 'alpha_vantage')
+                resumed = run_journal.RunJournal.resume(journal.run_id, runs_path=self.runs_path)
+                result = fund_analyzer.analyze_fund_ownership("VFINX", top_n=2, journal=resumed)
+
+        self.assertEqual(mock_iter_nport.call_count, 1)
+        self.assertEqual(len(resumed.stage('parse')['holdings']), 2)
+        self.assertEqual(result['holdings_count'], len(SAMPLE_HOLDINGS))
+        self.assertEqual(result['holdings_selected'], 2)
+        self.assertEqual(result['holdings_resumed_from_checkpoint'], 1)
+        self.assertEqual(mock_get_shares.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
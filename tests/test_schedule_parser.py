@@ -0,0 +1,125 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import schedule_parser
+import sec_parser
+
+SAMPLE_NQ_HTML_SUBMISSION = """<SEC-DOCUMENT>0000932471-19-000001.txt : 20190529
+<SEC-HEADER>0000932471-19-000001.hdr.sgml : 20190529
+CONFORMED SUBMISSION TYPE:	N-Q
+CONFORMED PERIOD OF REPORT:	20190331
+	COMPANY DATA:
+		COMPANY CONFORMED NAME:			VANGUARD INDEX FUNDS
+<SERIES>
+<SERIES-ID>S000002839
+<SERIES-NAME>Vanguard 500 Index Fund
+</SEC-HEADER>
+<DOCUMENT>
+<TYPE>N-Q
+<TEXT>
+<html><body>
+<p>Schedule of Investments (unaudited) As of March 31, 2019</p>
+<table>
+<tr><td></td><td align="right">Shares</td><td></td><td align="right">Market<br>Value&#8226;<br>($000)</td></tr>
+<tr><td><b>Common Stocks (99.5%)</b></td><td></td><td></td><td></td></tr>
+<tr><td>Apple Inc.</td><td align="right">1,000,000</td><td>$</td><td align="right">189,950</td></tr>
+<tr><td>Microsoft Corp.*</td><td align="right">2,500</td><td>$</td><td align="right">295
+<tr><td>Vanguard Value Index Fund</td><td align="right">10</td><td></td><td align="right">(1)</td></tr>
+<tr><td>Total Common Stocks (Cost $100,000)</td><td></td><td></td><td align="right">190,244</td></tr>
+</table>
+<table>
+<tr><td>Net Assets (100%)</td><td></td><td></td><td align="right">200,000</td></tr>
+</table>
+</body></html>
+</TEXT>
+</DOCUMENT>
+</SEC-DOCUMENT>
+"""
+
+SAMPLE_NQ_TEXT_DOCUMENT = """<DOCUMENT>
+<TYPE>N-Q
+<TEXT>
+                                SCHEDULE OF INVESTMENTS
+                                                            MARKET VALUE
+                                              SHARES          (DOLLARS)
+COMMON STOCKS
+Exxon Mobil Corp.                             12,000        $   960,000
+General Electric Co.                           3,500            105,000
+Total Common Stocks                                           1,065,000
+</TEXT>
+</DOCUMENT>
+"""
+
+class TestScheduleParser(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write_document(self, name, content, filing_type="N-Q"):
+        accession_dir = os.path.join(self.temp_dir, "sec-edgar-filings", "0000036405", filing_type, "0000932471-19-000001")
+        os.makedirs(accession_dir)
+        path = os.path.join(accession_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_html_schedule_rows_become_holdings(self):
+        path = self._write_document("full-submission.txt", SAMPLE_NQ_HTML_SUBMISSION)
+        filing_metadata = {}
+        holdings = list(schedule_parser.iter_schedule_holdings(path, schedule_parser.HTML_SCHEDULE, filing_metadata))
+
+        # Values are in thousands; the subtotal row is skipped and footnote markers are dropped
+        self.assertEqual([(h['name'], h['shares_or_principal_amount'], h['market_value_usd']) for h in holdings],
+                         [("Apple Inc.", "1000000", 189950000.0), ("Microsoft Corp.", "2500", 295000.0),
+                          ("Vanguard Value Index Fund", "10", -1000.0)])
+        self.assertEqual(filing_metadata['total_net_assets'], 200000000.0)
+
+    def test_text_schedule_is_split_on_column_gaps(self):
+        path = self._write_document("full-submission.txt", SAMPLE_NQ_TEXT_DOCUMENT)
+        fund_name, total_net_assets, holdings = schedule_parser.parse_schedule_document(
+            path, schedule_parser.TEXT_SCHEDULE, {'fund_name': "Test Fund"})
+
+        self.assertEqual(fund_name, "Test Fund")
+        self.assertIsNone(total_net_assets)
+        self.assertEqual([(h['name'], h['shares_or_principal_amount'], h['market_value_usd']) for h in holdings],
+                         [("Exxon Mobil Corp.", "12000", 960000.0), ("General Electric Co.", "3500", 105000.0)])
+
+    def test_pre_formatted_schedule_inside_html(self):
+        path = self._write_document("primary-document.html", "<html><body><pre>\n" +
+                                    SAMPLE_NQ_TEXT_DOCUMENT.split("<TEXT>\n", 1)[1].split("</TEXT>", 1)[0] + "</pre></body></html>")
+        holdings = list(schedule_parser.iter_schedule_holdings(path, schedule_parser.HTML_SCHEDULE))
+        self.assertEqual([h['name'] for h in holdings], ["Exxon Mobil Corp.", "General Electric Co."])
+
+    def test_sniff_document_reads_sgml_header_and_format(self):
+        path = self._write_document("full-submission.txt", SAMPLE_NQ_HTML_SUBMISSION)
+        document_format, header_fields = sec_parser.sniff_document(path)
+        self.assertEqual(document_format, schedule_parser.HTML_SCHEDULE)
+        self.assertEqual(header_fields, {'form_type': "N-Q", 'report_date': "2019-03-31", 'registrant_name': "VANGUARD INDEX FUNDS",
+                                         'series_id': "S000002839", 'fund_name': "Vanguard 500 Index Fund"})
+
+        xml_path = os.path.join(os.path.dirname(path), "nport.txt")
+        with open(xml_path, 'w', encoding='utf-8') as f:
+            f.write("<SEC-DOCUMENT>\n<TYPE>NPORT-P\n<TEXT>\n<XML>\n<edgarSubmission></edgarSubmission>\n</XML>\n")
+        self.assertEqual(sec_parser.sniff_document(xml_path)[0], 'nport_xml')
+
+    def test_parse_nport_xml_filing_dispatches_schedules(self):
+        path = self._write_document("full-submission.txt", SAMPLE_NQ_HTML_SUBMISSION)
+        with patch('sec_parser.UPDATE_HOLDINGS_INDEX', False):
+            fund_name, total_net_assets, holdings = sec_parser.parse_nport_xml_filing(os.path.dirname(os.path.dirname(path)))
+
+        self.assertEqual(fund_name, "Vanguard 500 Index Fund")
+        self.assertEqual(total_net_assets, 200000000.0)
+        self.assertEqual(len(holdings), 3)
+        self.assertAlmostEqual(holdings[0]['percentage_of_fund'], 94.975)
+
+if __name__ == '__main__':
+    unittest.main()
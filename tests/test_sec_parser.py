@@ -67,6 +67,47 @@ SAMPLE_FULL_SUBMISSION_TXT_CONTENT = f"""
 """
 
 
+SAMPLE_13F_FULL_SUBMISSION_TXT_CONTENT = """
+<SEC-DOCUMENT>
+<DOCUMENT>
+<TYPE>13F-HR
+<TEXT>
+<XML>
+<edgarSubmission xmlns="http://www.sec.gov/edgar/thirteenffiler">
+  <headerData><filerInfo><filer><credentials><cik>0001067983</cik></credentials></filer>
+    <periodOfReport>09-30-2022</periodOfReport></filerInfo></headerData>
+  <formData>
+    <coverPage><reportCalendarOrQuarter>09-30-2022</reportCalendarOrQuarter>
+      <filingManager><name>Test Capital Management</name></filingManager></coverPage>
+    <signatureBlock><name>Jane Signer</name></signatureBlock>
+    <summaryPage><tableEntryTotal>2</tableEntryTotal><tableValueTotal>1000</tableValueTotal></summaryPage>
+  </formData>
+</edgarSubmission>
+</XML>
+</TEXT>
+</DOCUMENT>
+<DOCUMENT>
+<TYPE>INFORMATION TABLE
+<TEXT>
+<XML>
+<informationTable xmlns="http://www.sec.gov/edgar/document/thirteenf/informationtable">
+  <infoTable>
+    <nameOfIssuer>APPLE INC</nameOfIssuer><titleOfClass>COM</titleOfClass><cusip>037833100</cusip>
+    <value>750</value><shrsOrPrnAmt><sshPrnamt>5000</sshPrnamt><sshPrnamtType>SH</sshPrnamtType></shrsOrPrnAmt>
+    <investmentDiscretion>SOLE</investmentDiscretion>
+  </infoTable>
+  <infoTable>
+    <nameOfIssuer>APPLE INC</nameOfIssuer><titleOfClass>CALL</titleOfClass><cusip>037833100</cusip>
+    <value>250</value><shrsOrPrnAmt><sshPrnamt>1000</sshPrnamt><sshPrnamtType>SH</sshPrnamtType></shrsOrPrnAmt>
+    <putCall>Call</putCall><investmentDiscretion>SOLE</investmentDiscretion>
+  </infoTable>
+</informationTable>
+</XML>
+</TEXT>
+</DOCUMENT>
+</SEC-DOCUMENT>
+"""
+
 class TestSecParser(unittest.TestCase):
 
     def setUp(self):
@@ -204,5 +245,60 @@ class TestSecParser(unittest.TestCase):
         self.mock_downloader_instance.get.assert_called_with("NPORT-EX", cik, limit=1) # Last call
         self.assertEqual(result_path, expected_path_nport_ex)
 
+    def _write_filing(self, file_name, content, filing_type="NPORT-P"):
+        filing_dir = os.path.join(self.test_download_path, "sec-edgar-filings", "0000012345", filing_type)
+        accession_dir = os.path.join(filing_dir, "0000123-45-678910")
+        os.makedirs(accession_dir)
+        with open(os.path.join(accession_dir, file_name), 'w', encoding='utf-8') as f:
+            f.write(content)
+        return filing_dir
+
+    def test_iter_nport_holdings_streams_full_submission_txt(self):
+        filing_dir = self._write_filing("full-submission.txt", SAMPLE_FULL_SUBMISSION_TXT_CONTENT)
+        filing_metadata = {}
+
+        holdings_stream = sec_parser.iter_nport_holdings(filing_dir, filing_metadata)
+        first_holding = next(holdings_stream)
+        # Fund-level fields come before the holdings and are available with the first one
+        self.assertEqual(first_holding['ticker'], "AAPL")
+        self.assertEqual(filing_metadata['fund_name'], "Test Fund Series A")
+        self.assertEqual(filing_metadata['total_net_assets'], 12345000.00)
+
+        remaining = list(holdings_stream)
+        self.assertEqual([h['name'] for h in remaining], ["MICROSOFT CORP"])
+        self.assertEqual(filing_metadata['accession'], "0000123-45-678910")
+        self.assertEqual(filing_metadata['fund_cik'], "0000012345")
+
+    def test_iter_nport_holdings_matches_full_parse_for_xml_file(self):
+        filing_dir = self._write_filing("primary_doc.xml", SAMPLE_NPORT_P_XML_CONTENT.strip())
+        with patch('sec_parser.UPDATE_HOLDINGS_INDEX', False):
+            _, _, parsed_holdings = sec_parser.parse_nport_xml_filing(filing_dir)
+        self.assertEqual(list(sec_parser.iter_nport_holdings(filing_dir)), parsed_holdings)
+
+    def test_iter_13f_holdings_streams_information_table(self):
+        filing_dir = self._write_filing("full-submission.txt", SAMPLE_13F_FULL_SUBMISSION_TXT_CONTENT, "13F-HR")
+        filing_metadata = {}
+
+        holdings = list(sec_parser.iter_13f_holdings(filing_dir, filing_metadata))
+
+        self.assertEqual(filing_metadata['fund_name'], "Test Capital Management") # Not the signer's name
+        self.assertEqual(filing_metadata['report_date'], "2022-09-30")
+        self.assertEqual(filing_metadata['fund_cik'], "0001067983")
+        # Periods before 2022-12-31 report values in thousands of dollars
+        self.assertEqual(filing_metadata['total_net_assets'], 1000000.0)
+        self.assertEqual([(h['cusip'], h['market_value_usd'], h['shares_or_principal_amount'], h.get('put_call')) for h in holdings],
+                         [("037833100", 750000.0, "5000", None), ("037833100", 250000.0, "1000", "Call")])
+        self.assertAlmostEqual(holdings[0]['percentage_of_fund'], 75.0)
+        self.assertEqual(holdings[0]['units'], "SH")
+
+    def test_parse_13f_filing_returns_manager_and_total(self):
+        filing_dir = self._write_filing("full-submission.txt",
+                                        SAMPLE_13F_FULL_SUBMISSION_TXT_CONTENT.replace("09-30-2022", "03-31-2025"), "13F-HR")
+        with patch('sec_parser.UPDATE_HOLDINGS_INDEX', False):
+            manager_name, table_value_total, holdings = sec_parser.parse_13f_filing(filing_dir)
+        self.assertEqual(manager_name, "Test Capital Management")
+        self.assertEqual(table_value_total, 1000.0)
+        self.assertEqual(len(holdings), 2)
+
 if __name__ == '__main__':
     unittest.main()
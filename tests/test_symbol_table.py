@@ -0,0 +1,63 @@
+import unittest
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import symbol_table
+import sec_parser
+
+HOLDING_XML = """<invstOrSec xmlns="http://www.sec.gov/edgar/nport">
+  <name>Apple Inc</name><cusip>037833100</cusip><balance>100</balance><units>NS</units>
+  <valUSD>1000</valUSD><pctVal>1.5</pctVal><assetCat>EC</assetCat><issuerCat>CORP</issuerCat><invCountry>US</invCountry>
+</invstOrSec>"""
+
+class TestSymbolTable(unittest.TestCase):
+
+    def test_encode_decode(self):
+        table = symbol_table.SymbolTable()
+        self.assertEqual([table.encode(v) for v in ["US", "GB", "US", None]], [0, 1, 0, None])
+        self.assertEqual(table.decode(1), "GB")
+        self.assertEqual(len(table), 2)
+        self.assertEqual(symbol_table.SymbolTable(["US", "GB"]).encode("JP"), 2)
+
+    def test_intern_shares_instances_up_to_the_cap(self):
+        table = symbol_table.SymbolTable(max_symbols=1)
+        first = "".join(["Apple", " Inc"])
+        second = "".join(["Apple", " Inc"])
+        self.assertIsNot(first, second)
+        self.assertIs(table.intern(first), first)
+        self.assertIs(table.intern(second), first)
+        overflow = "".join(["Micro", "soft"])
+        self.assertIs(table.intern(overflow), overflow)
+        self.assertEqual(len(table), 1)
+
+    def test_concurrent_encoding_assigns_one_code_per_value(self):
+        table = symbol_table.SymbolTable(max_symbols=1000)
+        values = [f"Issuer {i % 50}" for i in range(2000)]
+        codes = {}
+        def encode_all(worker):
+            codes[worker] = [table.encode(value) for value in values]
+            for value in values:
+                table.intern("".join(value))
+        threads = [threading.Thread(target=encode_all, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(table), 50)
+        self.assertTrue(all(worker_codes == codes[0] for worker_codes in codes.values()))
+        self.assertEqual([table.decode(code) for code in codes[0]], values)
+
+    def test_parsed_holdings_share_categorical_strings(self):
+        first = sec_parser.parse_holding_element(ET.fromstring(HOLDING_XML))
+        second = sec_parser.parse_holding_element(ET.fromstring(HOLDING_XML))
+        self.assertEqual(first, second)
+        for field in ('name', 'asset_category', 'issuer_category', 'country', 'units'):
+            self.assertIs(first[field], second[field])
+
+if __name__ == '__main__':
+    unittest.main()
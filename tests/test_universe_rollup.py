@@ -0,0 +1,133 @@
+import unittest
+from unittest.mock import patch
+import os
+import csv
+import gzip
+import tempfile
+import shutil
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import universe_rollup
+import filing_store
+
+SAMPLE_FILINGS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sec_filings'))
+SAMPLE_FILING_DIR = os.path.join(SAMPLE_FILINGS_PATH, 'sec-edgar-filings', '0000036405', 'NPORT-P')
+
+def _holding(cusip, shares, value, units='NS', name=None):
+    return {'cusip': cusip, 'shares_or_principal_amount': shares, 'market_value_usd': value, 'units': units,
+            'name': name or f"Issuer {cusip}"}
+
+class TestUniverseRollup(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        # Reads of the sample filing record access times; keep them out of the real store's manifest
+        self.manifest_dir = tempfile.mkdtemp()
+        self.store_patch = patch('filing_store._default_store',
+                                 filing_store.FilingStore(manifest_path=os.path.join(self.manifest_dir, "filing_store.json")))
+        self.store_patch.start()
+
+    def tearDown(self):
+        self.store_patch.stop()
+        shutil.rmtree(self.temp_dir)
+        shutil.rmtree(self.manifest_dir)
+
+    def test_spilled_runs_merge_into_per_security_totals(self):
+        aggregator = universe_rollup.ExternalAggregator(self.temp_dir, run_rows=2)
+        aggregator.add("fund-b", _holding("BBB000002", 10, 100.0))
+        aggregator.add("fund-a", _holding("AAA000001", 5, 50.0))
+        aggregator.add("fund-a", _holding("BBB000002", 20, 200.0))
+        aggregator.add("fund-a", _holding("BBB000002", 1, 10.0)) # Second lot of the same fund
+        aggregator.add("fund-c", _holding("BBB000002", 1000, 999.0, units='PA')) # Principal amount, not shares
+        self.assertFalse(aggregator.add("fund-c", _holding("N/A", 1, 1.0)))
+        self.assertFalse(aggregator.add("fund-c", _holding("000000000", 1, 1.0)))
+
+        totals = list(aggregator.iter_totals())
+        self.assertEqual(len(aggregator.run_paths), 3)
+        self.assertEqual([t['cusip'] for t in totals], ["AAA000001", "BBB000002"])
+        self.assertEqual(totals[1]['fund_count'], 3)
+        self.assertEqual(totals[1]['positions_count'], 4)
+        self.assertEqual(totals[1]['shares_held'], 31)
+        self.assertAlmostEqual(totals[1]['market_value_usd'], 1309.0)
+
+        work_dir = aggregator.work_dir
+        aggregator.close()
+        self.assertFalse(os.path.exists(work_dir))
+
+    def test_rollup_covers_one_quarter_and_the_latest_filing_per_series(self):
+        filing_metadata = {
+            "0000000001-25-000001": {'fund_cik': '1', 'series_id': 'S1', 'report_date': '2025-03-31'},
+            "0000000001-25-000002": {'fund_cik': '1', 'series_id': 'S1', 'report_date': '2025-03-31'}, # Refiled
+            "0000000001-25-000003": {'fund_cik': '1', 'series_id': 'S2', 'report_date': '2025-03-31'},
+            "0000000001-24-000009": {'fund_cik': '1', 'series_id': 'S1', 'report_date': '2024-12-31'},
+            "0000000002-25-000001": {'fund_cik': '2', 'series_id': None, 'report_date': None},
+            "0000000003-25-000001": {'fund_cik': None, 'series_id': None, 'report_date': '2025-03-31'}, # No CIK
+        }
+        events = []
+
+        def filings():
+            # Each filing is "downloaded" only once the previous one has been read
+            for accession in filing_metadata:
+                events.append(('download', accession))
+                yield "dir", accession
+
+        def iter_holdings(filing_directory_path, metadata, accession=None):
+            events.append(('read', accession))
+            yield _holding("AAA000001", 10, 100.0)
+
+        with patch('sec_parser.read_filing_metadata', side_effect=lambda path, accession: dict(filing_metadata[accession])), \
+                patch('sec_parser.iter_nport_holdings', side_effect=iter_holdings):
+            result = universe_rollup.run_universe_rollup(filings(), work_dir=self.temp_dir, resolve_shares_outstanding=False)
+            self.assertEqual(result['period'], "2025Q1")
+            self.assertEqual(events[:4], [('download', "0000000001-25-000001"), ('read', "0000000001-25-000001"),
+                                          ('download', "0000000001-25-000002"), ('read', "0000000001-25-000002")])
+            # The older 2024Q4 filing, the undated one and the one without a CIK are never read
+            self.assertEqual([accession for event, accession in events if event == 'read'],
+                             ["0000000001-25-000001", "0000000001-25-000002", "0000000001-25-000003"])
+            # The refiled series counts once, with the holdings of its latest filing
+            self.assertEqual(result['filings_count'], 2)
+            self.assertEqual(result['holdings_rows'], 2)
+            self.assertEqual(result['top_securities'][0]['fund_count'], 2)
+            self.assertEqual(result['top_securities'][0]['shares_held'], 20)
+
+            earlier = universe_rollup.run_universe_rollup(filings(), work_dir=self.temp_dir, resolve_shares_outstanding=False,
+                                                          period="2024Q4")
+            self.assertEqual(earlier['filings_count'], 1)
+            self.assertEqual(earlier['top_securities'][0]['shares_held'], 10)
+
+    @unittest.skipUnless(os.path.isdir(SAMPLE_FILING_DIR), "Sample N-PORT filing not present")
+    def test_rollup_of_local_filings_matches_in_memory_totals(self):
+        output_path = os.path.join(self.temp_dir, "rollup.csv.gz")
+        filings = list(universe_rollup.local_filings(download_path=SAMPLE_FILINGS_PATH))
+        self.assertIn((SAMPLE_FILING_DIR, "0001752724-25-126276"), filings)
+        sample = [(SAMPLE_FILING_DIR, "0001752724-25-126276")]
+
+        result = universe_rollup.run_universe_rollup(sample, output_path, top_n=5, work_dir=self.temp_dir,
+                                                     run_rows=16, resolve_shares_outstanding=False)
+        self.assertEqual(result['filings_count'], 1)
+        self.assertEqual(result['period'], "2025Q1")
+        self.assertGreater(result['runs_count'], 1)
+        with gzip.open(output_path, 'rt', encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), result['securities_count'])
+        self.assertEqual([row['cusip'] for row in rows], sorted(row['cusip'] for row in rows))
+        total_value = sum(float(row['market_value_usd']) for row in rows)
+
+        # The same filing in a single in-memory run gives the same totals
+        in_memory = universe_rollup.run_universe_rollup(sample, top_n=5, work_dir=self.temp_dir,
+                                                        resolve_shares_outstanding=False)
+        self.assertEqual(in_memory['runs_count'], 1)
+        self.assertEqual(in_memory['securities_count'], result['securities_count'])
+        self.assertEqual(in_memory['top_securities'], result['top_securities'])
+        self.assertEqual(len(result['top_securities']), 5)
+        values = [t['market_value_usd'] for t in result['top_securities']]
+        self.assertEqual(values, sorted(values, reverse=True))
+        self.assertLessEqual(sum(values), total_value)
+        self.assertIn("Universe Ownership Rollup", universe_rollup.format_rollup_report(result))
+        # Only the output file is left behind
+        self.assertEqual(os.listdir(self.temp_dir), ["rollup.csv.gz"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import json
+import tempfile
+import shutil
+import zipfile
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import xbrl_facts
+
+def company_facts(cik, observations):
+    return {'cik': cik, 'entityName': f"Company {cik}",
+            'facts': {'dei': {'EntityCommonStockSharesOutstanding': {'units': {'shares': observations}}}}}
+
+class TestXbrlFacts(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.archive_path = os.path.join(self.temp_dir, "companyfacts.zip")
+        with zipfile.ZipFile(self.archive_path, 'w') as archive:
+            archive.writestr("CIK0000320193.json", json.dumps(company_facts(320193, [
+                {'end': '2024-10-18', 'val': 15115823000, 'filed': '2024-11-01'},
+                {'end': '2025-01-17', 'val': 15037874000, 'filed': '2025-01-31'},
+                {'end': '2025-01-17', 'val': 15037875000, 'filed': '2025-02-15'}, # Amendment wins
+            ])))
+            archive.writestr("CIK0000000002.json", json.dumps({'cik': 2, 'facts': {'us-gaap': {}}}))
+        self.tickers_path = os.path.join(self.temp_dir, "company_tickers.json")
+        with open(self.tickers_path, 'w') as f:
+            json.dump({"0": {"cik_str": 320193, "ticker": "AAPL", "title": "Apple Inc."}}, f)
+        self.cusips_path = os.path.join(self.temp_dir, "cusips.csv")
+        with open(self.cusips_path, 'w') as f:
+            f.write("cusip,cik\n037833100,320193\n")
+        self.index_path = os.path.join(self.temp_dir, "index.json.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_build_and_lookup_by_cik_ticker_and_cusip(self):
+        count = xbrl_facts.build_index(self.archive_path, self.tickers_path, self.cusips_path, self.index_path)
+        self.assertEqual(count, 1) # The filer without the dei concept is left out
+
+        index = xbrl_facts.SharesOutstandingIndex.load(self.index_path)
+        self.assertEqual(index.get_shares_outstanding(cik="320193"), 15037875000)
+        self.assertEqual(index.get_shares_outstanding(ticker="aapl"), 15037875000)
+        self.assertEqual(index.get_shares_outstanding(cusip="037833100"), 15037875000)
+        self.assertIsNone(index.get_shares_outstanding(ticker="MSFT"))
+
+    def test_as_of_lookup(self):
+        xbrl_facts.build_index(self.archive_path, output_path=self.index_path)
+        index = xbrl_facts.SharesOutstandingIndex.load(self.index_path)
+        self.assertEqual(index.get_shares_outstanding(cik=320193, as_of="2024-12-31"), 15115823000)
+        self.assertEqual(index.get_shares_outstanding(cik=320193, as_of="2025-01-17"), 15037875000)
+        self.assertIsNone(index.get_shares_outstanding(cik=320193, as_of="2020-01-01"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,299 @@
+import os
+import csv
+import gzip
+import heapq
+import shutil
+import argparse
+import tempfile
+
+import sec_parser
+import edgar_index
+import issuer_groups
+import fund_analyzer
+import symbol_table
+import analysis_history
+
+# Universe-wide ownership rollup in fixed memory. Holdings of every filing are streamed out of the
+# parser into a bounded buffer; whenever it fills, it is sorted by CUSIP and spilled to a compressed
+# run file. The runs are then k-way merged, so all rows of one CUSIP arrive together and are folded
+# into that security's totals before the next one starts. Memory is bounded by RUN_ROWS plus one row
+# per run, however many funds and holdings the universe has. Filings are downloaded and spilled one at
+# a time. A rollup covers one report quarter and the latest filing of each fund series in it, so no fund
+# is counted twice; a filing superseded after it was spilled is dropped during the merge. Filing keys
+# (accession numbers) are dictionary-encoded into integer codes for the run files (see symbol_table.py),
+# and names arrive already interned by the parser.
+RUN_ROWS = 250000
+# Spill files are read back once; favour speed over ratio
+RUN_COMPRESSION_LEVEL = 1
+TOP_SECURITIES_IN_REPORT = 25
+OUTPUT_COLUMNS = ['cusip', 'name', 'ticker', 'fund_count', 'positions_count', 'shares_held', 'market_value_usd',
+                  'total_outstanding_shares', 'percentage_owned_by_funds', 'shares_outstanding_source']
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+class ExternalAggregator:
+    """
+    Accumulates (filing, holding) rows into sorted run files under a private work directory, and merges
+    them into per-CUSIP totals. Each filing key stands for one fund (its filing for the period), so
+    distinct keys are counted as distinct funds. Call close() to delete the run files.
+    """
+    def __init__(self, work_dir=None, run_rows=RUN_ROWS):
+        self.run_rows = run_rows
+        self.work_dir = tempfile.mkdtemp(prefix="rollup-", dir=work_dir)
+        self.run_paths = []
+        self.rows_added = 0
+        self.filing_keys = symbol_table.SymbolTable() # One code per filing, for this rollup only
+        self._buffer = []
+
+    def add(self, filing_key, holding):
+        """Adds one holding of one filing. Holdings without a usable CUSIP cannot be matched across funds and are skipped."""
+        cusip = (holding.get('cusip') or '').strip().upper()
+        if not cusip or cusip == "N/A" or cusip.startswith('000000'):
+            return False
+        # Principal amounts and contracts are not shares of the issuer
+        units = (holding.get('units') or 'NS').upper()
+        shares = _to_float(holding.get('shares_or_principal_amount')) if units in issuer_groups.SHARE_UNITS else 0.0
+        self._buffer.append((cusip, self.filing_keys.encode(filing_key), shares, _to_float(holding.get('market_value_usd')),
+                             holding.get('name') or '', holding.get('ticker') or ''))
+        self.rows_added += 1
+        if len(self._buffer) >= self.run_rows:
+            self._spill()
+        return True
+
+    def _spill(self):
+        if not self._buffer:
+            return
+        self._buffer.sort()
+        run_path = os.path.join(self.work_dir, f"run-{len(self.run_paths):05d}.csv.gz")
+        with gzip.open(run_path, 'wt', encoding='utf-8', newline='', compresslevel=RUN_COMPRESSION_LEVEL) as f:
+            csv.writer(f).writerows(self._buffer)
+        self.run_paths.append(run_path)
+        self._buffer = []
+
+    @staticmethod
+    def _read_run(run_path):
+        with gzip.open(run_path, 'rt', encoding='utf-8', newline='') as f:
+            for cusip, filing_code, shares, value, name, ticker in csv.reader(f):
+                yield cusip, int(filing_code), float(shares), float(value), name, ticker
+
+    def iter_totals(self, filing_keys=None):
+        """
+        Yields one total per CUSIP in CUSIP order: {'cusip', 'name', 'ticker', 'fund_count',
+        'positions_count', 'shares_held', 'market_value_usd'}. Every row added so far is spilled first.
+        With filing_keys, only the rows of those filings are counted.
+        """
+        self._spill()
+        included_codes = None
+        if filing_keys is not None:
+            included_codes = {self.filing_keys.encode(key) for key in filing_keys}
+        current = None
+        previous_filing_code = None
+        for cusip, filing_code, shares, value, name, ticker in heapq.merge(*(self._read_run(path) for path in self.run_paths)):
+            if included_codes is not None and filing_code not in included_codes:
+                continue
+            if current is None or cusip != current['cusip']:
+                if current is not None:
+                    yield current
+                current = {'cusip': cusip, 'name': name, 'ticker': ticker, 'fund_count': 0, 'positions_count': 0,
+                           'shares_held': 0.0, 'market_value_usd': 0.0}
+                previous_filing_code = None
+            # Rows are sorted by filing within a CUSIP, so each fund starts a new run of rows
+            if filing_code != previous_filing_code:
+                current['fund_count'] += 1
+                previous_filing_code = filing_code
+            current['positions_count'] += 1
+            current['shares_held'] += shares
+            current['market_value_usd'] += value
+            current['ticker'] = current['ticker'] or ticker
+        if current is not None:
+            yield current
+
+    def close(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+def local_filings(form_type="NPORT-P", download_path=None):
+    """(filing_directory_path, accession) for every filing of form_type already stored under sec_filings."""
+    filings_root = os.path.join(download_path or sec_parser.DOWNLOAD_PATH, 'sec-edgar-filings')
+    if not os.path.isdir(filings_root):
+        return
+    for cik in sorted(os.listdir(filings_root)):
+        filing_directory_path = os.path.join(filings_root, cik, form_type)
+        if os.path.isdir(filing_directory_path):
+            for accession in sorted(os.listdir(filing_directory_path)):
+                if os.path.isdir(os.path.join(filing_directory_path, accession)):
+                    yield filing_directory_path, accession
+
+def index_filings(form_type="NPORT-P", start_date=None, end_date=None):
+    """(filing_directory_path, accession) for every filing in the local EDGAR index in the date range, downloading as needed."""
+    for filing in edgar_index.filings(form_type, start_date, end_date):
+        filing_directory_path = sec_parser.download_filing_from_index(filing)
+        if filing_directory_path:
+            yield filing_directory_path, filing['accession']
+
+def report_quarter(report_date):
+    """'2025Q1' for a report date such as '2025-03-31', or None if the date cannot be read."""
+    try:
+        year, month = int(report_date[:4]), int(report_date[5:7])
+    except (TypeError, ValueError):
+        return None
+    return f"{year}Q{(month - 1) // 3 + 1}" if 1 <= month <= 12 else None
+
+class PeriodFilings:
+    """
+    Picks the filings one rollup covers as they arrive, reading only each filing's header: those
+    reporting for period (a quarter such as '2025Q1'; the latest quarter among the filings if not given),
+    and of those only the latest filing of each fund series ('cik|series_id'). Filings without a fund CIK
+    cannot be told apart from other funds' and are skipped.
+    """
+    def __init__(self, period=None):
+        self.requested_period = period
+        self._latest = {} # (quarter, fund_key) -> (report_date, accession order, accession)
+        self._latest_quarter = None
+
+    def consider(self, filing_directory_path, accession):
+        """True if the filing is, so far, the latest of its fund series in the period (read it); False to skip it."""
+        filing_metadata = sec_parser.read_filing_metadata(filing_directory_path, accession)
+        quarter = report_quarter(filing_metadata.get('report_date'))
+        if quarter is None:
+            print(f"Rollup: skipping {accession}, its report period could not be read.")
+            return False
+        if not filing_metadata.get('fund_cik'):
+            print(f"Rollup: skipping {accession}, its fund CIK could not be read.")
+            return False
+        if self.requested_period:
+            if quarter != self.requested_period:
+                return False
+        elif self._latest_quarter and quarter < self._latest_quarter:
+            return False
+        self._latest_quarter = max(quarter, self._latest_quarter or quarter)
+        fund_key = f"{filing_metadata['fund_cik']}|{filing_metadata.get('series_id') or ''}"
+        candidate = (filing_metadata['report_date'], analysis_history.accession_order(accession), accession)
+        if candidate <= self._latest.get((quarter, fund_key), ()):
+            return False
+        self._latest[(quarter, fund_key)] = candidate
+        return True
+
+    @property
+    def period(self):
+        return self.requested_period or self._latest_quarter
+
+    def accessions(self):
+        """The accession numbers of the filings the rollup covers, one per fund series."""
+        period = self.period
+        return {accession for (quarter, _), (_, _, accession) in self._latest.items() if quarter == period}
+
+def run_universe_rollup(filings, output_path=None, top_n=TOP_SECURITIES_IN_REPORT, work_dir=None, run_rows=RUN_ROWS,
+                        resolve_shares_outstanding=True, period=None):
+    """
+    Aggregates ownership per CUSIP across the filings ((filing_directory_path, accession) pairs) of one
+    report quarter, taking the latest filing of each fund series (see PeriodFilings). filings may be a
+    generator that downloads each filing as it is requested; every filing is spilled before the next one
+    is fetched. Per-security totals are written to output_path as CSV (gzip-compressed if it ends in .gz)
+    while they are merged; only the top_n by market value are kept in the returned result. With
+    resolve_shares_outstanding, the percentage owned by all funds together is computed where a free
+    provider (cache, offline SEC XBRL) knows the shares outstanding - paid lookups are never made.
+    """
+    period_filings = PeriodFilings(period)
+    aggregator = ExternalAggregator(work_dir, run_rows)
+    router = fund_analyzer.get_reference_data_router() if resolve_shares_outstanding else None
+    rows_by_accession = {}
+    output_file = None
+    try:
+        for filing_directory_path, accession in filings:
+            if not period_filings.consider(filing_directory_path, accession):
+                continue
+            filing_metadata = {}
+            rows_before = aggregator.rows_added
+            for holding in sec_parser.iter_nport_holdings(filing_directory_path, filing_metadata, accession=accession):
+                aggregator.add(accession, holding)
+            rows_by_accession[accession] = aggregator.rows_added - rows_before
+            print(f"Rollup: {filing_metadata.get('fund_name') or accession}: {rows_by_accession[accession]} holdings "
+                  f"({aggregator.rows_added} total, {len(aggregator.run_paths)} runs spilled)")
+
+        period = period_filings.period
+        covered = period_filings.accessions()
+        filings_count = sum(1 for accession in covered if rows_by_accession.get(accession))
+        holdings_rows = sum(rows_by_accession.get(accession, 0) for accession in covered)
+        print(f"Rollup of {period or 'no report period'}: {len(covered)} fund series")
+
+        if output_path:
+            if output_path.endswith('.gz'):
+                output_file = gzip.open(output_path, 'wt', encoding='utf-8', newline='')
+            else:
+                output_file = open(output_path, 'w', encoding='utf-8', newline='')
+            writer = csv.DictWriter(output_file, fieldnames=OUTPUT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+
+        securities_count = 0
+        top_securities = [] # Min-heap of (market value, sequence, total), bounded to top_n
+        for total in aggregator.iter_totals(covered):
+            securities_count += 1
+            if router and total['shares_held'] > 0:
+                outstanding_shares, source = router.lookup_shares_outstanding(
+                    ticker=total['ticker'] or None, cusip=total['cusip'], max_cost=0)
+                if outstanding_shares and outstanding_shares > 0:
+                    total['total_outstanding_shares'] = outstanding_shares
+                    total['percentage_owned_by_funds'] = total['shares_held'] / outstanding_shares * 100
+                    total['shares_outstanding_source'] = source
+            if output_file:
+                writer.writerow(total)
+            entry = (total['market_value_usd'], securities_count, total)
+            if len(top_securities) < top_n:
+                heapq.heappush(top_securities, entry)
+            elif entry > top_securities[0]:
+                heapq.heapreplace(top_securities, entry)
+        runs_count = len(aggregator.run_paths)
+    finally:
+        if output_file:
+            output_file.close()
+        aggregator.close()
+
+    if output_path:
+        print(f"Wrote {securities_count} security totals to {output_path}")
+    return {
+        "period": period,
+        "filings_count": filings_count,
+        "holdings_rows": holdings_rows,
+        "runs_count": runs_count,
+        "securities_count": securities_count,
+        "output_path": output_path,
+        "top_securities": [total for _, _, total in sorted(top_securities, reverse=True)],
+        "status": "Rollup complete." if securities_count else "No holdings found.",
+    }
+
+def format_rollup_report(rollup_result):
+    report_lines = ["Universe Ownership Rollup", "======================",
+                    f"Period: {rollup_result['period'] or 'N/A'}, Filings: {rollup_result['filings_count']}, Holdings: {rollup_result['holdings_rows']:,}, "
+                    f"Securities: {rollup_result['securities_count']:,} ({rollup_result['runs_count']} sorted runs merged)"]
+    for i, total in enumerate(rollup_result['top_securities']):
+        report_lines.append(f"\n{i+1}. {total['name'] or 'N/A'} (CUSIP: {total['cusip']}, Ticker: {total['ticker'] or 'N/A'})")
+        report_lines.append(f"   Funds Holding: {total['fund_count']}, Shares Held: {total['shares_held']:,.0f}, "
+                            f"Market Value: ${total['market_value_usd']:,.2f}")
+        if total.get('percentage_owned_by_funds') is not None:
+            report_lines.append(f"   Percentage of Company Owned by These Funds: {total['percentage_owned_by_funds']:.4f}%")
+    return "\n".join(report_lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aggregate ownership per security across every N-PORT filing, in fixed memory.")
+    parser.add_argument("--since", default=None, help="First filing date (YYYY-MM-DD) when reading the local EDGAR index.")
+    parser.add_argument("--until", default=None, help="Last filing date (YYYY-MM-DD) when reading the local EDGAR index.")
+    parser.add_argument("--local", action="store_true",
+                        help="Roll up every NPORT-P already stored under sec_filings instead of the filings in the local EDGAR index.")
+    parser.add_argument("--period", default=None,
+                        help="Report quarter to roll up, e.g. 2025Q1 (defaults to the latest quarter among the filings).")
+    parser.add_argument("--output", default=None, help="CSV file for every security's totals (gzip-compressed if it ends in .gz).")
+    parser.add_argument("--top", type=int, default=TOP_SECURITIES_IN_REPORT, help="Securities listed in the printed report.")
+    parser.add_argument("--run-rows", type=int, default=RUN_ROWS, help="Holdings buffered in memory before a sorted run is spilled.")
+    parser.add_argument("--work-dir", default=None, help="Directory for the temporary run files (defaults to the system temp directory).")
+    args = parser.parse_args()
+
+    if args.local or not edgar_index.has_index():
+        filings = local_filings()
+    else:
+        filings = index_filings("NPORT-P", args.since, args.until)
+    print(format_rollup_report(run_universe_rollup(filings, args.output, args.top, args.work_dir, args.run_rows,
+                                                  period=args.period)))
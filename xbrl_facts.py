@@ -0,0 +1,151 @@
+import os
+import csv
+import gzip
+import json
+import bisect
+import zipfile
+import argparse
+
+# Offline shares-outstanding source built from SEC's bulk XBRL company facts archive
+# (https://www.sec.gov/Archives/edgar/daily-index/xbrl/companyfacts.zip, downloaded separately).
+# The archive holds one CIK##########.json per filer; we keep only dei:EntityCommonStockSharesOutstanding.
+DATA_PATH = os.path.join(os.getcwd(), "sec_data")
+COMPANY_FACTS_ARCHIVE = os.path.join(DATA_PATH, "companyfacts.zip")
+# SEC's https://www.sec.gov/files/company_tickers.json, also downloaded separately.
+COMPANY_TICKERS_FILE = os.path.join(DATA_PATH, "company_tickers.json")
+INDEX_PATH = os.path.join(DATA_PATH, "shares_outstanding_index.json.gz")
+
+SHARES_OUTSTANDING_CONCEPT = "EntityCommonStockSharesOutstanding"
+
+def normalize_cik(cik):
+    try:
+        return f"{int(str(cik).strip()):010d}"
+    except (ValueError, TypeError):
+        return None
+
+def extract_shares_outstanding(company_facts):
+    """
+    Returns [[end_date, shares], ...] sorted by date from one company facts JSON document.
+    When a date was reported more than once (amendments), the most recently filed value wins.
+    """
+    try:
+        observations = company_facts['facts']['dei'][SHARES_OUTSTANDING_CONCEPT]['units']['shares']
+    except (KeyError, TypeError):
+        return []
+
+    latest_by_date = {}
+    for observation in observations:
+        end_date, value = observation.get('end'), observation.get('val')
+        if not end_date or not isinstance(value, (int, float)) or value <= 0:
+            continue
+        filed = observation.get('filed', '')
+        if end_date not in latest_by_date or filed >= latest_by_date[end_date][0]:
+            latest_by_date[end_date] = (filed, int(value))
+    return [[end_date, shares] for end_date, (_, shares) in sorted(latest_by_date.items())]
+
+def load_ticker_map(tickers_path):
+    """Reads SEC company_tickers.json into {TICKER: CIK}."""
+    with open(tickers_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    entries = data.values() if isinstance(data, dict) else data
+    return {entry['ticker'].upper(): normalize_cik(entry['cik_str']) for entry in entries if entry.get('ticker')}
+
+def load_cusip_map(cusip_map_path):
+    """
+    Reads a local CSV with 'cusip' and 'cik' columns (and optionally 'ticker') into {CUSIP: CIK}.
+    SEC publishes no CUSIP mapping, so this file has to come from the user's own reference data.
+    """
+    cusip_to_cik = {}
+    with open(cusip_map_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            cusip, cik = (row.get('cusip') or '').strip().upper(), normalize_cik(row.get('cik'))
+            if cusip and cik:
+                cusip_to_cik[cusip] = cik
+    return cusip_to_cik
+
+def build_index(archive_path=COMPANY_FACTS_ARCHIVE, tickers_path=None, cusip_map_path=None, output_path=INDEX_PATH):
+    """
+    Scans the company facts archive once and writes a compact gzip JSON index of shares outstanding
+    keyed by CIK, with ticker and CUSIP lookups into it. Returns the number of companies indexed.
+    """
+    by_cik = {}
+    with zipfile.ZipFile(archive_path) as archive:
+        for member in archive.namelist():
+            if not member.endswith('.json'):
+                continue
+            with archive.open(member) as f:
+                try:
+                    company_facts = json.load(f)
+                except ValueError:
+                    print(f"Warning: Skipping unreadable company facts file {member}")
+                    continue
+            cik = normalize_cik(company_facts.get('cik') or member[3:-5])
+            observations = extract_shares_outstanding(company_facts)
+            if cik and observations:
+                by_cik[cik] = observations
+
+    index = {
+        'by_cik': by_cik,
+        'ticker_to_cik': load_ticker_map(tickers_path) if tickers_path else {},
+        'cusip_to_cik': load_cusip_map(cusip_map_path) if cusip_map_path else {},
+    }
+    directory = os.path.dirname(output_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with gzip.open(output_path, 'wt', encoding='utf-8') as f:
+        json.dump(index, f, separators=(',', ':'))
+    print(f"Indexed shares outstanding for {len(by_cik)} companies into {output_path}")
+    return len(by_cik)
+
+class SharesOutstandingIndex:
+    """
+    In-memory view of the compact index. Lookups are dictionary hits plus a bisect on dates.
+    """
+
+    def __init__(self, by_cik, ticker_to_cik=None, cusip_to_cik=None):
+        self.by_cik = by_cik
+        self.ticker_to_cik = ticker_to_cik or {}
+        self.cusip_to_cik = cusip_to_cik or {}
+        # Dates are kept in a parallel list per CIK so as-of lookups can bisect
+        self._dates = {cik: [end_date for end_date, _ in observations] for cik, observations in by_cik.items()}
+
+    @classmethod
+    def load(cls, index_path=INDEX_PATH):
+        with gzip.open(index_path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('by_cik', {}), data.get('ticker_to_cik'), data.get('cusip_to_cik'))
+
+    def resolve_cik(self, cik=None, ticker=None, cusip=None):
+        if cik:
+            return normalize_cik(cik)
+        if cusip:
+            resolved = self.cusip_to_cik.get(str(cusip).strip().upper())
+            if resolved:
+                return resolved
+        if ticker:
+            return self.ticker_to_cik.get(str(ticker).strip().upper())
+        return None
+
+    def get_shares_outstanding(self, cik=None, ticker=None, cusip=None, as_of=None):
+        """
+        Shares outstanding reported on or before as_of (ISO date string), or the latest value if as_of is None.
+        Returns None if the company is not in the index.
+        """
+        resolved_cik = self.resolve_cik(cik, ticker, cusip)
+        observations = self.by_cik.get(resolved_cik) if resolved_cik else None
+        if not observations:
+            return None
+        if as_of is None:
+            return observations[-1][1]
+        position = bisect.bisect_right(self._dates[resolved_cik], as_of)
+        return observations[position - 1][1] if position > 0 else None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the offline shares-outstanding index from SEC company facts.")
+    parser.add_argument("--archive", default=COMPANY_FACTS_ARCHIVE, help="Path to companyfacts.zip.")
+    parser.add_argument("--tickers", default=COMPANY_TICKERS_FILE if os.path.exists(COMPANY_TICKERS_FILE) else None,
+                        help="Path to SEC company_tickers.json for ticker lookups.")
+    parser.add_argument("--cusips", default=None, help="Optional CSV with 'cusip' and 'cik' columns for CUSIP lookups.")
+    parser.add_argument("--output", default=INDEX_PATH, help="Where to write the compact index.")
+    args = parser.parse_args()
+    build_index(args.archive, args.tickers, args.cusips, args.output)